@@ -48,6 +48,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'Palabras.middleware.MetricasMiddleware',
+    'Palabras.middleware.ConsultasLentasMiddleware',
+    'Palabras.middleware.PerfiladorMiddleware',
 ]
 
 ROOT_URLCONF = 'Contpal.urls'
@@ -77,11 +80,31 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Varios procesos de ingesta escriben a la vez: las transacciones toman el bloqueo de
+        # escritura al empezar y esperan hasta 20 s por él (en vez de fallar con "database is locked")
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Caché local por proceso. Con varios workers, un backend compartido (archivos, Redis)
+# hace que las invalidaciones de una ingesta lleguen a todos.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'contpal',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -126,3 +149,81 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Media files (uploads)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Contpal
+# Páginas que se leen para detectar año y empresa antes de la extracción completa
+CONTPAL_PAGINAS_METADATOS = 3
+
+# Comprimir con gzip los .txt y .docx guardados en media/reportes
+CONTPAL_COMPRIMIR_MEDIA = False
+
+# Segundos que los clientes pueden reutilizar una respuesta de la API sin revalidar
+CONTPAL_API_MAX_AGE = 60
+
+# La API de rankings y /metrics requieren personal del admin o uno de estos tokens
+# (Authorization: Bearer <token>). Con CONTPAL_API_PUBLICA la API queda abierta y sus
+# respuestas se pueden guardar en cachés compartidas (Cache-Control: public)
+CONTPAL_API_TOKENS = []
+CONTPAL_API_PUBLICA = False
+
+# Snapshot de la matriz documento-término (manage.py snapshot_matriz; con --cada N lo
+# mantiene al día un solo proceso en segundo plano). Si existe y está al día con la última
+# ingesta, la analítica lo lee en vez de consultar ConteoTotal
+CONTPAL_MATRIZ_DIR = BASE_DIR / 'matriz'
+
+# Segundos que vive una entrada de la caché del admin (se invalida antes si cambian los datos)
+CONTPAL_CACHE_TIMEOUT = 300
+
+# Precargar la caché con los reportes creados en una carga masiva
+CONTPAL_CACHE_CALENTAR = False
+
+# Palabras guardadas en el resumen de cada reporte (Reporte.resumen_top)
+CONTPAL_RESUMEN_TOP = 10
+
+# Caracteres por bloque al leer y tokenizar archivos de texto grandes
+CONTPAL_TAMANO_BLOQUE_TEXTO = 1024 * 1024
+
+# Presupuesto por documento al procesarlo: segundos de reloj y memoria (MB que puede
+# crecer la memoria residente del proceso hijo, ver Palabras/presupuesto.py).
+# Los que lo exceden o fallan pasan a Cuarentena. None desactiva el límite.
+CONTPAL_PRESUPUESTO_SEGUNDOS = 600
+CONTPAL_PRESUPUESTO_MEMORIA_MB = 2048
+
+# Directorio para los .docx generados a partir de los PDF
+CONTPAL_DOCX_DIR = MEDIA_ROOT / 'Docxs'
+
+# OCR de páginas escaneadas (ver Palabras/ocr.py): número de trabajadores (None = hasta 4,
+# según los núcleos) y páginas que cada trabajador reconoce por lote
+CONTPAL_OCR_TRABAJADORES = None
+CONTPAL_OCR_PAGINAS_POR_LOTE = 8
+
+# Carga de ZIP por partes: directorio de trabajo, tamaño máximo de la carga y de cada parte,
+# y si se procesa el ZIP dentro de la petición que la completa. Por defecto no: un ZIP grande
+# ocuparía el worker web por horas; las cargas completas las procesa manage.py procesar_cargas
+CONTPAL_CARGAS_DIR = BASE_DIR / 'cargas'
+CONTPAL_CARGAS_MAX_BYTES = 16 * 1024 ** 3
+CONTPAL_CARGA_TAMANO_PARTE = 8 * 1024 * 1024
+CONTPAL_CARGAS_PROCESAR_AL_COMPLETAR = False
+
+# Vista previa de un ZIP (Palabras/vista_previa.py): páginas leídas por documento,
+# incluidas las primeras, y presupuesto de segundos por documento
+CONTPAL_VISTA_PREVIA_PAGINAS = 12
+CONTPAL_VISTA_PREVIA_SEGUNDOS = 30
+
+# Similitud (Jaccard estimada con MinHash) a partir de la cual un reporte del mismo año
+# se marca como casi duplicado de otro ya contado y no se vuelve a contar; None lo desactiva
+CONTPAL_UMBRAL_CASI_DUPLICADO = 0.9
+
+# Direcciones que pueden leer /metrics sin token (el personal del admin siempre puede).
+# Detrás de un proxy inverso todas las peticiones llegan desde el proxy: usar un token
+CONTPAL_METRICAS_IPS = []
+
+# Consultas más lentas que este umbral (ms) se registran con el código que las originó
+# (logger Palabras.consultas); None lo desactiva. Los perfiles de ?_perfil=1 se guardan
+# en CONTPAL_PERFILES_DIR
+CONTPAL_CONSULTA_LENTA_MS = 200
+CONTPAL_PERFILES_DIR = BASE_DIR / 'perfiles'
+
+# Listas grandes del admin (conteos, reportes) con paginación por clave: filas que se cuentan
+# exactamente; por encima el total se estima (ver Palabras/paginacion.py)
+CONTPAL_ADMIN_TOTAL_EXACTO = 10000
@@ -15,13 +15,16 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
 from django.conf import settings
 from django.shortcuts import redirect
 from django.conf.urls.static import static
+from Palabras import views as palabras_views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/', include('Palabras.urls')),
+    path('metrics', palabras_views.metricas, name='metricas'),
     path('', lambda request: redirect('admin/', permanent=False)),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
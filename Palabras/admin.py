@@ -1,11 +1,48 @@
 from django.contrib import admin
 from django.conf import settings
-from django.urls import path
-from django.http import JsonResponse
-from django.utils.html import format_html
-from .models import Empresa, Reporte, Palabras, ConteoTotal, Provincia
-from .utils import procesar_zip_reportes
+from django.urls import path, reverse
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.core.exceptions import PermissionDenied
+from django.db.models import Max, Min
+from django.utils.html import escape, format_html
+from django.utils.safestring import mark_safe
+from .models import Empresa, Reporte, Palabras, ConteoTotal, ConteoAnual, Provincia, Cuarentena, CargaZip, Termino, ConteoTermino
+from .utils import procesar_zip_reportes, reintentar_cuarentena
 from .forms import ReporteAdminForm
+from .exportar import bloques_parquet, consulta_exportacion, filas_csv
+from .cache import anios_reportes
+from . import cargas
+from .busqueda import BusquedaIndexadaMixin
+from .paginacion import PaginacionKeysetMixin
+
+
+def documentos_json(documentos):
+    """Resultado de previsualizar_zip con la empresa como {'id', 'nombre'}."""
+    return [
+        dict(documento, empresa={'id': documento['empresa'].pk, 'nombre': documento['empresa'].nombre}
+             if documento['empresa'] else None)
+        for documento in documentos
+    ]
+
+
+def tabla_analitica(resultado, columnas):
+    """Tabla HTML (mismo estilo que top_palabras) para un DataFrame de analitica."""
+    if resultado.empty:
+        return "Sin datos"
+    estilo_th = 'padding: 8px; background-color: #f2f2f2;'
+    tabla = '<table style="width: 100%; border: 1px solid #ddd; border-collapse: collapse;">'
+    tabla += f'<thead><tr><th style="{estilo_th}">Palabra</th>'
+    tabla += ''.join(f'<th style="{estilo_th}">{escape(titulo)}</th>' for titulo, _, _ in columnas)
+    tabla += '</tr></thead><tbody>'
+    for palabra, fila in resultado.iterrows():
+        tabla += f'<tr><td style="padding: 8px; text-align: left;"><strong>{escape(palabra)}</strong></td>'
+        tabla += ''.join(
+            f'<td style="padding: 8px; text-align: right;">{escape(formato.format(fila[columna]))}</td>'
+            for _, columna, formato in columnas
+        )
+        tabla += '</tr>'
+    tabla += '</tbody></table>'
+    return mark_safe(tabla)
 
 
 class AnioListFilter(admin.SimpleListFilter):
@@ -13,7 +50,7 @@ class AnioListFilter(admin.SimpleListFilter):
     parameter_name = 'anio'
 
     def lookups(self, request, model_admin):
-        anios = Reporte.objects.order_by().values_list('anio', flat=True).distinct()
+        anios = anios_reportes()
         return [(str(anio), str(anio)) for anio in anios]
 
     def queryset(self, request, queryset):
@@ -24,9 +61,10 @@ class AnioListFilter(admin.SimpleListFilter):
 
 
 @admin.register(ConteoTotal)
-class ConteoAdmin(admin.ModelAdmin):
+class ConteoAdmin(PaginacionKeysetMixin, admin.ModelAdmin):
     list_display = ('palabra', 'cantidad')
     list_filter = (AnioListFilter,)
+    change_list_template = 'admin/conteo_change_list.html'  # Enlaces de exportación y paginación por clave
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
@@ -35,20 +73,101 @@ class ConteoAdmin(admin.ModelAdmin):
             qs = qs.filter(reporte__anio=anio)
         return qs.order_by('-cantidad')
 
+    def get_urls(self):
+        urls = super().get_urls()
+        extra_urls = [
+            path('exportar/csv/', self.admin_site.admin_view(self.exportar_csv), name='conteo_exportar_csv'),
+            path('exportar/parquet/', self.admin_site.admin_view(self.exportar_parquet), name='conteo_exportar_parquet'),
+        ]
+        return extra_urls + urls
+
+    def consulta_exportacion(self, request):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        return consulta_exportacion(
+            anio=request.GET.get('anio'),
+            provincia=request.GET.get('provincia'),
+            empresa=request.GET.get('empresa'),
+        )
+
+    def exportar_csv(self, request):
+        try:
+            qs = self.consulta_exportacion(request)
+        except ValueError:
+            return HttpResponseBadRequest("Parámetros inválidos")
+        # Respuesta en streaming: las filas se leen y envían por bloques
+        response = StreamingHttpResponse(filas_csv(qs), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="conteos.csv"'
+        return response
+
+    def exportar_parquet(self, request):
+        try:
+            qs = self.consulta_exportacion(request)
+        except ValueError:
+            return HttpResponseBadRequest("Parámetros inválidos")
+        # También en streaming: cada grupo de filas se envía apenas se escribe
+        response = StreamingHttpResponse(bloques_parquet(qs), content_type='application/vnd.apache.parquet')
+        response['Content-Disposition'] = 'attachment; filename="conteos.parquet"'
+        return response
+
+
+@admin.register(ConteoAnual)
+class ConteoAnualAdmin(BusquedaIndexadaMixin, admin.ModelAdmin):
+    # Totales mantenidos por guardar_conteo_en_bd: solo lectura
+    busqueda_tabla = 'palabras_busqueda'
+    busqueda_id = 'palabra_id'
+    busqueda_prefijo = ('palabra__descripcion',)
+    list_display = ('palabra', 'anio', 'cantidad')
+    list_filter = ('anio',)
+    list_select_related = ('palabra',)
+    search_fields = ('palabra__descripcion',)
+    ordering = ('-cantidad',)
+
+    def get_queryset(self, request):
+        # Las filas en 0 quedan de palabras que ya no aparecen en el año
+        return super().get_queryset(request).filter(cantidad__gt=0)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(Palabras)
-class PalabrasAdmin(admin.ModelAdmin):
+class PalabrasAdmin(BusquedaIndexadaMixin, admin.ModelAdmin):
     list_display = ('descripcion',)
     search_fields = ('descripcion',)
+    busqueda_tabla = 'palabras_busqueda'
+    busqueda_prefijo = ('descripcion',)
+
+
+@admin.register(Termino)
+class TerminoAdmin(admin.ModelAdmin):
+    list_display = ('descripcion', 'activo', 'actualizado')
+    list_filter = ('activo',)
+    list_editable = ('activo',)
+    search_fields = ('descripcion',)
+
+
+@admin.register(ConteoTermino)
+class ConteoTerminoAdmin(admin.ModelAdmin):
+    list_display = ('termino', 'reporte', 'cantidad')
+    list_select_related = ('termino', 'reporte')
+    list_filter = ('termino',)
+    search_fields = ('termino__descripcion', 'reporte__nombre')
+    ordering = ('-cantidad',)
 
 
 @admin.register(Reporte)
-class ReporteAdmin(admin.ModelAdmin):
+class ReporteAdmin(PaginacionKeysetMixin, admin.ModelAdmin):
     form = ReporteAdminForm
-    list_display = ('nombre', 'anio','empresa')  # Se elimina 'top_palabras' de la lista
-    readonly_fields = ('top_palabras', 'nombre', 'anio')
+    list_display = ('nombre', 'anio','empresa', 'resumen_palabras')  # El resumen se lee del propio reporte
+    list_select_related = ('empresa',)
+    readonly_fields = ('top_palabras', 'nombre', 'anio', 'duplicado_de', 'similitud_duplicado', 'reportes_similares', 'terminos_contables')
     autocomplete_fields = ['empresa']
     change_form_template = 'admin/reporte_change_form.html'  # Plantilla personalizada
+    change_list_template = 'admin/keyset_change_list.html'
 
     def save_model(self, request, obj, form, change):
         # Guardar el reporte normal
@@ -60,23 +179,23 @@ class ReporteAdmin(admin.ModelAdmin):
             procesar_zip_reportes(zip_file)
 
     def top_palabras(self, obj):
-        conteos = obj.conteototal_set.all()
-        total = sum(c.cantidad for c in conteos)
+        # Resumen precalculado en el reporte: no hace falta consultar los conteos
+        total = obj.total_palabras
         if not total:
             return "Sin datos"
         
-        # Limitar a las 10 palabras más frecuentes
-        conteos_top_10 = sorted(conteos, key=lambda x: -x.cantidad)[:10]
+        # Limitar a las 10 palabras más frecuentes (ya vienen ordenadas)
+        conteos_top_10 = obj.resumen_top[:10]
 
         # Crear la tabla HTML para las palabras, cantidades y frecuencias
         tabla = '<table style="width: 100%; border: 1px solid #ddd; border-collapse: collapse;">'
         tabla += '<thead><tr><th style="padding: 8px; background-color: #f2f2f2;">Palabra</th><th style="padding: 8px; background-color: #f2f2f2;">Cantidad</th><th style="padding: 8px; background-color: #f2f2f2;">Frecuencia (%)</th></tr></thead>'
         tabla += '<tbody>'
         
-        for c in conteos_top_10:
-            frecuencia_porcentaje = (c.cantidad / total) * 100
-            tabla += f'<tr><td style="padding: 8px; text-align: left;"><strong>{c.palabra.descripcion}</strong></td>'
-            tabla += f'<td style="padding: 8px; text-align: right;">{c.cantidad}</td>'
+        for palabra, cantidad in conteos_top_10:
+            frecuencia_porcentaje = (cantidad / total) * 100
+            tabla += f'<tr><td style="padding: 8px; text-align: left;"><strong>{palabra}</strong></td>'
+            tabla += f'<td style="padding: 8px; text-align: right;">{cantidad}</td>'
             tabla += f'<td style="padding: 8px; text-align: right;">{frecuencia_porcentaje:.2f}%</td></tr>'
         
         tabla += '</tbody></table>'
@@ -84,20 +203,165 @@ class ReporteAdmin(admin.ModelAdmin):
 
     top_palabras.short_description = "Palabras y peso relativo"
 
+    def reportes_similares(self, obj):
+        # Candidatos del índice LSH (una consulta), no una comparación con todo el archivo
+        firma = obj.firma_minhash or (obj.duplicado_de.firma_minhash if obj.duplicado_de_id else None)
+        if not firma:
+            return "Sin firma"
+        from .similitud import buscar_similares
+        similares = buscar_similares(firma, excluir=obj.pk, umbral=0.3)
+        if not similares:
+            return "Ninguno"
+
+        tabla = '<table style="width: 100%; border: 1px solid #ddd; border-collapse: collapse;">'
+        tabla += '<thead><tr><th style="padding: 8px; background-color: #f2f2f2;">Reporte</th><th style="padding: 8px; background-color: #f2f2f2;">Año</th><th style="padding: 8px; background-color: #f2f2f2;">Empresa</th><th style="padding: 8px; background-color: #f2f2f2;">Similitud (%)</th></tr></thead>'
+        tabla += '<tbody>'
+        for reporte, similitud in similares:
+            url = reverse('admin:Palabras_reporte_change', args=[reporte.pk])
+            tabla += f'<tr><td style="padding: 8px; text-align: left;"><a href="{url}">{escape(reporte.nombre)}</a></td>'
+            tabla += f'<td style="padding: 8px; text-align: right;">{reporte.anio}</td>'
+            tabla += f'<td style="padding: 8px; text-align: left;">{escape(reporte.empresa or "")}</td>'
+            tabla += f'<td style="padding: 8px; text-align: right;">{similitud * 100:.1f}%</td></tr>'
+        tabla += '</tbody></table>'
+        return mark_safe(tabla)
+
+    reportes_similares.short_description = "Reportes similares"
+
+    def terminos_contables(self, obj):
+        # Los conteos de un duplicado son los de su original
+        conteos = (
+            ConteoTermino.objects.filter(reporte_id=obj.reporte_conteos.pk)
+            .select_related('termino').order_by('-cantidad', 'termino__descripcion')
+        )
+        if not conteos:
+            return "Sin datos"
+
+        tabla = '<table style="width: 100%; border: 1px solid #ddd; border-collapse: collapse;">'
+        tabla += '<thead><tr><th style="padding: 8px; background-color: #f2f2f2;">Término</th><th style="padding: 8px; background-color: #f2f2f2;">Cantidad</th></tr></thead>'
+        tabla += '<tbody>'
+        for conteo in conteos:
+            tabla += f'<tr><td style="padding: 8px; text-align: left;"><strong>{escape(conteo.termino.descripcion)}</strong></td>'
+            tabla += f'<td style="padding: 8px; text-align: right;">{conteo.cantidad}</td></tr>'
+        tabla += '</tbody></table>'
+        return mark_safe(tabla)
+
+    terminos_contables.short_description = "Términos contables"
+
+    def resumen_palabras(self, obj):
+        return obj.top_palabras() or "Sin datos"
+
+    resumen_palabras.short_description = "Top palabras"
+
     def get_urls(self):
         urls = super().get_urls()
         extra_urls = [
             path('<int:pk>/chart-data/', self.admin_site.admin_view(self.chart_data), name='reporte_chart_data'),
+            path('carga/', self.admin_site.admin_view(self.carga_crear), name='reporte_carga_crear'),
+            path('carga/<uuid:carga_id>/', self.admin_site.admin_view(self.carga_estado), name='reporte_carga_estado'),
+            path('carga/<uuid:carga_id>/parte/', self.admin_site.admin_view(self.carga_parte), name='reporte_carga_parte'),
+            path('carga/<uuid:carga_id>/completar/', self.admin_site.admin_view(self.carga_completar),
+                 name='reporte_carga_completar'),
+            path('carga/<uuid:carga_id>/vista-previa/', self.admin_site.admin_view(self.carga_vista_previa),
+                 name='reporte_carga_vista_previa'),
+            path('vista-previa/', self.admin_site.admin_view(self.vista_previa), name='reporte_vista_previa'),
         ]
         return extra_urls + urls
 
+    # Carga de ZIP por partes (reanudable); ver Palabras/cargas.py
+    def carga_json(self, carga, status=200):
+        return JsonResponse({
+            'id': str(carga.pk),
+            'nombre': carga.nombre,
+            'tamano': carga.tamano,
+            'recibido': carga.recibido,
+            'estado': carga.estado,
+            'error': carga.error,
+            'tamano_parte': cargas.tamano_parte(),
+        }, status=status)
+
+    def obtener_carga(self, request, carga_id, metodo):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        if request.method != metodo:
+            return None, JsonResponse({'error': f"Use {metodo}"}, status=405)
+        carga = CargaZip.objects.filter(pk=carga_id).first() if carga_id else None
+        if carga_id and carga is None:
+            return None, JsonResponse({'error': "Carga no encontrada"}, status=404)
+        return carga, None
+
+    def carga_crear(self, request):
+        _, error = self.obtener_carga(request, None, 'POST')
+        if error:
+            return error
+        try:
+            carga = cargas.crear_carga(
+                request.POST.get('nombre', 'carga.zip'),
+                int(request.POST.get('tamano', 0)),
+                request.POST.get('sha256', ''),
+            )
+        except (ValueError, cargas.CargaInvalida) as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return self.carga_json(carga, status=201)
+
+    def carga_estado(self, request, carga_id):
+        carga, error = self.obtener_carga(request, carga_id, 'GET')
+        return error or self.carga_json(carga)
+
+    def carga_parte(self, request, carga_id):
+        carga, error = self.obtener_carga(request, carga_id, 'POST')
+        if error:
+            return error
+        try:
+            # El cuerpo se lee por bloques y se escribe directo en disco
+            carga = cargas.escribir_parte(
+                carga,
+                int(request.headers.get('X-Posicion', -1)),
+                request,
+                int(request.headers.get('Content-Length') or 0),
+                request.headers.get('X-Checksum-Sha256', ''),
+            )
+        except (ValueError, cargas.CargaInvalida) as e:
+            return JsonResponse({'error': str(e), 'recibido': carga.recibido}, status=409)
+        return self.carga_json(carga)
+
+    def carga_completar(self, request, carga_id):
+        carga, error = self.obtener_carga(request, carga_id, 'POST')
+        if error:
+            return error
+        try:
+            cargas.completar_carga(carga)
+        except cargas.CargaInvalida as e:
+            return JsonResponse({'error': str(e)}, status=409)
+        # Por defecto solo queda completa: la procesa manage.py procesar_cargas, fuera de la petición
+        if getattr(settings, 'CONTPAL_CARGAS_PROCESAR_AL_COMPLETAR', False):
+            cargas.procesar_carga(carga)
+        return self.carga_json(carga)
+
+    # Vista previa por muestreo, antes de ingerir el ZIP; ver Palabras/vista_previa.py
+    def vista_previa(self, request):
+        _, error = self.obtener_carga(request, None, 'POST')
+        if error:
+            return error
+        if 'zip' not in request.FILES:
+            return JsonResponse({'error': "Envíe el ZIP en el campo 'zip'"}, status=400)
+        from .vista_previa import previsualizar_zip
+        return JsonResponse({'documentos': documentos_json(previsualizar_zip(request.FILES['zip']))})
+
+    def carga_vista_previa(self, request, carga_id):
+        carga, error = self.obtener_carga(request, carga_id, 'GET')
+        if error:
+            return error
+        if carga.estado != CargaZip.ESTADO_COMPLETA:
+            return JsonResponse({'error': f"La carga está en estado '{carga.estado}'"}, status=409)
+        from .vista_previa import previsualizar_zip
+        return JsonResponse({'documentos': documentos_json(previsualizar_zip(cargas.ruta_carga(carga)))})
+
     def chart_data(self, request, pk):
-        reporte = Reporte.objects.get(pk=pk)
-        conteos = reporte.conteototal_set.all()
-        total = sum(c.cantidad for c in conteos)
+        # Top palabras del resumen guardado en el reporte (una sola fila)
+        conteos, total = Reporte.objects.values_list('resumen_top', 'total_palabras').get(pk=pk)
         data = {
-            "labels": [c.palabra.descripcion for c in conteos],
-            "weights": [round((c.cantidad / total) * 100, 2) for c in conteos]
+            "labels": [palabra for palabra, _ in conteos],
+            "weights": [round((cantidad / total) * 100, 2) for _, cantidad in conteos]
         }
         return JsonResponse(data)
 
@@ -112,18 +376,94 @@ class ReporteAdmin(admin.ModelAdmin):
 
 
 @admin.register(Empresa)
-class EmpresaAdmin(admin.ModelAdmin):
+class EmpresaAdmin(BusquedaIndexadaMixin, admin.ModelAdmin):
     list_display = ('nombre', 'provincia', 'ruc')
     list_filter = ('provincia',)
-    search_fields = ('nombre',)
+    search_fields = ('nombre', 'ruc')
+    # Búsqueda y autocompletado de ReporteAdmin.empresa por índice (ver Palabras/busqueda.py)
+    busqueda_tabla = 'empresa_busqueda'
+    busqueda_prefijo = ('nombre', 'ruc')
+    readonly_fields = ('crecimiento_palabras',)
     fieldsets = (
         (None, {
             'fields': ('nombre', 'ruc', 'provincia'),
         }),
+        ('Analítica', {
+            'fields': ('crecimiento_palabras',),
+        }),
     )
 
+    def crecimiento_palabras(self, obj):
+        if not obj.pk:
+            return "Sin datos"
+        # Años y conteos de esta empresa solamente, no del corpus completo
+        anios = Reporte.objects.filter(empresa=obj, duplicado_de__isnull=True).aggregate(
+            desde=Min('anio'), hasta=Max('anio'))
+        desde, hasta = anios['desde'], anios['hasta']
+        if desde is None or desde == hasta:
+            return "Se necesitan reportes de al menos dos años"
+        from . import analitica  # pandas/NumPy solo al mostrar la analítica
+        df = analitica.conteos_bd(reporte__empresa_id=obj.pk)
+        resultado = analitica.tendencia(desde, hasta, empresa=obj.pk, top=10, df=df)
+        return tabla_analitica(resultado, [
+            (str(desde), desde, '{}'), (str(hasta), hasta, '{}'), ('Variación', 'variacion', '{:+}'),
+        ])
+
+    crecimiento_palabras.short_description = "Palabras con mayor crecimiento"
+
 
 @admin.register(Provincia)
 class ProvinciaAdmin(admin.ModelAdmin):
     list_display = ('nombre',)
     search_fields = ('nombre',)
+    readonly_fields = ('terminos_distintivos',)
+
+    def terminos_distintivos(self, obj):
+        if not obj.pk:
+            return "Sin datos"
+        from . import analitica
+        resultado = analitica.distintivas(obj.pk, por='provincia', top=10)
+        return tabla_analitica(resultado, [
+            ('Cantidad', 'cantidad', '{:.0f}'), ('TF-IDF', 'tfidf', '{:.5f}'),
+        ])
+
+    terminos_distintivos.short_description = "Términos distintivos (TF-IDF)"
+
+
+@admin.register(Cuarentena)
+class CuarentenaAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'etapa', 'motivo', 'intentos', 'actualizado')
+    list_filter = ('etapa',)
+    search_fields = ('nombre', 'motivo')
+    readonly_fields = ('nombre', 'archivo', 'reporte', 'etapa', 'motivo', 'intentos', 'creado', 'actualizado')
+    actions = ['reintentar']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Reintentar los documentos seleccionados")
+    def reintentar(self, request, queryset):
+        procesados = sum(reintentar_cuarentena(cuarentena) for cuarentena in queryset)
+        fallidos = len(queryset) - procesados
+        self.message_user(request, f"{procesados} documento(s) procesados, {fallidos} siguen en cuarentena.")
+
+
+@admin.register(CargaZip)
+class CargaZipAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'estado', 'recibido', 'tamano', 'actualizado')
+    list_filter = ('estado',)
+    readonly_fields = ('nombre', 'tamano', 'sha256', 'recibido', 'estado', 'error', 'creado', 'actualizado',
+                       'vista_previa')
+
+    def vista_previa(self, obj):
+        # Solo el enlace: la vista previa lee una muestra de cada documento y se pide aparte,
+        # no cada vez que se abre esta página
+        if obj.estado != CargaZip.ESTADO_COMPLETA:
+            return "Disponible cuando la carga está completa y sin procesar"
+        return format_html('<a href="{}">Ver vista previa (JSON)</a>',
+                           reverse('admin:reporte_carga_vista_previa', args=[obj.pk]))
+
+    vista_previa.short_description = "Vista previa (muestra de páginas)"
+
+    def has_add_permission(self, request):
+        return False
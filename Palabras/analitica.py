@@ -0,0 +1,136 @@
+# Palabras/analitica.py
+import numpy as np
+import pandas as pd
+
+from .models import ConteoTotal, Ingesta, Palabras, Reporte
+
+COLUMNAS = ['reporte', 'palabra', 'cantidad', 'anio', 'empresa', 'provincia']
+
+# Conteos cargados en memoria, la marca de ingesta con la que se leyeron
+# y las tablas TF-IDF ya calculadas sobre ellos
+_cache = {'marca': None, 'datos': None, 'tfidf': {}}
+
+
+def cargar_conteos(forzar=False):
+    """
+    Carga todos los conteos en un DataFrame largo (una fila por reporte y palabra).
+    Si hay un snapshot de la matriz documento-término al día (Palabras/matriz.py) se lee
+    de sus arrays con mmap; si no, o si quedó atrás, con una sola consulta.
+    Se reutiliza mientras no haya una ingesta nueva.
+    """
+    from .matriz import snapshot_vigente
+
+    marca = Ingesta.ultima()
+    if not forzar and _cache['datos'] is not None and _cache['marca'] == marca:
+        return _cache['datos']
+
+    matriz = snapshot_vigente()
+    df = conteos_bd() if matriz is None else conteos_matriz(matriz)
+    _cache['marca'], _cache['datos'], _cache['tfidf'] = marca, df, {}
+    return df
+
+
+def conteos_bd(**filtros):
+    """Conteos de la base de datos (los filtros se aplican a ConteoTotal, p. ej. reporte__empresa_id)."""
+    filas = ConteoTotal.objects.filter(**filtros).order_by().values_list(
+        'reporte_id', 'palabra_id', 'cantidad',
+        'reporte__anio', 'reporte__empresa_id', 'reporte__empresa__provincia_id',
+    )
+    df = pd.DataFrame.from_records(filas.iterator(chunk_size=10000), columns=COLUMNAS)
+    return df.astype({'reporte': 'int64', 'palabra': 'int64', 'cantidad': 'int64', 'anio': 'int32'})
+
+
+def conteos_matriz(matriz):
+    """Conteos desde el snapshot; de la base de datos solo se leen año, empresa y provincia de cada reporte."""
+    reportes = pd.DataFrame.from_records(
+        Reporte.objects.order_by().values_list('pk', 'anio', 'empresa_id', 'empresa__provincia_id'),
+        columns=['reporte', 'anio', 'empresa', 'provincia'], index='reporte',
+    )
+    df = pd.DataFrame({
+        'reporte': np.repeat(np.asarray(matriz.reportes), np.diff(matriz.indptr)),
+        'palabra': np.asarray(matriz.vocabulario)[matriz.indices],
+        'cantidad': np.asarray(matriz.data, dtype=np.int64),
+    }).join(reportes, on='reporte')
+    return df[COLUMNAS].astype({'reporte': 'int64', 'palabra': 'int64', 'cantidad': 'int64', 'anio': 'int32'})
+
+
+def filtrar(df, anio=None, empresa=None, provincia=None):
+    mascara = np.ones(len(df), dtype=bool)
+    if anio is not None:
+        mascara &= (df['anio'] == int(anio)).to_numpy()
+    if empresa is not None:
+        mascara &= (df['empresa'] == int(empresa)).to_numpy()
+    if provincia is not None:
+        mascara &= (df['provincia'] == int(provincia)).to_numpy()
+    return df[mascara]
+
+
+def con_descripciones(resultado):
+    """Reemplaza los ids de palabra del índice por su descripción (una consulta)."""
+    nombres = dict(Palabras.objects.filter(pk__in=resultado.index.tolist()).values_list('pk', 'descripcion'))
+    resultado.index = resultado.index.map(nombres)
+    resultado.index.name = 'palabra'
+    return resultado
+
+
+def tendencia(desde, hasta, empresa=None, provincia=None, top=20, df=None):
+    """
+    Palabras que más crecieron entre dos años (para una empresa o provincia si se indica).
+    Devuelve un DataFrame indexado por palabra con la cantidad de cada año del rango,
+    la variación interanual máxima y la variación total (hasta - desde).
+    """
+    df = cargar_conteos() if df is None else df
+    df = filtrar(df, empresa=empresa, provincia=provincia)
+    df = df[(df['anio'] >= desde) & (df['anio'] <= hasta)]
+
+    anios = list(range(desde, hasta + 1))
+    tabla = (
+        df.groupby(['palabra', 'anio'])['cantidad'].sum()
+        .unstack('anio', fill_value=0)
+        .reindex(columns=anios, fill_value=0)
+    )
+    matriz = tabla.to_numpy()
+    if not len(tabla):
+        return pd.DataFrame(columns=anios + ['interanual', 'variacion'])
+
+    resultado = pd.DataFrame(matriz, index=tabla.index, columns=anios)
+    resultado['interanual'] = np.diff(matriz, axis=1).max(axis=1) if len(anios) > 1 else 0
+    resultado['variacion'] = matriz[:, -1] - matriz[:, 0]
+    resultado = resultado.nlargest(top, 'variacion')
+    return con_descripciones(resultado)
+
+
+def tfidf(por='provincia', df=None):
+    """
+    TF-IDF tomando como documento cada grupo (provincia, empresa, anio o reporte).
+    Devuelve un DataFrame largo con las columnas grupo, palabra, cantidad, tf y tfidf.
+    """
+    if df is None:
+        df = cargar_conteos()
+        if por not in _cache['tfidf']:
+            _cache['tfidf'][por] = tfidf(por, df)
+        return _cache['tfidf'][por]
+    df = df.dropna(subset=[por])
+
+    grupos = df.groupby([por, 'palabra'], sort=False)['cantidad'].sum().reset_index()
+    grupos.columns = ['grupo', 'palabra', 'cantidad']
+    if grupos.empty:
+        return grupos.assign(tf=[], tfidf=[])
+
+    cantidades = grupos['cantidad'].to_numpy(dtype=np.float64)
+    totales = grupos.groupby('grupo')['cantidad'].transform('sum').to_numpy(dtype=np.float64)
+    documentos = grupos.groupby('palabra')['grupo'].transform('size').to_numpy(dtype=np.float64)
+    n_grupos = grupos['grupo'].nunique()
+
+    grupos['tf'] = cantidades / totales
+    # Una palabra presente en todos los grupos no distingue a ninguno (idf = 0)
+    grupos['tfidf'] = grupos['tf'].to_numpy() * np.log(n_grupos / documentos)
+    return grupos
+
+
+def distintivas(grupo, por='provincia', top=20, df=None):
+    """Palabras más distintivas de un grupo (p. ej. una provincia) según TF-IDF."""
+    tabla = tfidf(por, df)
+    tabla = tabla[(tabla['grupo'] == grupo) & (tabla['tfidf'] > 0)].set_index('palabra')
+    resultado = tabla.nlargest(top, 'tfidf')[['cantidad', 'tf', 'tfidf']]
+    return con_descripciones(resultado)
@@ -0,0 +1,266 @@
+# Palabras/benchmark.py
+"""
+Banco de pruebas de la ingesta completa (ZIP -> detección -> conversión/OCR -> conteo -> BD).
+
+Genera ZIPs sintéticos que mezclan PDF con capa de texto, PDF solo imagen, DOCX y TXT,
+los procesa con procesar_zip_reportes (y el signal post_save de Reporte) sobre una base
+de datos y un MEDIA_ROOT temporales, y devuelve un diccionario con el rendimiento,
+el tiempo de cada etapa y la memoria máxima. No necesita red.
+"""
+import io
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import time
+import zipfile
+from contextlib import contextmanager
+from tempfile import TemporaryDirectory
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.test.utils import override_settings
+
+from . import utils
+from .models import ConteoTotal, Cuarentena, Empresa, Provincia, Reporte
+
+TIPOS = ('pdf', 'pdf_imagen', 'docx', 'txt')
+EXTENSIONES = {'pdf': 'pdf', 'pdf_imagen': 'pdf', 'docx': 'docx', 'txt': 'txt'}
+PALABRAS_POR_PAGINA = 350
+PALABRAS_POR_PARRAFO = 60
+
+# Vocabulario de informes de gestión; se completa con palabras inventadas
+VOCABULARIO = (
+    'activos pasivos patrimonio ingresos gastos utilidad ventas costos inversión clientes proveedores '
+    'mercado producción gestión auditoría balance resultados ejercicio directorio accionistas '
+    'dividendos crecimiento financiamiento riesgo liquidez capital impuestos personal calidad '
+    'sostenibilidad innovación tecnología exportaciones importaciones contratos cartera provisiones'
+).split()
+
+
+SILABAS = ('ba', 'ce', 'di', 'fo', 'gu', 'la', 'me', 'ni', 'po', 'ru', 'sa', 'te', 'vi', 'zo')
+
+
+def generar_texto(aleatorio, palabras):
+    # Palabras inventadas solo con letras: el conteo descarta las que tienen dígitos
+    inventadas = [a + b + c for a in SILABAS for b in SILABAS for c in SILABAS][:2000]
+    return ' '.join(aleatorio.choices(VOCABULARIO + inventadas, k=palabras))
+
+
+def trozos(texto, palabras_por_trozo):
+    palabras = texto.split()
+    return [' '.join(palabras[i:i + palabras_por_trozo]) for i in range(0, len(palabras), palabras_por_trozo)]
+
+
+def escribir_pdf(ruta, cabecera, texto):
+    import fitz
+    with fitz.open() as pdf:
+        for i, trozo in enumerate(trozos(texto, PALABRAS_POR_PAGINA)):
+            page = pdf.new_page()
+            page.insert_textbox(page.rect + (50, 50, -50, -50), (cabecera + '\n' if i == 0 else '') + trozo, fontsize=9)
+        pdf.save(ruta)
+
+
+def escribir_pdf_imagen(ruta, cabecera, texto):
+    """PDF sin capa de texto: cada página es una imagen (solo se puede leer con OCR)."""
+    import fitz
+    from PIL import Image, ImageDraw
+
+    with fitz.open() as pdf:
+        for i, trozo in enumerate(trozos(texto, PALABRAS_POR_PAGINA)):
+            imagen = Image.new('L', (1240, 1754), 255)
+            dibujo = ImageDraw.Draw(imagen)
+            lineas = ([cabecera] if i == 0 else []) + trozos(trozo, 12)
+            for n, linea in enumerate(lineas):
+                dibujo.text((60, 60 + n * 24), linea, fill=0)
+            png = io.BytesIO()
+            imagen.save(png, format='PNG')
+            page = pdf.new_page()
+            page.insert_image(page.rect, stream=png.getvalue())
+        pdf.save(ruta)
+
+
+def escribir_docx(ruta, cabecera, texto):
+    from docx import Document
+    doc = Document()
+    doc.add_heading(cabecera, level=1)
+    for parrafo in trozos(texto, PALABRAS_POR_PARRAFO):
+        doc.add_paragraph(parrafo)
+    doc.save(ruta)
+
+
+def escribir_txt(ruta, cabecera, texto):
+    with open(ruta, 'w', encoding='utf-8') as f:
+        f.write(cabecera + '\n')
+        for parrafo in trozos(texto, PALABRAS_POR_PARRAFO):
+            f.write(parrafo + '\n')
+
+
+ESCRITORES = {'pdf': escribir_pdf, 'pdf_imagen': escribir_pdf_imagen, 'docx': escribir_docx, 'txt': escribir_txt}
+
+
+def crear_empresas(cantidad):
+    provincia = Provincia.objects.create(nombre='Pichincha')
+    Empresa.objects.create(nombre='Desconocido', ruc='0000000000000', provincia=provincia)
+    return Empresa.objects.bulk_create([
+        Empresa(nombre=f'Industrias Sintéticas {i} Cía. Ltda.', ruc=f'17{i:08d}001', provincia=provincia)
+        for i in range(1, cantidad + 1)
+    ])
+
+
+def generar_zips(directorio, empresas, documentos, palabras, tipos, por_zip, semilla=0):
+    """
+    Escribe los ZIP de prueba en directorio y devuelve sus rutas. Un tercio de los
+    documentos va en una carpeta con el nombre de la empresa, otro tercio trae el RUC
+    en el texto y el resto solo el nombre (detección por similitud).
+    """
+    aleatorio = random.Random(semilla)
+    rutas = []
+    with TemporaryDirectory() as temporal:
+        for inicio in range(0, documentos, por_zip):
+            ruta_zip = os.path.join(directorio, f'lote{len(rutas) + 1}.zip')
+            with zipfile.ZipFile(ruta_zip, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+                for i in range(inicio, min(inicio + por_zip, documentos)):
+                    tipo = tipos[i % len(tipos)]
+                    empresa = empresas[i % len(empresas)]
+                    anio = aleatorio.randint(2015, 2024)
+                    if i % 3 == 0:
+                        cabecera = f'Informe anual {anio}'
+                        carpeta = f'EMPRESA {empresa.pk} {empresa.nombre.upper()}/'
+                    elif i % 3 == 1:
+                        cabecera = f'Informe anual {anio} RUC {empresa.ruc}'
+                        carpeta = ''
+                    else:
+                        cabecera = f'Informe anual {anio} {empresa.nombre}'
+                        carpeta = ''
+
+                    ruta = os.path.join(temporal, f'documento.{EXTENSIONES[tipo]}')
+                    ESCRITORES[tipo](ruta, cabecera, generar_texto(aleatorio, palabras))
+                    zip_ref.write(ruta, f'{carpeta}{tipo}_{i}.{EXTENSIONES[tipo]}')
+            rutas.append(ruta_zip)
+    return rutas
+
+
+class Cronometro:
+    """Tiempo acumulado y número de llamadas por etapa."""
+
+    def __init__(self):
+        self.etapas = {}
+
+    def medir(self, etapa, funcion):
+        def medida(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                segundos, llamadas = self.etapas.get(etapa, (0.0, 0))
+                self.etapas[etapa] = (segundos + time.perf_counter() - inicio, llamadas + 1)
+        return medida
+
+
+@contextmanager
+def instrumentar(cronometro):
+    """
+    Mide las etapas del pipeline sustituyendo temporalmente las funciones de utils:
+    cada llamada a ejecutar_con_presupuesto se asigna a su etapa (detección, conversión,
+    conteo, incluido el proceso hijo) y guardar_conteo_en_bd a la de persistencia.
+    """
+    originales = {nombre: getattr(utils, nombre) for nombre in ('ejecutar_con_presupuesto', 'guardar_conteo_en_bd')}
+
+    def ejecutar_con_presupuesto(etapa, funcion, *args, **kwargs):
+        return cronometro.medir(etapa, originales['ejecutar_con_presupuesto'])(etapa, funcion, *args, **kwargs)
+
+    utils.ejecutar_con_presupuesto = ejecutar_con_presupuesto
+    utils.guardar_conteo_en_bd = cronometro.medir('persistencia', originales['guardar_conteo_en_bd'])
+    try:
+        yield cronometro
+    finally:
+        for nombre, funcion in originales.items():
+            setattr(utils, nombre, funcion)
+
+
+@contextmanager
+def base_de_datos_temporal():
+    """Crea una base de datos de prueba (como el test runner) y la elimina al salir."""
+    nombre_anterior = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(nombre_anterior, verbosity=0)
+
+
+def memoria_maxima_mb(quien):
+    maximo = resource.getrusage(quien).ru_maxrss
+    # Linux informa KiB; macOS, bytes
+    return round(maximo / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def ejecutar(documentos=24, palabras=2000, tipos=TIPOS, por_zip=12, empresas=20, semilla=0):
+    """Genera los ZIP, los procesa y devuelve el resultado como diccionario (serializable a JSON)."""
+    tipos = tuple(tipos)
+    with TemporaryDirectory() as directorio, base_de_datos_temporal():
+        media = os.path.join(directorio, 'media')
+        with override_settings(MEDIA_ROOT=media, CONTPAL_DOCX_DIR=os.path.join(media, 'Docxs'),
+                               CONTPAL_MATRIZ_DIR=os.path.join(directorio, 'matriz')):
+            lista_empresas = crear_empresas(empresas)
+
+            inicio = time.perf_counter()
+            zips = generar_zips(directorio, lista_empresas, documentos, palabras, tipos, por_zip, semilla)
+            generacion = time.perf_counter() - inicio
+            tamano_zips = sum(os.path.getsize(ruta) for ruta in zips)
+
+            cronometro = Cronometro()
+            with instrumentar(cronometro):
+                inicio = time.perf_counter()
+                for ruta in zips:
+                    utils.procesar_zip_reportes(ruta)
+                total = time.perf_counter() - inicio
+
+            procesados = Reporte.objects.exclude(cuarentena__isnull=False).count()
+            cuarentena = {
+                etapa: Cuarentena.objects.filter(etapa=etapa).count() for etapa, _ in Cuarentena.ETAPAS
+            }
+            sin_empresa = Reporte.objects.filter(empresa__nombre__iexact='Desconocido').count()
+            conteos = ConteoTotal.objects.count()
+
+    etapas = {
+        etapa: {'segundos': round(segundos, 4), 'llamadas': llamadas}
+        for etapa, (segundos, llamadas) in sorted(cronometro.etapas.items())
+    }
+    # Lectura del ZIP, hash, almacenamiento, signals y cachés
+    etapas['otros'] = {'segundos': round(total - sum(s for s, _ in cronometro.etapas.values()), 4)}
+
+    return {
+        'configuracion': {
+            'documentos': documentos, 'palabras_por_documento': palabras, 'tipos': list(tipos),
+            'documentos_por_zip': por_zip, 'empresas': empresas, 'semilla': semilla,
+            'presupuesto_segundos': getattr(settings, 'CONTPAL_PRESUPUESTO_SEGUNDOS', None),
+            'presupuesto_memoria_mb': getattr(settings, 'CONTPAL_PRESUPUESTO_MEMORIA_MB', None),
+            'paginas_metadatos': getattr(settings, 'CONTPAL_PAGINAS_METADATOS', 3),
+        },
+        'entorno': {
+            'python': platform.python_version(), 'django': django.get_version(),
+            'base_de_datos': connection.vendor, 'cpus': os.cpu_count(),
+            'tesseract': bool(shutil.which('tesseract')),
+        },
+        'resultado': {
+            'segundos': round(total, 4),
+            'documentos_por_segundo': round(documentos / total, 3) if total else None,
+            'reportes_procesados': procesados,
+            'en_cuarentena': cuarentena,
+            'sin_empresa': sin_empresa,
+            'conteos': conteos,
+            'megabytes_zip': round(tamano_zips / (1024 * 1024), 2),
+            'segundos_generacion': round(generacion, 4),
+        },
+        'etapas': etapas,
+        'memoria': {
+            # Máximos desde el inicio del proceso (incluye la generación de los ZIP)
+            'max_rss_mb': memoria_maxima_mb(resource.RUSAGE_SELF),
+            'max_rss_hijos_mb': memoria_maxima_mb(resource.RUSAGE_CHILDREN),
+        },
+    }
@@ -0,0 +1,72 @@
+# Palabras/busqueda.py
+"""
+Búsqueda indexada para el admin y su autocompletado.
+
+La búsqueda por defecto del admin (icontains) recorre la tabla completa en cada tecla.
+En SQLite la migración 0018 crea, para Palabras y Empresa, una tabla FTS5 con el
+tokenizador de trigramas (cualquier subcadena de 3 o más caracteres se busca por índice)
+e índices COLLATE NOCASE para buscar por prefijo los términos más cortos. Las tablas FTS
+se mantienen sincronizadas con triggers. Con otras bases de datos, o si la tabla no
+existe, se usa la búsqueda normal de search_fields.
+"""
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.text import smart_split, unescape_string_literal
+
+# El tokenizador de trigramas no puede usar el índice con menos de 3 caracteres
+MINIMO_TRIGRAMA = 3
+
+_tablas = {}
+
+
+def tabla_disponible(tabla):
+    if connection.vendor != 'sqlite':
+        return False
+    if tabla not in _tablas:
+        _tablas[tabla] = tabla in connection.introspection.table_names()
+    return _tablas[tabla]
+
+
+def frase_fts(termino):
+    """Término como frase de FTS5 (entre comillas: los operadores no se interpretan)."""
+    return '"' + termino.replace('"', '""') + '"'
+
+
+class BusquedaIndexadaMixin:
+    """
+    ModelAdmin cuya búsqueda usa la tabla FTS busqueda_tabla (su rowid es el campo
+    busqueda_id del queryset) y, para términos cortos, los campos de busqueda_prefijo.
+    Como en el admin, cada término de la búsqueda debe coincidir.
+    """
+    busqueda_tabla = None
+    busqueda_id = 'pk'
+    busqueda_prefijo = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not tabla_disponible(self.busqueda_tabla):
+            return super().get_search_results(request, queryset, search_term)
+
+        terminos = []
+        for termino in smart_split(search_term):
+            if termino.startswith(('"', "'")) and termino[0] == termino[-1]:
+                termino = unescape_string_literal(termino)
+            terminos.append(termino)
+        # Los términos cortos se buscan como subcadena si otro término ya acota las filas
+        # por índice; si todos son cortos, por prefijo (también por índice)
+        acotado = any(len(termino) >= MINIMO_TRIGRAMA for termino in terminos)
+
+        for termino in terminos:
+            if len(termino) >= MINIMO_TRIGRAMA:
+                coincidencias = RawSQL(
+                    f'SELECT rowid FROM {self.busqueda_tabla} WHERE {self.busqueda_tabla} MATCH %s',
+                    [frase_fts(termino)],
+                )
+                queryset = queryset.filter(**{f'{self.busqueda_id}__in': coincidencias})
+            else:
+                busqueda = 'icontains' if acotado else 'istartswith'
+                filtro = Q()
+                for campo in self.busqueda_prefijo:
+                    filtro |= Q(**{f'{campo}__{busqueda}': termino})
+                queryset = queryset.filter(filtro)
+        return queryset, False
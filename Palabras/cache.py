@@ -0,0 +1,75 @@
+# Palabras/cache.py
+"""
+Caché de los datos que muestra el admin (años disponibles y conteos por reporte).
+
+Las entradas se invalidan cuando cambian los datos: guardar_conteo_en_bd invalida los
+reportes cuyos conteos modificó y los signals de Reporte invalidan al guardar o eliminar.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import ConteoTotal, Reporte
+
+CLAVE_ANIOS = 'palabras:anios'
+
+
+def clave_conteos(reporte_id):
+    return f'palabras:conteos:{reporte_id}'
+
+
+def timeout():
+    return getattr(settings, 'CONTPAL_CACHE_TIMEOUT', 300)
+
+
+def anios_reportes():
+    """Años distintos de los reportes (para AnioListFilter)."""
+    anios = cache.get(CLAVE_ANIOS)
+    if anios is None:
+        anios = list(Reporte.objects.order_by().values_list('anio', flat=True).distinct())
+        cache.set(CLAVE_ANIOS, anios, timeout())
+    return anios
+
+
+def conteos_reporte(reporte_id):
+    """
+    Lista (palabra, cantidad) del reporte ordenada de mayor a menor cantidad.
+    Para un duplicado devuelve los conteos del reporte original.
+    """
+    clave = clave_conteos(reporte_id)
+    conteos = cache.get(clave)
+    if conteos is None:
+        duplicado_de = Reporte.objects.values_list('duplicado_de_id', flat=True).get(pk=reporte_id)
+        conteos = list(
+            ConteoTotal.objects.filter(reporte_id=duplicado_de or reporte_id)
+            .order_by('-cantidad')
+            .values_list('palabra__descripcion', 'cantidad')
+        )
+        cache.set(clave, conteos, timeout())
+    return conteos
+
+
+def invalidar_reportes(reporte_ids, anios=False):
+    """
+    Invalida los conteos de los reportes indicados (y de sus duplicados) cuando
+    se confirma la transacción en curso.
+    """
+    reporte_ids = set(reporte_ids)
+    reporte_ids.update(Reporte.objects.filter(duplicado_de__in=reporte_ids).values_list('pk', flat=True))
+    claves = [clave_conteos(reporte_id) for reporte_id in reporte_ids]
+    if anios:
+        claves.append(CLAVE_ANIOS)
+    transaction.on_commit(lambda: cache.delete_many(claves))
+
+
+def calentar(reporte_ids):
+    """
+    Precarga la caché tras una ingesta masiva. Se ejecuta al confirmar la
+    transacción, después de las invalidaciones pendientes.
+    """
+    def precargar():
+        anios_reportes()
+        for reporte_id in reporte_ids:
+            conteos_reporte(reporte_id)
+
+    transaction.on_commit(precargar)
@@ -0,0 +1,132 @@
+# Palabras/cargas.py
+"""
+Carga de ZIP grandes por partes (reanudable).
+
+El cliente crea una carga con el tamaño total (hasta CONTPAL_CARGAS_MAX_BYTES, y
+opcionalmente su SHA-256), envía las partes en orden indicando su posición y, si puede
+calcularlo, el SHA-256 de cada una, y al terminar pide completarla. Las partes se escriben
+directamente en el archivo final, en disco. La carga completa la procesa después
+manage.py procesar_cargas, fuera de la petición (ver CONTPAL_CARGAS_PROCESAR_AL_COMPLETAR).
+"""
+import hashlib
+import os
+
+from django.conf import settings
+
+from .models import CargaZip
+
+TAMANO_LECTURA = 64 * 1024
+
+
+class CargaInvalida(Exception):
+    """La parte o la carga no son válidas (posición, tamaño o checksum)."""
+
+
+def directorio_cargas():
+    directorio = str(getattr(settings, 'CONTPAL_CARGAS_DIR', os.path.join(settings.BASE_DIR, 'cargas')))
+    os.makedirs(directorio, exist_ok=True)
+    return directorio
+
+
+def tamano_parte():
+    return getattr(settings, 'CONTPAL_CARGA_TAMANO_PARTE', 8 * 1024 * 1024)
+
+
+def tamano_maximo():
+    return getattr(settings, 'CONTPAL_CARGAS_MAX_BYTES', 16 * 1024 ** 3)
+
+
+def ruta_carga(carga):
+    return os.path.join(directorio_cargas(), f'{carga.pk}.zip')
+
+
+def crear_carga(nombre, tamano, sha256=''):
+    if tamano <= 0:
+        raise CargaInvalida("El tamaño debe ser mayor que cero")
+    if tamano > tamano_maximo():
+        raise CargaInvalida(f"El tamaño máximo de una carga es {tamano_maximo()} bytes")
+    carga = CargaZip.objects.create(nombre=os.path.basename(nombre), tamano=tamano, sha256=sha256.lower())
+    # Reservar el archivo completo: cada parte se escribe en su posición
+    with open(ruta_carga(carga), 'wb') as f:
+        f.truncate(tamano)
+    return carga
+
+
+def escribir_parte(carga, posicion, stream, longitud, sha256):
+    """
+    Escribe una parte leída de stream en la posición indicada y verifica su checksum (si
+    se indicó). Solo se acepta la parte que continúa lo recibido; al reanudar se puede
+    repetir una parte ya recibida, pero lo que se superpone debe coincidir con lo guardado.
+    """
+    if carga.estado != CargaZip.ESTADO_PENDIENTE:
+        raise CargaInvalida("La carga ya fue completada")
+    if posicion < 0 or posicion > carga.recibido:
+        raise CargaInvalida(f"Falta recibir desde la posición {carga.recibido}")
+    if longitud <= 0 or longitud > tamano_parte() or posicion + longitud > carga.tamano:
+        raise CargaInvalida("Tamaño de parte inválido")
+
+    h = hashlib.sha256()
+    escritos = 0
+    with open(ruta_carga(carga), 'r+b') as f:
+        f.seek(posicion)
+        while escritos < longitud:
+            datos = stream.read(min(TAMANO_LECTURA, longitud - escritos))
+            if not datos:
+                break
+            h.update(datos)
+            # Los bytes ya recibidos no se sobrescriben: se comparan
+            superpuestos = max(min(carga.recibido - posicion - escritos, len(datos)), 0)
+            if superpuestos and f.read(superpuestos) != datos[:superpuestos]:
+                raise CargaInvalida("La parte no coincide con lo ya recibido")
+            f.write(datos[superpuestos:])
+            escritos += len(datos)
+
+    if escritos != longitud:
+        raise CargaInvalida("La parte llegó incompleta")
+    if sha256 and h.hexdigest() != sha256.lower():
+        raise CargaInvalida("El checksum de la parte no coincide")
+
+    # Avanzar solo si nadie más lo hizo mientras tanto
+    fin = posicion + longitud
+    CargaZip.objects.filter(pk=carga.pk, recibido__lt=fin, recibido__gte=posicion).update(recibido=fin)
+    carga.refresh_from_db()
+    return carga
+
+
+def completar_carga(carga):
+    """Verifica que la carga esté completa (y su SHA-256 si se indicó). Devuelve la ruta."""
+    if carga.recibido != carga.tamano:
+        raise CargaInvalida(f"Faltan {carga.tamano - carga.recibido} bytes")
+
+    ruta = ruta_carga(carga)
+    if carga.sha256:
+        h = hashlib.sha256()
+        with open(ruta, 'rb') as f:
+            for datos in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(datos)
+        if h.hexdigest() != carga.sha256:
+            carga.estado = CargaZip.ESTADO_ERROR
+            carga.error = "El checksum del archivo completo no coincide"
+            carga.save()
+            raise CargaInvalida(carga.error)
+
+    carga.estado = CargaZip.ESTADO_COMPLETA
+    carga.save()
+    return ruta
+
+
+def procesar_carga(carga):
+    """Procesa el ZIP ensamblado directamente desde disco y elimina el archivo."""
+    from .utils import procesar_zip_reportes
+
+    ruta = ruta_carga(carga)
+    try:
+        procesar_zip_reportes(ruta)
+    except Exception as e:
+        carga.estado = CargaZip.ESTADO_ERROR
+        carga.error = f"{type(e).__name__}: {e}"
+        carga.save()
+        raise
+    carga.estado = CargaZip.ESTADO_PROCESADA
+    carga.save()
+    os.remove(ruta)
@@ -0,0 +1,182 @@
+# Palabras/exportar.py
+import csv
+import io
+
+from .models import ConteoTotal
+
+COLUMNAS = ('palabra', 'cantidad', 'reporte', 'anio', 'empresa', 'ruc', 'provincia')
+
+CAMPOS = (
+    'palabra__descripcion',
+    'cantidad',
+    'reporte__nombre',
+    'reporte__anio',
+    'reporte__empresa__nombre',
+    'reporte__empresa__ruc',
+    'reporte__empresa__provincia__nombre',
+)
+
+# Filas que se leen de la base de datos en cada bloque
+TAMANO_LOTE = 5000
+
+
+def consulta_exportacion(anio=None, provincia=None, empresa=None):
+    """
+    Conteos con su palabra, reporte, empresa y provincia como tuplas planas.
+    provincia y empresa aceptan el id o el nombre (empresa también el RUC).
+    Lanza ValueError si anio no es un número.
+    """
+    qs = ConteoTotal.objects.order_by()
+    if anio:
+        qs = qs.filter(reporte__anio=int(anio))
+    if provincia:
+        if str(provincia).isdigit():
+            qs = qs.filter(reporte__empresa__provincia_id=provincia)
+        else:
+            qs = qs.filter(reporte__empresa__provincia__nombre__iexact=provincia)
+    if empresa:
+        empresa = str(empresa)
+        if len(empresa) == 13 and empresa.isdigit():
+            qs = qs.filter(reporte__empresa__ruc=empresa)
+        elif empresa.isdigit():
+            qs = qs.filter(reporte__empresa_id=empresa)
+        else:
+            qs = qs.filter(reporte__empresa__nombre__iexact=empresa)
+    return qs.values_list(*CAMPOS)
+
+
+def iterar_filas(qs, tamano_lote=TAMANO_LOTE):
+    """Recorre la consulta con un cursor del servidor, sin cargarla entera en memoria."""
+    return qs.iterator(chunk_size=tamano_lote)
+
+
+class Eco:
+    """Pseudo-buffer para csv.writer: devuelve lo escrito en lugar de guardarlo."""
+
+    def write(self, value):
+        return value
+
+
+def filas_csv(qs, tamano_lote=TAMANO_LOTE):
+    """Genera el CSV línea por línea (cabecera incluida)."""
+    writer = csv.writer(Eco())
+    yield writer.writerow(COLUMNAS)
+    for fila in iterar_filas(qs, tamano_lote):
+        yield writer.writerow(fila)
+
+
+def escribir_csv(qs, salida, tamano_lote=TAMANO_LOTE):
+    """Escribe el CSV en un archivo abierto en modo texto. Devuelve el número de filas."""
+    writer = csv.writer(salida)
+    writer.writerow(COLUMNAS)
+    total = 0
+    for fila in iterar_filas(qs, tamano_lote):
+        writer.writerow(fila)
+        total += 1
+    return total
+
+
+def modulos_parquet():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise ImportError("La exportación a Parquet requiere pyarrow (pip install pyarrow).") from exc
+    return pa, pq
+
+
+def esquema_parquet(pa):
+    return pa.schema([
+        ('palabra', pa.string()),
+        ('cantidad', pa.int64()),
+        ('reporte', pa.string()),
+        ('anio', pa.int32()),
+        ('empresa', pa.string()),
+        ('ruc', pa.string()),
+        ('provincia', pa.string()),
+    ])
+
+
+def tablas_parquet(pa, esquema, qs, tamano_lote):
+    """Una tabla de pyarrow por bloque de filas leído (al menos una, aunque esté vacía)."""
+    lote = []
+    vacia = True
+    for fila in iterar_filas(qs, tamano_lote):
+        lote.append(fila)
+        if len(lote) >= tamano_lote:
+            yield _tabla(pa, esquema, lote)
+            vacia = False
+            lote = []
+    if lote or vacia:
+        yield _tabla(pa, esquema, lote)
+
+
+def escribir_parquet(qs, salida, tamano_lote=TAMANO_LOTE):
+    """
+    Escribe los conteos en formato Parquet, un grupo de filas por bloque leído.
+    Requiere pyarrow. Devuelve el número de filas.
+    """
+    pa, pq = modulos_parquet()
+    esquema = esquema_parquet(pa)
+    total = 0
+    with pq.ParquetWriter(salida, esquema) as writer:
+        for tabla in tablas_parquet(pa, esquema, qs, tamano_lote):
+            writer.write_table(tabla)
+            total += tabla.num_rows
+    return total
+
+
+class Tubo(io.RawIOBase):
+    """Archivo de solo escritura cuyo contenido se retira por partes (vaciar)."""
+
+    def __init__(self):
+        super().__init__()
+        self.partes = []
+        self.posicion = 0
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+
+def bloques_parquet(qs, tamano_lote=TAMANO_LOTE):
+    """
+    Genera el archivo Parquet por partes, a medida que se escribe cada grupo de filas
+    (Parquet se escribe de forma secuencial; el índice va al final). Requiere pyarrow:
+    si falta, el ImportError se lanza al llamar, antes de empezar a generar.
+    """
+    pa, pq = modulos_parquet()
+    esquema = esquema_parquet(pa)
+
+    def generar():
+        tubo = Tubo()
+        writer = pq.ParquetWriter(tubo, esquema)
+        for tabla in tablas_parquet(pa, esquema, qs, tamano_lote):
+            writer.write_table(tabla)
+            datos = tubo.vaciar()
+            if datos:
+                yield datos
+        writer.close()
+        yield tubo.vaciar()
+
+    return generar()
+
+
+def _tabla(pa, esquema, filas):
+    columnas = list(zip(*filas)) if filas else [[] for _ in COLUMNAS]
+    return pa.Table.from_arrays(
+        [pa.array(columna, type=campo.type) for columna, campo in zip(columnas, esquema)],
+        schema=esquema,
+    )
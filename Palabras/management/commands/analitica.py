@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Palabras.analitica import distintivas, tendencia
+
+
+class Command(BaseCommand):
+    help = ("Analítica de palabras: crecimiento entre años (tendencia) "
+            "o términos distintivos por TF-IDF (distintivas).")
+
+    def add_arguments(self, parser):
+        sub = parser.add_subparsers(dest='analisis', required=True)
+
+        p = sub.add_parser('tendencia', help="Palabras que más crecieron entre dos años")
+        p.add_argument('desde', type=int)
+        p.add_argument('hasta', type=int)
+        p.add_argument('--empresa', type=int, help="Id de la empresa")
+        p.add_argument('--provincia', type=int, help="Id de la provincia")
+        p.add_argument('--top', type=int, default=20)
+
+        p = sub.add_parser('distintivas', help="Términos más distintivos de un grupo")
+        p.add_argument('grupo', type=int, help="Id del grupo (provincia, empresa, reporte) o año")
+        p.add_argument('--por', choices=['provincia', 'empresa', 'anio', 'reporte'], default='provincia')
+        p.add_argument('--top', type=int, default=20)
+
+    def handle(self, *args, **options):
+        if options['analisis'] == 'tendencia':
+            if options['desde'] > options['hasta']:
+                raise CommandError("'desde' debe ser menor o igual que 'hasta'.")
+            resultado = tendencia(
+                options['desde'], options['hasta'],
+                empresa=options['empresa'], provincia=options['provincia'], top=options['top'],
+            )
+        else:
+            resultado = distintivas(options['grupo'], por=options['por'], top=options['top'])
+
+        if resultado.empty:
+            self.stdout.write("Sin datos.")
+        else:
+            self.stdout.write(resultado.to_string())
@@ -0,0 +1,45 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Palabras.benchmark import TIPOS, ejecutar
+
+
+class Command(BaseCommand):
+    help = ("Mide la ingesta completa con ZIPs sintéticos (PDF con texto, PDF solo imagen, DOCX, TXT) "
+            "sobre una base de datos temporal y escribe el resultado en JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documentos', type=int, default=24)
+        parser.add_argument('--palabras', type=int, default=2000, help="Palabras por documento")
+        parser.add_argument('--tipos', default=','.join(TIPOS), help=f"Separados por coma: {', '.join(TIPOS)}")
+        parser.add_argument('--por-zip', type=int, default=12, help="Documentos por ZIP")
+        parser.add_argument('--empresas', type=int, default=20)
+        parser.add_argument('--semilla', type=int, default=0)
+        parser.add_argument('--salida', help="Archivo JSON (por defecto la salida estándar)")
+
+    def handle(self, *args, **options):
+        tipos = [tipo.strip() for tipo in options['tipos'].split(',') if tipo.strip()]
+        desconocidos = set(tipos) - set(TIPOS)
+        if not tipos or desconocidos:
+            raise CommandError(f"Tipos no válidos: {', '.join(sorted(desconocidos)) or '(ninguno)'}")
+        if options['documentos'] < 1 or options['por_zip'] < 1 or options['empresas'] < 1:
+            raise CommandError("--documentos, --por-zip y --empresas deben ser mayores que cero.")
+
+        resultado = ejecutar(
+            documentos=options['documentos'],
+            palabras=options['palabras'],
+            tipos=tipos,
+            por_zip=options['por_zip'],
+            empresas=options['empresas'],
+            semilla=options['semilla'],
+        )
+
+        salida = json.dumps(resultado, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as f:
+                f.write(salida + '\n')
+            self.stdout.write(f"{resultado['resultado']['documentos_por_segundo']} documentos/s; "
+                              f"resultado en {options['salida']}")
+        else:
+            self.stdout.write(salida)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from Palabras.models import Reporte
+from Palabras.presupuesto import DocumentoFallido
+from Palabras.terminos import guardar_conteos_terminos
+from Palabras.utils import extraer_conteos
+
+
+class Command(BaseCommand):
+    help = ("Vuelve a contar los términos contables activos en los reportes ya ingresados "
+            "(p. ej. después de agregar términos). No modifica sus conteos de palabras.")
+
+    def handle(self, *args, **options):
+        reportes = (
+            Reporte.objects.filter(duplicado_de__isnull=True)
+            .exclude(archivo='').exclude(archivo__isnull=True).order_by('pk')
+        )
+        contados = 0
+        for reporte in reportes.iterator():
+            try:
+                _, _, terminos = extraer_conteos(reporte)
+            except DocumentoFallido as e:
+                self.stderr.write(f"{reporte.nombre}: {e}")
+                continue
+            guardar_conteos_terminos(reporte, terminos)
+            contados += 1
+        self.stdout.write(f"{contados} reporte(s) contados.")
@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Palabras.exportar import TAMANO_LOTE, consulta_exportacion, escribir_csv, escribir_parquet
+
+
+class Command(BaseCommand):
+    help = "Exporta los conteos de palabras (con reporte, empresa y provincia) a CSV o Parquet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formato', choices=['csv', 'parquet'], default='csv')
+        parser.add_argument('--salida', help="Archivo de salida (por defecto la salida estándar, solo CSV)")
+        parser.add_argument('--anio', type=int)
+        parser.add_argument('--provincia', help="Id o nombre de la provincia")
+        parser.add_argument('--empresa', help="Id, RUC o nombre de la empresa")
+        parser.add_argument('--tamano-lote', type=int, default=TAMANO_LOTE)
+
+    def handle(self, *args, **options):
+        qs = consulta_exportacion(
+            anio=options['anio'],
+            provincia=options['provincia'],
+            empresa=options['empresa'],
+        )
+        salida = options['salida']
+        tamano_lote = options['tamano_lote']
+
+        if options['formato'] == 'parquet':
+            if not salida:
+                raise CommandError("La exportación a Parquet necesita --salida.")
+            try:
+                total = escribir_parquet(qs, salida, tamano_lote)
+            except ImportError as e:
+                raise CommandError(str(e))
+        elif salida:
+            with open(salida, 'w', newline='', encoding='utf-8') as f:
+                total = escribir_csv(qs, f, tamano_lote)
+        else:
+            total = escribir_csv(qs, sys.stdout, tamano_lote)
+
+        self.stderr.write(f"{total} filas exportadas.")
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from Palabras.models import Reporte
+from Palabras.presupuesto import DocumentoFallido
+from Palabras.similitud import indexar_firma
+from Palabras.utils import extraer_conteos
+
+
+class Command(BaseCommand):
+    help = ("Calcula la firma MinHash e indexa en LSH los reportes que aún no la tienen "
+            "(los ingresados antes de la detección de casi duplicados). No modifica sus conteos.")
+
+    def handle(self, *args, **options):
+        pendientes = (
+            Reporte.objects.filter(firma_minhash__isnull=True, duplicado_de__isnull=True)
+            .exclude(archivo='').exclude(archivo__isnull=True).order_by('pk')
+        )
+        indexados = 0
+        for reporte in pendientes.iterator():
+            try:
+                _, firma, _ = extraer_conteos(reporte)
+            except DocumentoFallido as e:
+                self.stderr.write(f"{reporte.nombre}: {e}")
+                continue
+            indexar_firma(reporte.pk, firma)
+            indexados += 1
+        self.stdout.write(f"{indexados} reporte(s) indexados.")
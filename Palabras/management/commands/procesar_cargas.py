@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from Palabras.cargas import procesar_carga
+from Palabras.models import CargaZip
+
+
+class Command(BaseCommand):
+    help = "Procesa las cargas ZIP por partes que ya están completas."
+
+    def handle(self, *args, **options):
+        for carga in CargaZip.objects.filter(estado=CargaZip.ESTADO_COMPLETA).order_by('creado'):
+            self.stdout.write(f"Procesando {carga.nombre}...")
+            try:
+                procesar_carga(carga)
+            except Exception as e:
+                self.stderr.write(f"{carga.nombre}: {e}")
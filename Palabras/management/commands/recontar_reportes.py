@@ -0,0 +1,43 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from Palabras.models import Reporte
+from Palabras.presupuesto import DocumentoFallido
+from Palabras.similitud import indexar_firma
+from Palabras.terminos import guardar_conteos_terminos
+from Palabras.utils import extraer_conteos, guardar_conteo_en_bd
+
+
+class Command(BaseCommand):
+    help = ("Vuelve a contar las palabras de los reportes ya ingresados (todos, los ids indicados "
+            "o los contados antes de --antes), p. ej. después de cambiar la lectura de los .docx: "
+            "reemplaza sus conteos y corrige los totales anuales. Sus duplicados copian el resultado.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int)
+        parser.add_argument('--antes', type=date.fromisoformat,
+                            help="Solo reportes contados antes de esta fecha (AAAA-MM-DD).")
+
+    def handle(self, *args, **options):
+        reportes = (
+            Reporte.objects.filter(duplicado_de__isnull=True, conteos_actualizados__isnull=False)
+            .exclude(archivo='').exclude(archivo__isnull=True).order_by('pk')
+        )
+        if options['ids']:
+            reportes = reportes.filter(pk__in=options['ids'])
+        if options['antes']:
+            reportes = reportes.filter(conteos_actualizados__date__lt=options['antes'])
+
+        contados = 0
+        for reporte in reportes.iterator():
+            try:
+                word_counts, firma, terminos = extraer_conteos(reporte)
+            except DocumentoFallido as e:
+                self.stderr.write(f"{reporte.nombre}: {e}")
+                continue
+            guardar_conteo_en_bd(reporte, word_counts)
+            guardar_conteos_terminos(reporte, terminos)
+            indexar_firma(reporte.pk, firma)
+            contados += 1
+        self.stdout.write(f"{contados} reporte(s) recontados.")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from Palabras.models import Cuarentena
+from Palabras.utils import reintentar_cuarentena
+
+
+class Command(BaseCommand):
+    help = "Reintenta, uno por uno, los documentos en cuarentena (todos o los ids indicados)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int)
+        parser.add_argument('--etapa', choices=[etapa for etapa, _ in Cuarentena.ETAPAS])
+
+    def handle(self, *args, **options):
+        qs = Cuarentena.objects.order_by('pk')
+        if options['ids']:
+            qs = qs.filter(pk__in=options['ids'])
+        if options['etapa']:
+            qs = qs.filter(etapa=options['etapa'])
+
+        for cuarentena in qs:
+            if reintentar_cuarentena(cuarentena):
+                self.stdout.write(f"{cuarentena.nombre}: procesado")
+            else:
+                self.stdout.write(f"{cuarentena.nombre}: sigue en cuarentena ({cuarentena.motivo})")
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from Palabras.matriz import actualizar_snapshot, directorio_por_defecto, escribir_snapshot, refrescar
+
+
+class Command(BaseCommand):
+    help = ("Escribe en disco la matriz documento-término (CSR) para cargarla con mmap. "
+            "Por defecto actualiza solo los reportes que cambiaron desde el último snapshot; "
+            "con --cada N queda en segundo plano actualizándolo cada N segundos si quedó atrás.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directorio', default=None, help="Por defecto CONTPAL_MATRIZ_DIR")
+        parser.add_argument('--completo', action='store_true', help="Regenerar todo el snapshot")
+        parser.add_argument('--cada', type=float, default=None, help="Segundos entre actualizaciones")
+
+    def handle(self, *args, **options):
+        directorio = options['directorio'] or directorio_por_defecto()
+        if options['completo']:
+            matriz = escribir_snapshot(directorio)
+        else:
+            matriz = actualizar_snapshot(directorio)
+        filas, columnas = matriz.shape
+        self.stdout.write(f"Snapshot en {directorio}: {filas} reportes x {columnas} palabras, "
+                          f"{len(matriz.data)} conteos.")
+        if options['cada']:
+            refrescar(directorio, options['cada'])
@@ -0,0 +1,317 @@
+# Palabras/matriz.py
+"""
+Snapshot en disco de la matriz documento-término (reportes x palabras) en formato CSR.
+
+Cada archivo es un .npy que se abre con mmap: varios procesos de análisis comparten
+la misma copia a través de la caché de páginas del sistema operativo.
+
+    indptr.npy       int64, filas + 1   -> la fila i ocupa indices[indptr[i]:indptr[i+1]]
+    indices.npy      int32              -> columna (posición en vocabulario.npy)
+    data.npy         int32              -> cantidad
+    reportes.npy     int64              -> id del Reporte de cada fila (ordenados)
+    vocabulario.npy  int64              -> id de Palabras de cada columna (ordenados)
+    meta.json                           -> fecha del snapshot y dimensiones
+
+Lo escribe solo manage.py snapshot_matriz (una vez o cada N segundos con --cada): los
+lectores y la ingesta no lo reescriben. Cada escritura se hace en un directorio temporal
+propio y se coloca en su sitio con un lock exclusivo entre procesos (directorio.lock).
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ConteoTotal, Ingesta, Palabras, Reporte
+
+ARCHIVOS = ('indptr', 'indices', 'data', 'reportes', 'vocabulario')
+TAMANO_LOTE = 50000
+
+
+def directorio_por_defecto():
+    return str(getattr(settings, 'CONTPAL_MATRIZ_DIR', os.path.join(settings.BASE_DIR, 'matriz')))
+
+
+class MatrizDocumentos:
+    """Matriz CSR cargada con mmap (solo lectura, sin copiar los datos)."""
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        for nombre in ARCHIVOS:
+            setattr(self, nombre, np.load(os.path.join(directorio, f'{nombre}.npy'), mmap_mode='r'))
+        with open(os.path.join(directorio, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+
+    @property
+    def shape(self):
+        return len(self.reportes), len(self.vocabulario)
+
+    def fila(self, reporte_id):
+        """(ids de palabra, cantidades) de un reporte; vacíos si no está en la matriz."""
+        i = np.searchsorted(self.reportes, reporte_id)
+        if i >= len(self.reportes) or self.reportes[i] != reporte_id:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+        inicio, fin = self.indptr[i], self.indptr[i + 1]
+        return self.vocabulario[self.indices[inicio:fin]], self.data[inicio:fin]
+
+    def totales_por_palabra(self):
+        """Suma de cada columna (cantidad total de cada palabra en el corpus)."""
+        return np.bincount(self.indices, weights=self.data, minlength=len(self.vocabulario))
+
+    def a_scipy(self):
+        """csr_matrix de SciPy sobre los mismos arrays (requiere scipy)."""
+        from scipy.sparse import csr_matrix
+        return csr_matrix((self.data, self.indices, self.indptr), shape=self.shape, copy=False)
+
+
+def cargar_snapshot(directorio=None):
+    return MatrizDocumentos(directorio or directorio_por_defecto())
+
+
+@contextmanager
+def bloqueo(directorio):
+    """Lock exclusivo entre procesos sobre el archivo directorio.lock (espera a que se libere)."""
+    os.makedirs(os.path.dirname(os.path.abspath(directorio)), exist_ok=True)
+    with open(f'{directorio}.lock', 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # Reintenta durante 10 s
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _escribir(directorio, marca, reportes, vocabulario, conteos_por_fila, nnz, bloques):
+    """
+    Escribe un snapshot completo en un directorio temporal y lo coloca en su sitio
+    con un renombrado (con el lock de bloqueo() tomado). Los procesos que tengan abierto
+    el anterior siguen leyéndolo. bloques produce tuplas (posición, indices, data) con
+    tramos de cada fila.
+    """
+    temporal = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(directorio)),
+                                prefix=f'{os.path.basename(directorio)}.')
+    os.chmod(temporal, 0o755)  # mkdtemp lo crea solo para el usuario; los lectores pueden ser otros
+    try:
+        _escribir_arrays(temporal, marca, reportes, vocabulario, conteos_por_fila, nnz, bloques)
+    except BaseException:
+        shutil.rmtree(temporal, ignore_errors=True)
+        raise
+
+    anterior = f'{temporal}.anterior'
+    if os.path.exists(directorio):
+        os.replace(directorio, anterior)
+    os.replace(temporal, directorio)
+    shutil.rmtree(anterior, ignore_errors=True)
+
+
+def _escribir_arrays(temporal, marca, reportes, vocabulario, conteos_por_fila, nnz, bloques):
+
+    indptr = np.zeros(len(reportes) + 1, dtype=np.int64)
+    np.cumsum(conteos_por_fila, out=indptr[1:])
+    np.save(os.path.join(temporal, 'indptr.npy'), indptr)
+    np.save(os.path.join(temporal, 'reportes.npy'), np.asarray(reportes, dtype=np.int64))
+    np.save(os.path.join(temporal, 'vocabulario.npy'), np.asarray(vocabulario, dtype=np.int64))
+
+    indices = np.lib.format.open_memmap(os.path.join(temporal, 'indices.npy'), mode='w+', dtype=np.int32, shape=(nnz,))
+    data = np.lib.format.open_memmap(os.path.join(temporal, 'data.npy'), mode='w+', dtype=np.int32, shape=(nnz,))
+    for posicion, bloque_indices, bloque_data in bloques:
+        indices[posicion:posicion + len(bloque_indices)] = bloque_indices
+        data[posicion:posicion + len(bloque_data)] = bloque_data
+    indices.flush()
+    data.flush()
+    del indices, data
+
+    with open(os.path.join(temporal, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'marca': marca.isoformat(), 'filas': len(reportes),
+                   'columnas': len(vocabulario), 'nnz': int(nnz)}, f)
+
+
+def _leer_conteos(qs, vocabulario, posiciones):
+    """
+    Lee los conteos ordenados por reporte y palabra, por bloques, y produce
+    tramos contiguos (posición, indices, data) según la posición de cada fila.
+    """
+    filas = qs.order_by('reporte_id', 'palabra_id').values_list('reporte_id', 'palabra_id', 'cantidad')
+    escritos = {}
+    lote = []
+
+    def tramos(lote):
+        arr = np.asarray(lote, dtype=np.int64)
+        indices = np.searchsorted(vocabulario, arr[:, 1]).astype(np.int32)
+        data = arr[:, 2].astype(np.int32)
+        ids, inicios = np.unique(arr[:, 0], return_index=True)
+        fines = np.append(inicios[1:], len(arr))
+        for reporte_id, inicio, fin in zip(ids.tolist(), inicios.tolist(), fines.tolist()):
+            posicion = posiciones[reporte_id] + escritos.get(reporte_id, 0)
+            escritos[reporte_id] = escritos.get(reporte_id, 0) + fin - inicio
+            yield posicion, indices[inicio:fin], data[inicio:fin]
+
+    for fila in filas.iterator(chunk_size=TAMANO_LOTE):
+        lote.append(fila)
+        if len(lote) >= TAMANO_LOTE:
+            yield from tramos(lote)
+            lote = []
+    if lote:
+        yield from tramos(lote)
+
+
+def _posiciones(reportes, conteos_por_fila):
+    """Posición inicial de cada reporte dentro de indices/data."""
+    inicios = np.concatenate([[0], np.cumsum(conteos_por_fila)[:-1]]) if len(reportes) else []
+    return dict(zip(np.asarray(reportes).tolist(), np.asarray(inicios, dtype=np.int64).tolist()))
+
+
+def _filas_por_reporte(qs):
+    """ids de reporte (ordenados) y número de conteos de cada uno."""
+    filas = list(qs.order_by('reporte_id').values('reporte_id').annotate(n=Count('id')).values_list('reporte_id', 'n'))
+    if not filas:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    arr = np.asarray(filas, dtype=np.int64)
+    return arr[:, 0], arr[:, 1]
+
+
+def escribir_snapshot(directorio=None):
+    """Genera el snapshot completo desde ConteoTotal. Devuelve la matriz cargada."""
+    directorio = directorio or directorio_por_defecto()
+    with bloqueo(directorio):
+        _escribir_snapshot(directorio)
+    return cargar_snapshot(directorio)
+
+
+def _escribir_snapshot(directorio):
+    marca = timezone.now()
+
+    # Una sola transacción: vocabulario, dimensiones y conteos leídos del mismo estado
+    with transaction.atomic():
+        vocabulario = np.asarray(Palabras.objects.order_by('pk').values_list('pk', flat=True), dtype=np.int64)
+        qs = ConteoTotal.objects.all()
+        reportes, conteos_por_fila = _filas_por_reporte(qs)
+        _escribir(directorio, marca, reportes, vocabulario, conteos_por_fila, int(conteos_por_fila.sum()),
+                  _leer_conteos(qs, vocabulario, _posiciones(reportes, conteos_por_fila)))
+
+
+def actualizar_snapshot(directorio=None):
+    """
+    Actualiza el snapshot leyendo de la base de datos solo los reportes cuyos conteos
+    cambiaron desde la fecha del snapshot (y quitando los eliminados). Las filas del
+    resto se copian tal cual desde el snapshot anterior. Si no existe, lo crea.
+    """
+    directorio = directorio or directorio_por_defecto()
+    with bloqueo(directorio):
+        # Dentro del lock: el snapshot anterior es el que dejó el último escritor
+        if configurado(directorio):
+            _actualizar_snapshot(directorio)
+        else:
+            _escribir_snapshot(directorio)
+    return cargar_snapshot(directorio)
+
+
+def _actualizar_snapshot(directorio):
+    anterior = cargar_snapshot(directorio)
+    marca = timezone.now()
+    desde = parse_datetime(anterior.meta['marca'])
+
+    with transaction.atomic():
+        cambiados = np.asarray(sorted(
+            Reporte.objects.filter(conteos_actualizados__gte=desde).values_list('pk', flat=True)
+        ), dtype=np.int64)
+        vigentes = np.asarray(sorted(Reporte.objects.values_list('pk', flat=True)), dtype=np.int64)
+        conservar = np.isin(anterior.reportes, vigentes) & ~np.isin(anterior.reportes, cambiados)
+        if conservar.all() and not len(cambiados):
+            # Sin cambios en los conteos: solo avanza la fecha del snapshot
+            _marcar(directorio, anterior.meta, marca)
+            return
+
+        # Vocabulario: las palabras nuevas se añaden; las columnas anteriores se reubican
+        ultima_palabra = int(anterior.vocabulario[-1]) if len(anterior.vocabulario) else 0
+        palabras_nuevas = Palabras.objects.filter(pk__gt=ultima_palabra).values_list('pk', flat=True)
+        vocabulario = np.union1d(anterior.vocabulario, np.asarray(palabras_nuevas, dtype=np.int64))
+        reubicar = np.searchsorted(vocabulario, anterior.vocabulario).astype(np.int32)
+
+        qs = ConteoTotal.objects.filter(reporte_id__in=cambiados.tolist())
+        nuevos, conteos_nuevos = _filas_por_reporte(qs)
+
+        conteos_anteriores = np.diff(anterior.indptr)
+        reportes = np.concatenate([anterior.reportes[conservar], nuevos])
+        conteos_por_fila = np.concatenate([conteos_anteriores[conservar], conteos_nuevos])
+        orden = np.argsort(reportes, kind='stable')
+        reportes, conteos_por_fila = reportes[orden], conteos_por_fila[orden]
+        posiciones = _posiciones(reportes, conteos_por_fila)
+
+        def bloques():
+            # Filas conservadas: se copian desde el snapshot anterior
+            for i in np.flatnonzero(conservar):
+                inicio, fin = anterior.indptr[i], anterior.indptr[i + 1]
+                yield (posiciones[int(anterior.reportes[i])],
+                       reubicar[anterior.indices[inicio:fin]], anterior.data[inicio:fin])
+            # Filas cambiadas: se leen de la base de datos
+            yield from _leer_conteos(qs, vocabulario, posiciones)
+
+        _escribir(directorio, marca, reportes, vocabulario, conteos_por_fila, int(conteos_por_fila.sum()), bloques())
+
+
+def _marcar(directorio, meta, marca):
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix='meta.', suffix='.json')
+    with open(descriptor, 'w', encoding='utf-8') as f:
+        json.dump(dict(meta, marca=marca.isoformat()), f)
+    os.replace(temporal, os.path.join(directorio, 'meta.json'))
+
+
+def configurado(directorio=None):
+    """Hay un snapshot en el directorio (se crea con manage.py snapshot_matriz)."""
+    return os.path.exists(os.path.join(directorio or directorio_por_defecto(), 'meta.json'))
+
+
+def al_dia(matriz):
+    ultima = Ingesta.ultima()
+    return ultima is None or parse_datetime(matriz.meta['marca']) >= ultima
+
+
+def snapshot_vigente(directorio=None):
+    """
+    El snapshot si existe y está al día con la última ingesta, o None (entonces se
+    consulta la base de datos). Es lo que lee Palabras/analitica.py; no lo reescribe.
+    """
+    directorio = directorio or directorio_por_defecto()
+    if not configurado(directorio):
+        return None
+    matriz = cargar_snapshot(directorio)
+    return matriz if al_dia(matriz) else None
+
+
+def refrescar(directorio=None, cada=60, veces=None):
+    """
+    Actualizador en segundo plano (snapshot_matriz --cada): cada `cada` segundos
+    actualiza el snapshot si quedó atrás de la última ingesta. Se detiene tras `veces` vueltas.
+    """
+    directorio = directorio or directorio_por_defecto()
+    vuelta = 0
+    while veces is None or vuelta < veces:
+        if not configurado(directorio) or not al_dia(cargar_snapshot(directorio)):
+            actualizar_snapshot(directorio)
+        vuelta += 1
+        if veces is None or vuelta < veces:
+            time.sleep(cada)
@@ -0,0 +1,235 @@
+# Palabras/metricas.py
+"""
+Métricas en memoria del proceso (contadores e histogramas) y su exposición en el
+formato de texto de Prometheus, sin dependencias externas.
+
+Cada proceso (worker) tiene sus propios valores. Lo medido dentro de los procesos
+hijo de ejecutar_con_presupuesto se envía al padre junto con el resultado y se suma
+al registro del padre (ver volcar / sumar).
+"""
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def formato_etiquetas(nombres, valores, extra=()):
+    pares = list(zip(nombres, valores)) + list(extra)
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nombre}="{escapar(valor)}"' for nombre, valor in pares) + '}'
+
+
+def formato_numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Metrica:
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.valores = {}
+        self.lock = threading.Lock()
+        REGISTRO.registrar(self)
+
+    def clave(self, etiquetas):
+        if set(etiquetas) != set(self.etiquetas):
+            raise ValueError(f"{self.nombre} requiere las etiquetas {', '.join(self.etiquetas) or '(ninguna)'}")
+        return tuple(str(etiquetas[nombre]) for nombre in self.etiquetas)
+
+    def cabecera(self):
+        return [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} {self.tipo}']
+
+
+class Contador(Metrica):
+    tipo = 'counter'
+
+    def inc(self, cantidad=1, **etiquetas):
+        clave = self.clave(etiquetas)
+        with self.lock:
+            self.valores[clave] = self.valores.get(clave, 0) + cantidad
+
+    def sumar(self, valores):
+        with self.lock:
+            for clave, valor in valores.items():
+                self.valores[clave] = self.valores.get(clave, 0) + valor
+
+    def lineas(self):
+        with self.lock:
+            valores = sorted(self.valores.items())
+        return [f'{self.nombre}{formato_etiquetas(self.etiquetas, clave)} {formato_numero(valor)}'
+                for clave, valor in valores]
+
+
+class Histograma(Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(buckets)
+
+    def observar(self, valor, **etiquetas):
+        clave = self.clave(etiquetas)
+        with self.lock:
+            # [observaciones por bucket..., suma, total]
+            datos = self.valores.setdefault(clave, [0] * len(self.buckets) + [0.0, 0])
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    datos[i] += 1
+                    break
+            datos[-2] += valor
+            datos[-1] += 1
+
+    @contextmanager
+    def temporizar(self, **etiquetas):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **etiquetas)
+
+    def sumar(self, valores):
+        with self.lock:
+            for clave, datos in valores.items():
+                actuales = self.valores.setdefault(clave, [0] * len(self.buckets) + [0.0, 0])
+                for i, valor in enumerate(datos):
+                    actuales[i] += valor
+
+    def lineas(self):
+        with self.lock:
+            valores = sorted((clave, list(datos)) for clave, datos in self.valores.items())
+        lineas = []
+        for clave, datos in valores:
+            acumulado = 0
+            for limite, cantidad in zip(self.buckets, datos):
+                acumulado += cantidad
+                le = formato_etiquetas(self.etiquetas, clave, [('le', formato_numero(float(limite)))])
+                lineas.append(f'{self.nombre}_bucket{le} {acumulado}')
+            # +Inf incluye las observaciones mayores que el último bucket: es el total
+            le = formato_etiquetas(self.etiquetas, clave, [('le', formato_numero(float('inf')))])
+            lineas.append(f'{self.nombre}_bucket{le} {datos[-1]}')
+            etiquetas = formato_etiquetas(self.etiquetas, clave)
+            lineas.append(f'{self.nombre}_sum{etiquetas} {formato_numero(float(datos[-2]))}')
+            lineas.append(f'{self.nombre}_count{etiquetas} {datos[-1]}')
+        return lineas
+
+
+class Registro:
+    def __init__(self):
+        self.metricas = {}
+        self.recolectores = []
+
+    def registrar(self, metrica):
+        self.metricas[metrica.nombre] = metrica
+
+    def recolector(self, funcion):
+        """
+        Registra una función que devuelve, al exponer las métricas, líneas de
+        indicadores (gauge) calculados en ese momento: [(nombre, ayuda, [(etiquetas, valor)])].
+        """
+        self.recolectores.append(funcion)
+        return funcion
+
+    def reiniciar(self):
+        """Vacía todas las métricas. Se usa en los procesos hijo recién creados con fork:
+        los locks se reemplazan por si otro hilo del padre tenía alguno tomado."""
+        for metrica in self.metricas.values():
+            metrica.lock = threading.Lock()
+            metrica.valores = {}
+
+    def volcar(self):
+        """Valores de todas las métricas (serializables), para enviarlos a otro proceso."""
+        volcado = {}
+        for nombre, metrica in self.metricas.items():
+            with metrica.lock:
+                if metrica.valores:
+                    volcado[nombre] = {clave: (list(v) if isinstance(v, list) else v)
+                                       for clave, v in metrica.valores.items()}
+        return volcado
+
+    def sumar(self, volcado):
+        for nombre, valores in (volcado or {}).items():
+            if nombre in self.metricas:
+                self.metricas[nombre].sumar(valores)
+
+    def exposicion(self):
+        """Todas las métricas en el formato de texto de Prometheus (versión 0.0.4)."""
+        lineas = []
+        for metrica in self.metricas.values():
+            lineas.extend(metrica.cabecera())
+            lineas.extend(metrica.lineas())
+        for funcion in self.recolectores:
+            for nombre, ayuda, valores in funcion():
+                lineas.extend([f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} gauge'])
+                for etiquetas, valor in valores:
+                    lineas.append(f'{nombre}{formato_etiquetas(etiquetas.keys(), etiquetas.values())} '
+                                  f'{formato_numero(valor)}')
+        return '\n'.join(lineas) + '\n'
+
+
+REGISTRO = Registro()
+
+
+def medir(histograma, **etiquetas):
+    """Decorador: observa en el histograma la duración de cada llamada."""
+    def decorador(funcion):
+        @wraps(funcion)
+        def medida(*args, **kwargs):
+            with histograma.temporizar(**etiquetas):
+                return funcion(*args, **kwargs)
+        return medida
+    return decorador
+
+
+# Ingesta
+DOCUMENTOS = Contador(
+    'contpal_documentos_total', 'Documentos ingresados por resultado (contado, duplicado, casi_duplicado).',
+    ['resultado'],
+)
+FALLOS = Contador('contpal_fallos_total', 'Documentos enviados a cuarentena por etapa.', ['etapa'])
+PAGINAS_OCR = Contador('contpal_paginas_ocr_total', 'Páginas procesadas con OCR por etapa.', ['etapa'])
+OCR_SEGUNDOS = Histograma(
+    'contpal_ocr_pagina_segundos', 'Duración del OCR de una página (en lotes, la del lote dividida entre sus páginas).',
+)
+OCR_CONFIANZA = Histograma(
+    'contpal_ocr_confianza', 'Confianza media (0 a 100) del OCR de cada página.', buckets=(20, 40, 60, 70, 80, 90, 95, 100),
+)
+ETAPA_SEGUNDOS = Histograma(
+    'contpal_etapa_segundos',
+    'Duración de cada etapa de la ingesta (deteccion, conversion, conteo, persistencia).',
+    ['etapa'],
+)
+
+# Peticiones del admin y de la API
+PETICION_SEGUNDOS = Histograma(
+    'contpal_peticion_segundos', 'Duración de las peticiones del admin y de la API.',
+    ['vista', 'metodo', 'estado'],
+)
+
+
+@REGISTRO.recolector
+def colas():
+    """Profundidad de las colas: cargas ZIP sin procesar y documentos en cuarentena."""
+    from django.db.models import Count
+
+    from .models import CargaZip, Cuarentena
+
+    cargas = dict(CargaZip.objects.order_by().values_list('estado').annotate(n=Count('pk')))
+    cuarentena = dict(Cuarentena.objects.order_by().values_list('etapa').annotate(n=Count('pk')))
+    return [
+        ('contpal_cargas', 'Cargas ZIP por estado.',
+         [({'estado': estado}, cargas.get(estado, 0)) for estado, _ in CargaZip.ESTADOS]),
+        ('contpal_cuarentena_documentos', 'Documentos en cuarentena por etapa.',
+         [({'etapa': etapa}, cuarentena.get(etapa, 0)) for etapa, _ in Cuarentena.ETAPAS]),
+    ]
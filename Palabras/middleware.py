@@ -0,0 +1,87 @@
+# Palabras/middleware.py
+import time
+
+from django.http import FileResponse, HttpResponse
+from django.urls import reverse
+
+from .metricas import PETICION_SEGUNDOS
+from .perfilado import perfilar, registrar_consultas, umbral_consulta_lenta
+
+# Espacios de nombres de URL cuyas peticiones se miden
+NAMESPACES_MEDIDOS = ('admin', 'palabras')
+
+
+class MetricasMiddleware:
+    """Registra la duración de las peticiones del admin y de la API por vista, método y estado."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        inicio = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        if match and match.namespace in NAMESPACES_MEDIDOS:
+            # Las respuestas en streaming se miden hasta que empieza el envío
+            PETICION_SEGUNDOS.observar(
+                time.perf_counter() - inicio,
+                vista=match.view_name, metodo=request.method, estado=f'{response.status_code // 100}xx',
+            )
+        return response
+
+
+class ConsultasLentasMiddleware:
+    """
+    Registra (logger Palabras.consultas) las consultas que superan CONTPAL_CONSULTA_LENTA_MS,
+    también las del cuerpo de las respuestas en streaming, que se generan al enviarse.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        umbral = umbral_consulta_lenta()
+        if umbral is None:
+            return self.get_response(request)
+        with registrar_consultas(umbral):
+            response = self.get_response(request)
+        # Un archivo no consulta la BD (y envolverlo impediría enviarlo con sendfile); un cuerpo
+        # asíncrono la consulta desde otros hilos, con otras conexiones: ninguno de los dos se mide
+        if response.streaming and not response.is_async and not isinstance(response, FileResponse):
+            response.streaming_content = self.medir_contenido(response.streaming_content, umbral)
+        return response
+
+    @staticmethod
+    def medir_contenido(contenido, umbral):
+        with registrar_consultas(umbral):
+            yield from contenido
+
+
+class PerfiladorMiddleware:
+    """
+    Perfila una petición del admin cuando un usuario del personal añade ?_perfil=1 a la URL.
+    El perfil y su informe se guardan en CONTPAL_PERFILES_DIR (cabecera X-Perfil con el
+    nombre); con ?_perfil=texto se devuelve directamente el informe en lugar de la página.
+    """
+    parametro = '_perfil'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        modo = request.GET.get(self.parametro)
+        if modo is None or not request.user.is_staff or not request.path.startswith(reverse('admin:index')):
+            return self.get_response(request)
+
+        # Quitar el parámetro: el changelist del admin lo tomaría como un filtro
+        request.GET = request.GET.copy()
+        del request.GET[self.parametro]
+        with perfilar(f"{request.method} {request.get_full_path()}") as resultado:
+            response = self.get_response(request)
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()  # Incluir el renderizado de la plantilla en el perfil
+
+        if modo == 'texto':
+            return HttpResponse(resultado['informe'], content_type='text/plain; charset=utf-8')
+        response['X-Perfil'] = resultado['nombre']
+        return response
@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-19 11:38
+
+import Palabras.storage
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Palabras', '0007_alter_reporte_anio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reporte',
+            name='duplicado_de',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicados', to='Palabras.reporte'),
+        ),
+        migrations.AddField(
+            model_name='reporte',
+            name='hash_contenido',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='reporte',
+            name='anio',
+            field=models.IntegerField(default=2026),
+        ),
+        migrations.AlterField(
+            model_name='reporte',
+            name='archivo',
+            field=models.FileField(blank=True, null=True, storage=Palabras.storage.almacenamiento_reportes, upload_to='reportes/'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2 on 2026-10-19 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Palabras', '0008_reporte_hash_contenido_duplicado_de'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ingesta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('actualizado', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 11:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Palabras', '0009_ingesta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reporte',
+            name='conteos_actualizados',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True),
+        ),
+    ]
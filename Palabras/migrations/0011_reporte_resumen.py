@@ -0,0 +1,46 @@
+# Generated by Django 5.2 on 2026-10-19 11:47
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def calcular_resumenes(apps, schema_editor):
+    Reporte = apps.get_model('Palabras', 'Reporte')
+    ConteoTotal = apps.get_model('Palabras', 'ConteoTotal')
+    for reporte in Reporte.objects.all():
+        origen = reporte.duplicado_de_id or reporte.pk
+        conteos = ConteoTotal.objects.filter(reporte_id=origen)
+        totales = conteos.aggregate(total=Sum('cantidad'), distintas=Count('id'))
+        reporte.resumen_top = [
+            [palabra, cantidad] for palabra, cantidad in
+            conteos.order_by('-cantidad').values_list('palabra__descripcion', 'cantidad')[:10]
+        ]
+        reporte.total_palabras = totales['total'] or 0
+        reporte.palabras_distintas = totales['distintas']
+        reporte.save(update_fields=['resumen_top', 'total_palabras', 'palabras_distintas'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Palabras', '0010_reporte_conteos_actualizados'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reporte',
+            name='palabras_distintas',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='reporte',
+            name='resumen_top',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='reporte',
+            name='total_palabras',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(calcular_resumenes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-19 11:50
+
+import Palabras.storage
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Palabras', '0011_reporte_resumen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Cuarentena',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=150)),
+                ('archivo', models.FileField(blank=True, null=True, storage=Palabras.storage.almacenamiento_reportes, upload_to='cuarentena/')),
+                ('etapa', models.CharField(choices=[('deteccion', 'Detección de año y empresa'), ('conversion', 'Conversión PDF / OCR'), ('conteo', 'Conteo de palabras')], max_length=20)),
+                ('motivo', models.TextField()),
+                ('intentos', models.PositiveIntegerField(default=1)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('reporte', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='Palabras.reporte')),
+            ],
+            options={
+                'verbose_name_plural': 'Cuarentena',
+            },
+        ),
+    ]
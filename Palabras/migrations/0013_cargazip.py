@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-19 11:51
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Palabras', '0012_cuarentena'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CargaZip',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nombre', models.CharField(max_length=255)),
+                ('tamano', models.PositiveBigIntegerField()),
+                ('sha256', models.CharField(blank=True, max_length=64)),
+                ('recibido', models.PositiveBigIntegerField(default=0)),
+                ('estado', models.CharField(choices=[('pendiente', 'Recibiendo partes'), ('completa', 'Completa, pendiente de procesar'), ('procesada', 'Procesada'), ('error', 'Error')], default='pendiente', max_length=20)),
+                ('error', models.TextField(blank=True)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Carga ZIP',
+                'verbose_name_plural': 'Cargas ZIP',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 11:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Palabras', '0013_cargazip'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='conteototal',
+            name='cantidad',
+            field=models.PositiveIntegerField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='reporte',
+            name='anio',
+            field=models.IntegerField(db_index=True, default=2026),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-19 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Palabras', '0014_indices_anio_cantidad'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reporte',
+            name='firma_minhash',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reporte',
+            name='similitud_duplicado',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='BandaLSH',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('banda', models.PositiveSmallIntegerField()),
+                ('valor', models.BigIntegerField()),
+                ('reporte', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bandas_lsh', to='Palabras.reporte')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['banda', 'valor'], name='Palabras_ba_banda_e23422_idx')],
+            },
+        ),
+    ]
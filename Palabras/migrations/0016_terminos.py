@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-19 12:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Palabras', '0015_similitud_minhash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Termino',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('descripcion', models.CharField(max_length=200, unique=True)),
+                ('activo', models.BooleanField(default=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['descripcion'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ConteoTermino',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField()),
+                ('reporte', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conteos_terminos', to='Palabras.reporte')),
+                ('termino', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Palabras.termino')),
+            ],
+            options={
+                'unique_together': {('reporte', 'termino')},
+            },
+        ),
+    ]
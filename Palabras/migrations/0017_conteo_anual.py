@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-19 12:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def calcular_conteos_anuales(apps, schema_editor):
+    # Los conteos existentes ya estaban acumulados por año en un reporte: la suma por año es el total
+    ConteoTotal = apps.get_model('Palabras', 'ConteoTotal')
+    ConteoAnual = apps.get_model('Palabras', 'ConteoAnual')
+    totales = (
+        ConteoTotal.objects.order_by().values_list('reporte__anio', 'palabra_id')
+        .annotate(total=Sum('cantidad')).iterator()
+    )
+    ConteoAnual.objects.bulk_create(
+        (ConteoAnual(anio=anio, palabra_id=palabra_id, cantidad=total) for anio, palabra_id, total in totales),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Palabras', '0016_terminos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConteoAnual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('anio', models.IntegerField()),
+                ('cantidad', models.PositiveIntegerField(db_index=True, default=0)),
+                ('palabra', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Palabras.palabras')),
+            ],
+            options={
+                'verbose_name': 'Conteo anual',
+                'verbose_name_plural': 'Conteos anuales',
+                'unique_together': {('anio', 'palabra')},
+            },
+        ),
+        migrations.RunPython(calcular_conteos_anuales, migrations.RunPython.noop),
+    ]
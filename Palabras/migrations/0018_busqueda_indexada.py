@@ -0,0 +1,70 @@
+import sqlite3
+
+from django.db import migrations
+
+# (tabla FTS, tabla del modelo, columnas). Solo SQLite; ver Palabras/busqueda.py
+TABLAS_FTS = [
+    ('palabras_busqueda', 'Palabras_palabras', ['descripcion']),
+    ('empresa_busqueda', 'Palabras_empresa', ['nombre', 'ruc']),
+]
+# Índices para buscar por prefijo sin distinguir mayúsculas (LIKE 'abc%')
+INDICES_PREFIJO = [
+    ('palabras_descripcion_nocase', 'Palabras_palabras', 'descripcion'),
+    ('empresa_nombre_nocase', 'Palabras_empresa', 'nombre'),
+    ('empresa_ruc_nocase', 'Palabras_empresa', 'ruc'),
+]
+
+
+def soportado(schema_editor):
+    # El tokenizador de trigramas de FTS5 existe desde SQLite 3.34
+    return schema_editor.connection.vendor == 'sqlite' and sqlite3.sqlite_version_info >= (3, 34)
+
+
+def crear(apps, schema_editor):
+    if not soportado(schema_editor):
+        return
+    for indice, tabla, columna in INDICES_PREFIJO:
+        schema_editor.execute(f'CREATE INDEX {indice} ON "{tabla}" ({columna} COLLATE NOCASE)')
+    for fts, tabla, columnas in TABLAS_FTS:
+        lista = ', '.join(columnas)
+        nuevos = ', '.join(f'new.{c}' for c in columnas)
+        viejos = ', '.join(f'old.{c}' for c in columnas)
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {fts} USING fts5({lista}, content='{tabla}', content_rowid='id', tokenize='trigram')"
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER {fts}_ai AFTER INSERT ON "{tabla}" BEGIN '
+            f'INSERT INTO {fts}(rowid, {lista}) VALUES (new.id, {nuevos}); END'
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER {fts}_ad AFTER DELETE ON "{tabla}" BEGIN '
+            f"INSERT INTO {fts}({fts}, rowid, {lista}) VALUES ('delete', old.id, {viejos}); END"
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER {fts}_au AFTER UPDATE ON "{tabla}" BEGIN '
+            f"INSERT INTO {fts}({fts}, rowid, {lista}) VALUES ('delete', old.id, {viejos}); "
+            f'INSERT INTO {fts}(rowid, {lista}) VALUES (new.id, {nuevos}); END'
+        )
+        schema_editor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def borrar(apps, schema_editor):
+    if not soportado(schema_editor):
+        return
+    for fts, _, _ in TABLAS_FTS:
+        for sufijo in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {fts}_{sufijo}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {fts}')
+    for indice, _, _ in INDICES_PREFIJO:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {indice}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Palabras', '0017_conteo_anual'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear, borrar),
+    ]
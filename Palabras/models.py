@@ -1,5 +1,8 @@
 from django.db import models
+import uuid
+from django.utils import timezone
 import datetime
+from .storage import almacenamiento_reportes, hash_contenido
 
 # Create your models here.
 class Provincia(models.Model):
@@ -21,22 +24,55 @@ class Empresa(models.Model):
 class Reporte(models.Model):
     nombre = models.CharField(max_length=150, editable=False)  # editable=False para que no se muestre en el admin
     empresa = models.ForeignKey(Empresa, on_delete=models.SET_NULL, null=True, blank=True)
-    archivo = models.FileField(upload_to='reportes/', blank=True, null=True)
-    anio = models.IntegerField(default=datetime.datetime.now().year)
+    archivo = models.FileField(upload_to='reportes/', storage=almacenamiento_reportes, blank=True, null=True)
+    anio = models.IntegerField(default=datetime.datetime.now().year, db_index=True)
+    hash_contenido = models.CharField(max_length=64, blank=True, default='', db_index=True, editable=False)
+    # Reporte con el mismo contenido cuyos conteos se reutilizan
+    duplicado_de = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name='duplicados', editable=False)
+    # Última vez que cambiaron los conteos guardados en este reporte
+    conteos_actualizados = models.DateTimeField(null=True, blank=True, db_index=True, editable=False)
+    # Resumen precalculado de los conteos (se actualiza junto con ellos en guardar_conteo_en_bd)
+    resumen_top = models.JSONField(default=list, blank=True, editable=False)  # [[palabra, cantidad], ...]
+    total_palabras = models.PositiveIntegerField(default=0, editable=False)
+    palabras_distintas = models.PositiveIntegerField(default=0, editable=False)
+    # Firma MinHash del texto (ver Palabras/similitud.py) y, si se marcó como casi
+    # duplicado de otro reporte, la similitud estimada con él
+    firma_minhash = models.BinaryField(null=True, blank=True, editable=False)
+    similitud_duplicado = models.FloatField(null=True, blank=True, editable=False)
 
     def save(self, *args, **kwargs):
         if not self.nombre:
             base_nombre = self.archivo.name if self.archivo else "SinArchivo"
             base_nombre = base_nombre.split('/')[-1]  # Solo el nombre del archivo
             self.nombre = base_nombre
+        if self.archivo and not self.hash_contenido:
+            self.hash_contenido = hash_contenido(self.archivo)
+            self.duplicado_de = Reporte.objects.filter(
+                hash_contenido=self.hash_contenido, duplicado_de__isnull=True
+            ).exclude(pk=self.pk).first()
+        if self.duplicado_de and self._state.adding:
+            # Un duplicado muestra el mismo resumen que su original
+            self.resumen_top = self.duplicado_de.resumen_top
+            self.total_palabras = self.duplicado_de.total_palabras
+            self.palabras_distintas = self.duplicado_de.palabras_distintas
         super().save(*args, **kwargs)
 
+    @property
+    def reporte_conteos(self):
+        """Reporte que guarda los conteos de este (el original si es un duplicado)."""
+        return self.duplicado_de or self
+
     def __str__(self):
         return self.nombre
 
     def top_palabras(self, cantidad=5):
-        conteos = self.conteototal_set.order_by('-cantidad')[:cantidad]
-        return ', '.join([f"{c.palabra.descripcion} ({c.cantidad})" for c in conteos])
+        if cantidad <= len(self.resumen_top) or len(self.resumen_top) == self.palabras_distintas:
+            conteos = self.resumen_top[:cantidad]
+        else:
+            from .cache import conteos_reporte
+            conteos = conteos_reporte(self.pk)[:cantidad]
+        return ', '.join([f"{palabra} ({n})" for palabra, n in conteos])
 
     top_palabras.short_description = "Top palabras"
 
@@ -49,9 +85,10 @@ class Palabras(models.Model):
     
 
 class ConteoTotal(models.Model):
+    """Conteo de una palabra en un reporte (los duplicados usan los de su original)."""
     reporte = models.ForeignKey(Reporte, on_delete=models.CASCADE)
     palabra = models.ForeignKey(Palabras, on_delete=models.CASCADE)
-    cantidad = models.PositiveIntegerField()
+    cantidad = models.PositiveIntegerField(db_index=True)  # El admin ordena por cantidad
 
     class Meta:
         unique_together = ('reporte', 'palabra')  # Opcional, evita duplicados
@@ -59,3 +96,138 @@ class ConteoTotal(models.Model):
     def __str__(self):
         return f"{self.palabra.descripcion} ({self.cantidad}) en {self.reporte}"
 
+
+class ConteoAnual(models.Model):
+    """
+    Total de una palabra en los reportes de un año. Solo se modifica con sumas hechas
+    por la base de datos (ver sumar_conteos_anuales en Palabras/utils.py); las filas en 0
+    se conservan y no cuentan como apariciones.
+    """
+    anio = models.IntegerField()
+    palabra = models.ForeignKey(Palabras, on_delete=models.CASCADE)
+    cantidad = models.PositiveIntegerField(default=0, db_index=True)
+
+    class Meta:
+        verbose_name = 'Conteo anual'
+        verbose_name_plural = 'Conteos anuales'
+        unique_together = ('anio', 'palabra')
+
+    def __str__(self):
+        return f"{self.palabra.descripcion} ({self.cantidad}) en {self.anio}"
+
+
+class BandaLSH(models.Model):
+    """Hash de una banda de la firma MinHash de un reporte (índice LSH de similitud)."""
+    reporte = models.ForeignKey(Reporte, on_delete=models.CASCADE, related_name='bandas_lsh')
+    banda = models.PositiveSmallIntegerField()
+    valor = models.BigIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['banda', 'valor'])]
+
+    def __str__(self):
+        return f"{self.reporte_id}: banda {self.banda}"
+
+
+class Termino(models.Model):
+    """Término contable de la lista de vigilancia; puede tener varias palabras (ver Palabras/terminos.py)."""
+    descripcion = models.CharField(max_length=200, unique=True)
+    activo = models.BooleanField(default=True)
+    actualizado = models.DateTimeField(auto_now=True)  # Invalida el autómata compilado
+
+    class Meta:
+        ordering = ['descripcion']
+
+    def __str__(self):
+        return self.descripcion
+
+
+class ConteoTermino(models.Model):
+    reporte = models.ForeignKey(Reporte, on_delete=models.CASCADE, related_name='conteos_terminos')
+    termino = models.ForeignKey(Termino, on_delete=models.CASCADE)
+    cantidad = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('reporte', 'termino')
+
+    def __str__(self):
+        return f"{self.termino.descripcion} ({self.cantidad}) en {self.reporte}"
+
+
+class Ingesta(models.Model):
+    """
+    Fila única con la fecha de la última modificación de los conteos.
+    Sirve para validar cachés (ETag / Last-Modified) sin recalcular nada.
+    """
+    actualizado = models.DateTimeField()
+
+    @classmethod
+    def marcar(cls):
+        cls.objects.update_or_create(pk=1, defaults={'actualizado': timezone.now()})
+
+    @classmethod
+    def ultima(cls):
+        ingesta = cls.objects.filter(pk=1).first()
+        return ingesta.actualizado if ingesta else None
+
+    def __str__(self):
+        return f"Última ingesta: {self.actualizado}"
+
+
+class Cuarentena(models.Model):
+    """Documento que falló o excedió su presupuesto de tiempo/memoria al procesarse."""
+    ETAPA_DETECCION = 'deteccion'
+    ETAPA_CONVERSION = 'conversion'
+    ETAPA_CONTEO = 'conteo'
+    ETAPAS = [
+        (ETAPA_DETECCION, 'Detección de año y empresa'),
+        (ETAPA_CONVERSION, 'Conversión PDF / OCR'),
+        (ETAPA_CONTEO, 'Conteo de palabras'),
+    ]
+
+    nombre = models.CharField(max_length=150)
+    # Archivo original si todavía no tiene Reporte (falló antes de crearlo)
+    archivo = models.FileField(upload_to='cuarentena/', storage=almacenamiento_reportes, blank=True, null=True)
+    reporte = models.ForeignKey(Reporte, on_delete=models.CASCADE, null=True, blank=True)
+    etapa = models.CharField(max_length=20, choices=ETAPAS)
+    motivo = models.TextField()
+    intentos = models.PositiveIntegerField(default=1)
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'Cuarentena'
+
+    def __str__(self):
+        return f"{self.nombre} ({self.get_etapa_display()})"
+
+
+class CargaZip(models.Model):
+    """Carga de un ZIP por partes (ver Palabras/cargas.py)."""
+    ESTADO_PENDIENTE = 'pendiente'
+    ESTADO_COMPLETA = 'completa'
+    ESTADO_PROCESADA = 'procesada'
+    ESTADO_ERROR = 'error'
+    ESTADOS = [
+        (ESTADO_PENDIENTE, 'Recibiendo partes'),
+        (ESTADO_COMPLETA, 'Completa, pendiente de procesar'),
+        (ESTADO_PROCESADA, 'Procesada'),
+        (ESTADO_ERROR, 'Error'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    nombre = models.CharField(max_length=255)
+    tamano = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)
+    recibido = models.PositiveBigIntegerField(default=0)  # Bytes contiguos recibidos desde el inicio
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=ESTADO_PENDIENTE)
+    error = models.TextField(blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Carga ZIP'
+        verbose_name_plural = 'Cargas ZIP'
+
+    def __str__(self):
+        return f"{self.nombre} ({self.recibido}/{self.tamano} bytes)"
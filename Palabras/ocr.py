@@ -0,0 +1,176 @@
+# Palabras/ocr.py
+"""
+OCR de páginas escaneadas con un grupo de trabajadores que se reutilizan entre páginas.
+
+pytesseract lanza un proceso de tesseract por imagen, que vuelve a cargar el modelo de
+idioma y escribe la imagen en un archivo temporal. Aquí las páginas llegan como imágenes
+en memoria y se reparten en lotes entre CONTPAL_OCR_TRABAJADORES hilos:
+
+- con tesserocr instalado, cada hilo mantiene su propio motor de Tesseract con el modelo
+  cargado mientras viva el proceso, y las imágenes no pasan por disco;
+- sin tesserocr, cada lote se reconoce con una sola ejecución de tesseract (una lista
+  de imágenes), de modo que el arranque y la carga del modelo se pagan por lote y no
+  por página.
+
+Cada página devuelve (texto, confianza media de sus palabras, de 0 a 100).
+
+Durante la ingesta el OCR corre en el proceso hijo de cada etapa (Palabras/presupuesto.py),
+así que el grupo dura lo que dura un documento: con tesserocr (opcional, en
+requirements-ocr.txt) cada trabajador carga el modelo una vez por documento; sin
+tesserocr, una vez por lote.
+"""
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import TemporaryDirectory
+
+from django.conf import settings
+
+IDIOMA = 'spa'
+DPI = 200
+
+
+def trabajadores_ocr():
+    return getattr(settings, 'CONTPAL_OCR_TRABAJADORES', None) or min(4, os.cpu_count() or 1)
+
+
+def paginas_por_lote():
+    return getattr(settings, 'CONTPAL_OCR_PAGINAS_POR_LOTE', 8)
+
+
+def comando_tesseract():
+    """Ejecutable de tesseract (el configurado para pytesseract, si lo hay)."""
+    try:
+        import pytesseract
+        return pytesseract.pytesseract.tesseract_cmd
+    except ImportError:
+        return 'tesseract'
+
+
+def imagen_pagina(page, dpi=DPI):
+    """Página de PyMuPDF renderizada en memoria, en escala de grises."""
+    import fitz
+    from PIL import Image
+
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    return Image.frombytes('L', (pix.width, pix.height), pix.samples)
+
+
+def texto_tsv(tsv):
+    """
+    Texto y confianza de cada página de la salida TSV de tesseract:
+    {número de página: (texto, confianza)}. Las líneas se separan con saltos de
+    línea y los párrafos con una línea en blanco, como en la salida de texto.
+    """
+    paginas = {}
+    for fila in tsv.splitlines()[1:]:
+        campos = fila.split('\t')
+        if len(campos) < 12 or campos[0] != '5':  # Nivel 5: palabra
+            continue
+        pagina, bloque, parrafo, linea = (int(c) for c in campos[1:5])
+        palabra, confianza = campos[11].strip(), float(campos[10])
+        if not palabra:
+            continue
+        lineas, confianzas = paginas.setdefault(pagina, ({}, []))
+        lineas.setdefault((bloque, parrafo), {}).setdefault(linea, []).append(palabra)
+        if confianza >= 0:
+            confianzas.append(confianza)
+
+    resultado = {}
+    for pagina, (parrafos, confianzas) in paginas.items():
+        texto = '\n\n'.join(
+            '\n'.join(' '.join(palabras) for _, palabras in sorted(lineas.items()))
+            for _, lineas in sorted(parrafos.items())
+        )
+        resultado[pagina] = (texto, sum(confianzas) / len(confianzas) if confianzas else 0.0)
+    return resultado
+
+
+def reconocer_lote_cli(imagenes):
+    """Una sola ejecución de tesseract para todo el lote (lista de imágenes)."""
+    with TemporaryDirectory() as tmpdir:
+        rutas = []
+        for i, imagen in enumerate(imagenes):
+            ruta = os.path.join(tmpdir, f'{i:05d}.png')
+            imagen.save(ruta)
+            rutas.append(ruta)
+        lista = os.path.join(tmpdir, 'paginas.txt')
+        with open(lista, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(rutas) + '\n')
+
+        # Un hilo de OpenMP por proceso: el paralelismo lo dan los trabajadores
+        entorno = dict(os.environ, OMP_THREAD_LIMIT='1')
+        proceso = subprocess.run(
+            [comando_tesseract(), lista, 'stdout', '-l', IDIOMA, 'tsv'],
+            capture_output=True, env=entorno,
+        )
+    if proceso.returncode != 0:
+        error = proceso.stderr.decode('utf-8', errors='replace').strip()
+        raise RuntimeError(f"tesseract terminó con código {proceso.returncode}: {error}")
+    paginas = texto_tsv(proceso.stdout.decode('utf-8', errors='replace'))
+    return [paginas.get(i + 1, ('', 0.0)) for i in range(len(imagenes))]
+
+
+class GrupoOCR:
+    """Trabajadores de OCR del proceso; reconocer() reparte las imágenes en lotes entre ellos."""
+
+    def __init__(self, trabajadores=None, lote=None):
+        self.trabajadores = trabajadores or trabajadores_ocr()
+        self.lote = lote or paginas_por_lote()
+        self.ejecutor = ThreadPoolExecutor(self.trabajadores, thread_name_prefix='ocr')
+        self.local = threading.local()
+        try:
+            import tesserocr  # noqa: F401
+            self.persistente = True
+        except ImportError:
+            self.persistente = False
+
+    def motor(self):
+        """Motor de tesserocr del hilo actual, creado (y el modelo cargado) una sola vez."""
+        if getattr(self.local, 'motor', None) is None:
+            import tesserocr
+            self.local.motor = tesserocr.PyTessBaseAPI(lang=IDIOMA)
+        return self.local.motor
+
+    def reconocer_lote(self, imagenes):
+        if not self.persistente:
+            return reconocer_lote_cli(imagenes)
+        motor = self.motor()
+        resultado = []
+        for imagen in imagenes:
+            motor.SetImage(imagen)
+            resultado.append((motor.GetUTF8Text(), float(motor.MeanTextConf())))
+        return resultado
+
+    def reconocer(self, imagenes):
+        """Lista de (texto, confianza) en el mismo orden que imagenes."""
+        lotes = [imagenes[i:i + self.lote] for i in range(0, len(imagenes), self.lote)]
+        if len(lotes) == 1:
+            return self.reconocer_lote(lotes[0])
+        return [pagina for resultado in self.ejecutor.map(self.reconocer_lote, lotes) for pagina in resultado]
+
+    def cerrar(self):
+        self.ejecutor.shutdown(wait=False)
+
+
+_grupo = {'grupo': None}
+_lock = threading.Lock()
+
+
+def grupo_ocr():
+    """Grupo de trabajadores del proceso (se crea la primera vez que se usa)."""
+    with _lock:
+        if _grupo['grupo'] is None:
+            _grupo['grupo'] = GrupoOCR()
+        return _grupo['grupo']
+
+
+def _despues_de_fork():
+    # Los hilos no sobreviven a fork: el proceso hijo crea su propio grupo si lo necesita
+    global _lock
+    _lock = threading.Lock()
+    _grupo['grupo'] = None
+
+
+os.register_at_fork(after_in_child=_despues_de_fork)
@@ -0,0 +1,196 @@
+# Palabras/paginacion.py
+"""
+Paginación por clave (keyset) para las listas grandes del admin.
+
+La paginación por defecto cuenta todas las filas filtradas (COUNT(*)) y salta a cada
+página con OFFSET, así que las páginas profundas cuestan cada vez más. Aquí cada página
+continúa desde la última fila de la anterior: el enlace "Siguiente" lleva en la URL los
+valores de las columnas de ordenamiento de esa fila y la consulta filtra
+`(cantidad, id) < (c, i)` con LIMIT, lo que recorre el índice desde ese punto sin importar
+la profundidad. El total se cuenta exactamente hasta CONTPAL_ADMIN_TOTAL_EXACTO filas;
+por encima se estima (filas de la tabla sin filtros, o "más de N" con filtros).
+
+Solo se aplica si el ordenamiento usa columnas propias no nulas (el admin agrega el pk
+para que sea total); con otro ordenamiento, o con list_editable, la lista se pagina como
+siempre.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import AutoField, BigAutoField, F, Max, Q, SmallAutoField
+from django.db.models.expressions import OrderBy
+
+DESPUES_VAR = 'despues'
+ANTES_VAR = 'antes'
+CURSOR_VARS = (DESPUES_VAR, ANTES_VAR)
+
+
+def total_exacto_maximo():
+    return getattr(settings, 'CONTPAL_ADMIN_TOTAL_EXACTO', 10000)
+
+
+def codificar_cursor(valores):
+    datos = json.dumps(valores, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(datos.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor, columnas):
+    """Valores del cursor convertidos al tipo de cada columna; ValueError si no es válido."""
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Cursor inválido: {cursor!r}") from e
+    if not isinstance(valores, list) or len(valores) != len(columnas):
+        raise ValueError(f"Cursor inválido: {cursor!r}")
+    try:
+        return [campo.to_python(valor) for (campo, _), valor in zip(columnas, valores)]
+    except ValidationError as e:
+        raise ValueError(f"Cursor inválido: {cursor!r}") from e
+
+
+def filas_estimadas(modelo):
+    """Filas de la tabla sin contarlas: estadísticas de PostgreSQL o el mayor id autoincremental."""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            # Con comillas: regclass pasa a minúsculas los nombres sin ellas (Palabras_conteototal)
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                           [connection.ops.quote_name(modelo._meta.db_table)])
+            fila = cursor.fetchone()
+        if fila and fila[0] >= 0:
+            return int(fila[0])
+    if isinstance(modelo._meta.pk, (AutoField, BigAutoField, SmallAutoField)):
+        return modelo._default_manager.aggregate(maximo=Max('pk'))['maximo']
+    return None
+
+
+def estimar_total(queryset):
+    """
+    (total, precision). Cuenta hasta total_exacto_maximo() filas ('exacto'); si hay más,
+    estima el tamaño de la tabla cuando el queryset no tiene filtros ('estimado') y, si no,
+    devuelve el máximo contado ('minimo': hay más de esas filas).
+    """
+    maximo = total_exacto_maximo()
+    total = queryset.order_by()[:maximo + 1].count()
+    if total <= maximo:
+        return total, 'exacto'
+    if not queryset.query.where:
+        estimado = filas_estimadas(queryset.model)
+        if estimado:
+            return max(estimado, total), 'estimado'
+    return maximo, 'minimo'
+
+
+def siguientes(columnas, valores, antes=False):
+    """Filtro de las filas que siguen (o preceden, con antes=True) a `valores` en el ordenamiento."""
+    def operador(descendente):
+        return 'gt' if descendente == antes else 'lt'
+
+    filtro = Q()
+    iguales = Q()
+    for (campo, descendente), valor in zip(columnas, valores):
+        filtro |= iguales & Q(**{f'{campo.attname}__{operador(descendente)}': valor})
+        iguales &= Q(**{campo.attname: valor})
+    # Cota redundante sobre la primera columna: la base de datos busca el punto de partida en su índice
+    campo, descendente = columnas[0]
+    return Q(**{f'{campo.attname}__{operador(descendente)}e': valores[0]}) & filtro
+
+
+class ChangeListKeyset(ChangeList):
+    """ChangeList que pagina por clave cuando el ordenamiento lo permite (ver el módulo)."""
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        for var in CURSOR_VARS:
+            lookup_params.pop(var, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Cambiar filtros u ordenamiento vuelve a la primera página
+        remove = [*(remove or ()), *(var for var in CURSOR_VARS if var not in (new_params or {}))]
+        return super().get_query_string(new_params, remove)
+
+    def columnas_keyset(self):
+        """[(campo, descendente)] del ordenamiento del queryset, o None si no admite keyset."""
+        columnas = []
+        for parte in self.queryset.query.order_by:
+            if isinstance(parte, str):
+                nombre, descendente = parte.lstrip('-'), parte.startswith('-')
+            elif isinstance(parte, OrderBy) and isinstance(parte.expression, F) and not (
+                    parte.nulls_first or parte.nulls_last):
+                nombre, descendente = parte.expression.name, parte.descending
+            else:
+                return None
+            try:
+                campo = self.lookup_opts.pk if nombre == 'pk' else self.lookup_opts.get_field(nombre)
+            except FieldDoesNotExist:
+                return None  # Campo de otro modelo (empresa__nombre) o anotación
+            if not campo.concrete or campo.null:
+                return None
+            # Una relación por su nombre se ordena según el modelo relacionado
+            if campo.is_relation and nombre == campo.name and campo.related_model._meta.ordering:
+                return None
+            columnas.append((campo, descendente))
+        return columnas or None
+
+    def get_results(self, request):
+        columnas = None if self.list_editable else self.columnas_keyset()
+        self.keyset = columnas is not None
+        if not self.keyset:
+            return super().get_results(request)
+
+        despues = self.params.get(DESPUES_VAR)
+        antes = self.params.get(ANTES_VAR)
+        queryset = self.queryset
+        try:
+            if antes:
+                invertido = [
+                    (F(campo.attname).asc() if descendente else F(campo.attname).desc())
+                    for campo, descendente in columnas
+                ]
+                queryset = queryset.filter(siguientes(columnas, decodificar_cursor(antes, columnas), antes=True))
+                queryset = queryset.order_by(*invertido)
+            elif despues:
+                queryset = queryset.filter(siguientes(columnas, decodificar_cursor(despues, columnas)))
+        except ValueError:
+            raise IncorrectLookupParameters
+
+        # Una fila de más indica si hay otra página en esa dirección
+        filas = list(queryset[:self.list_per_page + 1])
+        hay_mas = len(filas) > self.list_per_page
+        filas = filas[:self.list_per_page]
+        if antes:
+            filas.reverse()
+            hay_anterior, hay_siguiente = hay_mas, True
+        else:
+            hay_anterior, hay_siguiente = bool(despues), hay_mas
+
+        cursor = lambda fila: codificar_cursor([getattr(fila, campo.attname) for campo, _ in columnas])
+        self.url_primera = self.get_query_string() if hay_anterior else None
+        self.url_anterior = self.get_query_string({ANTES_VAR: cursor(filas[0])}) if hay_anterior and filas else None
+        self.url_siguiente = self.get_query_string({DESPUES_VAR: cursor(filas[-1])}) if hay_siguiente and filas else None
+
+        self.result_count, self.precision_total = estimar_total(self.queryset)
+        self.show_full_result_count = False
+        self.full_result_count = None
+        self.show_admin_actions = True
+        self.result_list = filas
+        self.can_show_all = False
+        self.multi_page = bool(self.url_anterior or self.url_siguiente)
+        self.paginator = None
+
+
+class PaginacionKeysetMixin:
+    """
+    ModelAdmin con paginación por clave y total estimado. Su plantilla de lista debe
+    extender admin/keyset_change_list.html.
+    """
+    show_full_result_count = False  # Evita contar la tabla completa en cada página
+
+    def get_changelist(self, request, **kwargs):
+        return ChangeListKeyset
@@ -0,0 +1,136 @@
+# Palabras/perfilado.py
+"""
+Diagnóstico de rendimiento: registro de consultas lentas con el lugar del código que
+las originó y perfilado de una petición con cProfile (ver Palabras/middleware.py).
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+import traceback
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+logger = logging.getLogger('Palabras.consultas')
+
+# Marcos de la pila que no son "código del proyecto"
+RUTAS_EXCLUIDAS = (
+    os.sep + 'site-packages' + os.sep,
+    __file__,
+    os.path.join(os.path.dirname(__file__), 'middleware.py'),
+)
+RUTA_ORM = os.path.join('django', 'db', '')
+
+
+def umbral_consulta_lenta():
+    """Milisegundos a partir de los cuales se registra una consulta (None lo desactiva)."""
+    return getattr(settings, 'CONTPAL_CONSULTA_LENTA_MS', 200)
+
+
+def origen_consulta():
+    """
+    'archivo:línea en función' del marco más interno del proyecto que lanzó la consulta;
+    si no hay ninguno (p. ej. consultas propias del admin), el más interno fuera del ORM.
+    """
+    base = str(settings.BASE_DIR)
+    pila = [marco for marco in reversed(traceback.extract_stack())
+            if not any(marco.filename.endswith(r) for r in RUTAS_EXCLUIDAS[1:])]
+    for marco in pila:
+        if marco.filename.startswith(base) and RUTAS_EXCLUIDAS[0] not in marco.filename:
+            return f"{os.path.relpath(marco.filename, base)}:{marco.lineno} en {marco.name}"
+    for marco in pila:
+        if RUTA_ORM not in marco.filename:
+            return f"{marco.filename}:{marco.lineno} en {marco.name}"
+    return "(desconocido)"
+
+
+class RegistroConsultas:
+    """execute_wrapper que mide cada consulta, guarda un resumen y avisa de las lentas."""
+
+    def __init__(self, umbral_ms=None, guardar=False):
+        self.umbral_ms = umbral_ms
+        self.guardar = guardar
+        self.consultas = []  # (milisegundos, sql, origen)
+        self.total = 0
+        self.milisegundos = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ms = (time.perf_counter() - inicio) * 1000
+            self.total += 1
+            self.milisegundos += ms
+            lenta = self.umbral_ms is not None and ms >= self.umbral_ms
+            if lenta or self.guardar:
+                origen = origen_consulta()
+                if lenta:
+                    logger.warning("Consulta lenta (%.1f ms) desde %s: %s", ms, origen, sql[:2000])
+                if self.guardar:
+                    self.consultas.append((ms, sql, origen))
+
+
+@contextmanager
+def registrar_consultas(umbral_ms=None, guardar=False):
+    """Mide las consultas del bloque (en la conexión por defecto) y registra las lentas."""
+    registro = RegistroConsultas(umbral_ms, guardar)
+    with connection.execute_wrapper(registro):
+        yield registro
+
+
+def directorio_perfiles():
+    directorio = str(getattr(settings, 'CONTPAL_PERFILES_DIR', os.path.join(settings.BASE_DIR, 'perfiles')))
+    os.makedirs(directorio, exist_ok=True)
+    return directorio
+
+
+def informe_perfil(perfil, registro, titulo, limite=40):
+    """Informe de texto: funciones por tiempo acumulado y consultas agrupadas por origen."""
+    salida = io.StringIO()
+    salida.write(f"{titulo}\n\n")
+    salida.write(f"Consultas: {registro.total} en {registro.milisegundos:.1f} ms\n\n")
+
+    por_origen = {}
+    for ms, sql, origen in registro.consultas:
+        cantidad, total = por_origen.get((origen, sql), (0, 0.0))
+        por_origen[(origen, sql)] = (cantidad + 1, total + ms)
+    salida.write("Consultas por origen (la misma consulta repetida suele ser un N+1):\n")
+    for (origen, sql), (cantidad, total) in sorted(por_origen.items(), key=lambda par: -par[1][1]):
+        salida.write(f"  {cantidad:5d} x {total:9.1f} ms  {origen}\n           {sql[:200]}\n")
+
+    salida.write("\n")
+    estadisticas = pstats.Stats(perfil, stream=salida)
+    estadisticas.sort_stats('cumulative').print_stats(limite)
+    return salida.getvalue()
+
+
+@contextmanager
+def perfilar(titulo):
+    """
+    Perfila el bloque con cProfile y captura sus consultas. Al salir guarda en
+    CONTPAL_PERFILES_DIR el perfil (.prof, para snakeviz o pstats) y el informe (.txt);
+    el resultado queda en resultado['nombre'] y resultado['informe'].
+    """
+    resultado = {}
+    perfil = cProfile.Profile()
+    # Las consultas lentas ya las registra ConsultasLentasMiddleware
+    with registrar_consultas(guardar=True) as registro:
+        perfil.enable()
+        try:
+            yield resultado
+        finally:
+            perfil.disable()
+
+    nombre = timezone.now().strftime('%Y%m%d-%H%M%S-%f')
+    directorio = directorio_perfiles()
+    perfil.dump_stats(os.path.join(directorio, f'{nombre}.prof'))
+    informe = informe_perfil(perfil, registro, titulo)
+    with open(os.path.join(directorio, f'{nombre}.txt'), 'w', encoding='utf-8') as f:
+        f.write(informe)
+    resultado.update(nombre=nombre, informe=informe)
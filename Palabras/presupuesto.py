@@ -0,0 +1,137 @@
+# Palabras/presupuesto.py
+"""
+Ejecución de una etapa del procesamiento de un documento con un presupuesto
+de tiempo y memoria, en un proceso hijo que se puede terminar si se excede.
+
+La memoria que se limita es el crecimiento de la memoria residente (RSS) del hijo
+respecto del proceso que lo crea, medida cada INTERVALO_MEMORIA segundos en /proc.
+No se usa RLIMIT_AS: cuenta el espacio de direcciones virtual (arenas de malloc,
+archivos mapeados, reservas de numpy), que en documentos grandes legítimos supera
+con mucho la memoria realmente usada. Sin /proc (p. ej. macOS) solo se limita el tiempo.
+"""
+import multiprocessing
+import os
+import time
+
+from django.conf import settings
+
+from .metricas import REGISTRO
+
+
+class DocumentoFallido(Exception):
+    """Un documento no se pudo procesar (error, tiempo o memoria excedidos)."""
+
+    def __init__(self, etapa, motivo):
+        super().__init__(f"{etapa}: {motivo}")
+        self.etapa = etapa
+        self.motivo = motivo
+
+
+def presupuesto_segundos():
+    return getattr(settings, 'CONTPAL_PRESUPUESTO_SEGUNDOS', None)
+
+
+def presupuesto_memoria_mb():
+    return getattr(settings, 'CONTPAL_PRESUPUESTO_MEMORIA_MB', None)
+
+
+# Segundos entre mediciones de la memoria del proceso hijo
+INTERVALO_MEMORIA = 0.1
+
+
+def memoria_residente_mb(pid):
+    """Memoria residente (RSS) del proceso en MB según /proc, o None si no se puede leer."""
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            paginas = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return paginas * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+def _hijo(conexion, funcion, args):
+    # Las métricas del hijo empiezan en cero y se envían al padre con el resultado
+    REGISTRO.reiniciar()
+    try:
+        conexion.send(('ok', funcion(*args), REGISTRO.volcar()))
+    except MemoryError:
+        conexion.send(('error', "Memoria insuficiente (MemoryError)", REGISTRO.volcar()))
+    except Exception as e:
+        conexion.send(('error', f"{type(e).__name__}: {e}", REGISTRO.volcar()))
+    finally:
+        conexion.close()
+
+
+def ejecutar_con_presupuesto(etapa, funcion, *args, segundos=None, memoria_mb=None):
+    """
+    Ejecuta funcion(*args) en un proceso hijo con un límite de segundos y de memoria
+    (por defecto CONTPAL_PRESUPUESTO_SEGUNDOS y CONTPAL_PRESUPUESTO_MEMORIA_MB, ver el
+    módulo) y devuelve su resultado. Si falla o excede el presupuesto lanza DocumentoFallido.
+
+    La función no debe usar la base de datos. Sin presupuesto configurado, o donde
+    no se puede usar fork (Windows), se ejecuta en el mismo proceso.
+    """
+    segundos = presupuesto_segundos() if segundos is None else segundos
+    memoria_mb = presupuesto_memoria_mb() if memoria_mb is None else memoria_mb
+
+    if not (segundos or memoria_mb) or 'fork' not in multiprocessing.get_all_start_methods():
+        try:
+            return funcion(*args)
+        except Exception as e:
+            raise DocumentoFallido(etapa, f"{type(e).__name__}: {e}") from e
+
+    contexto = multiprocessing.get_context('fork')
+    receptor, emisor = contexto.Pipe(duplex=False)
+    # El hijo comparte al nacer la memoria residente de este proceso: solo cuenta lo que crece
+    base_mb = memoria_residente_mb(os.getpid()) if memoria_mb else None
+    proceso = contexto.Process(target=_hijo, args=(emisor, funcion, args), daemon=True)
+    proceso.start()
+    emisor.close()
+
+    limite = time.monotonic() + segundos if segundos else None
+    try:
+        while True:
+            espera = INTERVALO_MEMORIA if base_mb is not None else None
+            if limite is not None:
+                restante = max(limite - time.monotonic(), 0)
+                espera = restante if espera is None else min(espera, restante)
+            if receptor.poll(espera):
+                break
+            if limite is not None and time.monotonic() >= limite:
+                raise DocumentoFallido(etapa, f"Tiempo excedido ({segundos} s)")
+            usada = memoria_residente_mb(proceso.pid)
+            if usada is not None and usada - base_mb > memoria_mb:
+                raise DocumentoFallido(etapa, f"Memoria excedida ({memoria_mb} MB)")
+        estado, resultado, metricas = receptor.recv()
+        REGISTRO.sumar(metricas)
+    except EOFError:
+        proceso.join()
+        raise DocumentoFallido(etapa, f"El proceso terminó inesperadamente (código {proceso.exitcode})")
+    finally:
+        receptor.close()
+        if proceso.is_alive():
+            proceso.terminate()
+            proceso.join(5)
+            if proceso.is_alive():
+                proceso.kill()
+        proceso.join()
+
+    if estado == 'error':
+        raise DocumentoFallido(etapa, resultado)
+    return resultado
+
+
+class Plazo:
+    """Presupuesto de tiempo total de un documento repartido entre varias etapas."""
+
+    def __init__(self, segundos=None):
+        self.segundos = presupuesto_segundos() if segundos is None else segundos
+        self.inicio = time.monotonic()
+
+    def restante(self, etapa):
+        if not self.segundos:
+            return 0
+        restante = self.segundos - (time.monotonic() - self.inicio)
+        if restante <= 0:
+            raise DocumentoFallido(etapa, f"Tiempo excedido ({self.segundos} s)")
+        return restante
@@ -1,20 +1,39 @@
 # Palabras/signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from .models import Reporte
-from .utils import count_frequent_words, guardar_conteo_en_bd, pdf_to_docx
-import os
-from django.conf import settings
+from .models import Reporte, Ingesta
+from .cache import invalidar_reportes
+from .metricas import DOCUMENTOS
+from .presupuesto import DocumentoFallido
+from .utils import contar_reporte, descontar_conteos_anuales, poner_en_cuarentena, promover_duplicado
 
 @receiver(post_save, sender=Reporte)
 def procesar_reporte(sender, instance, created, **kwargs):
     if created and instance.archivo:
-        # Obtener la ruta completa del archivo
-        pdf_path = os.path.join(settings.MEDIA_ROOT, instance.archivo.name)
-        doc_path = pdf_to_docx(pdf_path, r'C:\Users\USUARIO\Downloads\Prácticas\Programa\Contpal\media\Docxs')
+        # Contenido ya procesado en otro reporte: se reutilizan sus conteos
+        if instance.duplicado_de_id:
+            DOCUMENTOS.inc(resultado='duplicado')
+            return
 
-        # Procesar el archivo y contar palabras
-        word_counts = count_frequent_words([doc_path])
-        
-        # Guardar en base de datos
-        guardar_conteo_en_bd(instance, word_counts)
+        # Convertir, contar palabras y guardar en base de datos (con presupuesto)
+        try:
+            contar_reporte(instance)
+        except DocumentoFallido as e:
+            print(f"Error al procesar {instance.nombre}: {e}")
+            poner_en_cuarentena(instance.nombre, e, reporte=instance)
+
+
+@receiver(pre_delete, sender=Reporte)
+def descontar_conteos(sender, instance, **kwargs):
+    # Antes de que se borren sus conteos (en cascada), se restan de los totales del año
+    descontar_conteos_anuales(instance)
+    # Sus duplicados no tienen conteos propios: uno de ellos pasa a ser el original
+    promover_duplicado(instance)
+
+
+@receiver(post_save, sender=Reporte)
+@receiver(post_delete, sender=Reporte)
+def marcar_ingesta(sender, instance, **kwargs):
+    # Cambió un reporte (año, empresa o se eliminó): los agregados ya no son los mismos
+    Ingesta.marcar()
+    invalidar_reportes([instance.pk], anios=True)
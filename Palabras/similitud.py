@@ -0,0 +1,118 @@
+# Palabras/similitud.py
+"""
+Detección de reportes casi duplicados con MinHash y LSH.
+
+La firma de un documento son los mínimos de NUM_PERMUTACIONES funciones hash sobre sus
+shingles (TAMANO_SHINGLE palabras seguidas); la fracción de mínimos iguales entre dos
+firmas estima la similitud de Jaccard de sus shingles. La firma se divide en BANDAS de
+FILAS valores y cada banda se guarda como un hash en BandaLSH: dos reportes son
+candidatos si coinciden en alguna banda, lo que se busca por índice, sin recorrer el archivo.
+"""
+import hashlib
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+
+from .models import BandaLSH, Reporte
+
+NUM_PERMUTACIONES = 128
+BANDAS = 16
+FILAS = NUM_PERMUTACIONES // BANDAS  # Umbral aproximado de LSH: (1/16) ** (1/8) ~ 0.7
+TAMANO_SHINGLE = 3
+PRIMO = np.uint64(4294967311)  # Primo mayor que 2**32
+TAMANO_LOTE = 4096
+
+_aleatorio = np.random.RandomState(20240101)
+_A = _aleatorio.randint(1, 2 ** 31, size=(NUM_PERMUTACIONES, 1), dtype=np.uint64)
+_B = _aleatorio.randint(0, 2 ** 31, size=(NUM_PERMUTACIONES, 1), dtype=np.uint64)
+
+
+def umbral_casi_duplicado():
+    return getattr(settings, 'CONTPAL_UMBRAL_CASI_DUPLICADO', 0.9)
+
+
+class MinHash:
+    """Firma MinHash acumulada bloque a bloque (las palabras ya tokenizadas)."""
+
+    def __init__(self):
+        self.minimos = np.full(NUM_PERMUTACIONES, np.iinfo(np.uint64).max, dtype=np.uint64)
+        self.cola = []  # Últimas palabras del bloque anterior: los shingles cruzan bloques
+        self.vacia = True
+
+    def actualizar(self, palabras):
+        palabras = self.cola + list(palabras)
+        n = len(palabras) - TAMANO_SHINGLE + 1
+        if n > 0:
+            hashes = np.unique(np.fromiter(
+                (zlib.crc32(' '.join(palabras[i:i + TAMANO_SHINGLE]).encode()) for i in range(n)),
+                dtype=np.uint64, count=n,
+            ))
+            for inicio in range(0, len(hashes), TAMANO_LOTE):
+                lote = hashes[inicio:inicio + TAMANO_LOTE]
+                np.minimum(self.minimos, ((_A * lote + _B) % PRIMO).min(axis=1), out=self.minimos)
+            self.vacia = False
+        self.cola = palabras[-(TAMANO_SHINGLE - 1):]
+
+    def firma(self):
+        """Firma como bytes (NUM_PERMUTACIONES enteros de 32 bits), o None si no hubo shingles."""
+        if self.vacia:
+            return None
+        return (self.minimos & np.uint64(0xFFFFFFFF)).astype('<u4').tobytes()
+
+
+def como_array(firma):
+    return np.frombuffer(bytes(firma), dtype='<u4')
+
+
+def similitud(firma_a, firma_b):
+    """Similitud de Jaccard estimada entre dos firmas (0 a 1)."""
+    return float(np.mean(como_array(firma_a) == como_array(firma_b)))
+
+
+def bandas(firma):
+    """(banda, valor) de cada banda de la firma; valor es un hash de 64 bits con signo."""
+    valores = como_array(firma)
+    return [
+        (banda, int.from_bytes(
+            hashlib.blake2b(valores[banda * FILAS:(banda + 1) * FILAS].tobytes(), digest_size=8).digest(),
+            'big', signed=True,
+        ))
+        for banda in range(BANDAS)
+    ]
+
+
+def indexar_firma(reporte_id, firma):
+    """Guarda la firma del reporte y reemplaza sus bandas en el índice LSH."""
+    Reporte.objects.filter(pk=reporte_id).update(firma_minhash=firma)
+    BandaLSH.objects.filter(reporte_id=reporte_id).delete()
+    if firma:
+        BandaLSH.objects.bulk_create([
+            BandaLSH(reporte_id=reporte_id, banda=banda, valor=valor) for banda, valor in bandas(firma)
+        ])
+
+
+def buscar_similares(firma, excluir=None, limite=10, umbral=0.0, **filtros):
+    """
+    Reportes que comparten alguna banda con la firma, con su similitud estimada, de mayor
+    a menor: lista de (reporte, similitud). filtros se aplica a los reportes candidatos.
+    Es una sola consulta sobre el índice (banda, valor).
+    """
+    if not firma:
+        return []
+    coincidencias = Q()
+    for banda, valor in bandas(firma):
+        coincidencias |= Q(banda=banda, valor=valor)
+    candidatos = BandaLSH.objects.filter(coincidencias).values('reporte_id')
+    reportes = Reporte.objects.filter(pk__in=candidatos, **filtros).select_related('empresa')
+    if excluir is not None:
+        reportes = reportes.exclude(pk=excluir)
+
+    resultado = []
+    for reporte in reportes:
+        valor = similitud(firma, reporte.firma_minhash)
+        if valor >= umbral:
+            resultado.append((reporte, valor))
+    resultado.sort(key=lambda par: par[1], reverse=True)
+    return resultado[:limite]
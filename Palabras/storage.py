@@ -0,0 +1,90 @@
+# Palabras/storage.py
+import gzip
+import hashlib
+import os
+import shutil
+from contextlib import contextmanager
+from tempfile import SpooledTemporaryFile, TemporaryDirectory
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+# Extensiones que se pueden guardar comprimidas con gzip
+EXTENSIONES_COMPRIMIBLES = ('.txt', '.docx')
+
+
+def hash_contenido(content):
+    """Calcula el SHA-256 de un archivo de Django leyéndolo por bloques."""
+    h = hashlib.sha256()
+    for chunk in content.chunks():
+        h.update(chunk)
+    content.seek(0)
+    return h.hexdigest()
+
+
+class AlmacenamientoPorContenido(FileSystemStorage):
+    """
+    Guarda cada archivo con el hash de su contenido como nombre
+    (p. ej. reportes/ab/abcd...ef.pdf), de modo que un mismo archivo
+    subido varias veces ocupa espacio una sola vez.
+    Opcionalmente comprime los .txt y .docx (CONTPAL_COMPRIMIR_MEDIA).
+    """
+
+    def __init__(self, comprimir=None, **kwargs):
+        # Dos archivos con el mismo nombre tienen el mismo contenido: sobrescribir es inocuo
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(**kwargs)
+        if comprimir is None:
+            comprimir = getattr(settings, 'CONTPAL_COMPRIMIR_MEDIA', False)
+        self.comprimir = comprimir
+
+    def nombre_por_contenido(self, name, digest):
+        directorio = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        nombre = f"{digest[:2]}/{digest}{extension}"
+        if self.comprimir and extension in EXTENSIONES_COMPRIMIBLES:
+            nombre += '.gz'
+        return f"{directorio}/{nombre}" if directorio else nombre
+
+    def _save(self, name, content):
+        nombre = self.nombre_por_contenido(name, hash_contenido(content))
+        if self.exists(nombre):
+            # Contenido ya almacenado: no se vuelve a escribir
+            return nombre
+
+        if not nombre.endswith('.gz'):
+            return super()._save(nombre, content)
+
+        with SpooledTemporaryFile(max_size=10 * 1024 * 1024) as tmp:
+            with gzip.GzipFile(fileobj=tmp, mode='wb') as gz:
+                for chunk in content.chunks():
+                    gz.write(chunk)
+            tmp.seek(0)
+            return super()._save(nombre, File(tmp))
+
+    def _open(self, name, mode='rb'):
+        if name.endswith('.gz'):
+            return File(gzip.open(self.path(name), mode), name=name)
+        return super()._open(name, mode)
+
+
+def almacenamiento_reportes():
+    return AlmacenamientoPorContenido()
+
+
+@contextmanager
+def ruta_local(archivo):
+    """
+    Devuelve una ruta en disco con el contenido original del archivo,
+    descomprimiéndolo en un directorio temporal si fue guardado con gzip.
+    """
+    if not archivo.name.endswith('.gz'):
+        yield archivo.path
+        return
+
+    with TemporaryDirectory() as temp_dir:
+        destino = os.path.join(temp_dir, os.path.basename(archivo.name)[:-len('.gz')])
+        with archivo.open('rb') as origen, open(destino, 'wb') as f:
+            shutil.copyfileobj(origen, f)
+        yield destino
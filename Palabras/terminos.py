@@ -0,0 +1,117 @@
+# Palabras/terminos.py
+"""
+Conteo de los términos contables de la lista de vigilancia (modelo Termino), que pueden
+tener varias palabras ("estado de resultados integrales").
+
+Los términos activos se compilan en un autómata de Aho-Corasick sobre palabras: cada
+documento se recorre una sola vez y cada palabra cuesta lo mismo con un término que con
+miles. El autómata se reconstruye solo cuando cambia la lista.
+"""
+import unicodedata
+from collections import Counter, deque
+
+from django.db import transaction
+from django.db.models import Count, Max
+
+from .models import ConteoTermino, Termino
+
+# Autómata compilado y la marca de la lista con la que se compiló
+_cache = {'marca': None, 'automata': None}
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes, como se comparan términos y texto ("Depreciación" -> "depreciacion")."""
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def palabras_termino(descripcion):
+    from .utils import PATRON_PUNTUACION
+    return normalizar(PATRON_PUNTUACION.sub('', descripcion)).split()
+
+
+class Automata:
+    """Autómata de Aho-Corasick cuyas transiciones son palabras completas."""
+
+    def __init__(self, terminos):
+        # Por estado: transiciones {palabra: estado}, enlace de fallo e ids de los términos que terminan ahí
+        self.transiciones = [{}]
+        self.fallo = [0]
+        self.salidas = [()]
+        for termino_id, descripcion in terminos:
+            palabras = palabras_termino(descripcion)
+            if not palabras:
+                continue
+            estado = 0
+            for palabra in palabras:
+                siguiente = self.transiciones[estado].get(palabra)
+                if siguiente is None:
+                    siguiente = len(self.transiciones)
+                    self.transiciones.append({})
+                    self.fallo.append(0)
+                    self.salidas.append(())
+                    self.transiciones[estado][palabra] = siguiente
+                estado = siguiente
+            self.salidas[estado] += (termino_id,)
+
+        # Enlaces de fallo por niveles: el sufijo más largo que también es prefijo de algún término
+        cola = deque(self.transiciones[0].values())
+        while cola:
+            estado = cola.popleft()
+            for palabra, hijo in self.transiciones[estado].items():
+                cola.append(hijo)
+                fallo = self.fallo[estado]
+                while fallo and palabra not in self.transiciones[fallo]:
+                    fallo = self.fallo[fallo]
+                self.fallo[hijo] = self.transiciones[fallo].get(palabra, 0)
+                self.salidas[hijo] += self.salidas[self.fallo[hijo]]
+
+    def __len__(self):
+        return len(self.transiciones)
+
+    def busqueda(self):
+        return Busqueda(self)
+
+
+class Busqueda:
+    """Recorrido de un documento por bloques; el estado pasa de un bloque al siguiente."""
+
+    def __init__(self, automata):
+        self.automata = automata
+        self.estado = 0
+        self.conteos = Counter()
+
+    def actualizar(self, bloque):
+        """bloque: texto en minúsculas y sin signos de puntuación (como en contar_palabras)."""
+        transiciones, fallo, salidas = self.automata.transiciones, self.automata.fallo, self.automata.salidas
+        estado = self.estado
+        for palabra in normalizar(bloque).split():
+            while estado and palabra not in transiciones[estado]:
+                estado = fallo[estado]
+            estado = transiciones[estado].get(palabra, 0)
+            if salidas[estado]:
+                self.conteos.update(salidas[estado])
+        self.estado = estado
+
+
+def automata_activo():
+    """
+    Autómata de los términos activos (None si no hay ninguno). Se reutiliza mientras
+    la lista no cambie: agregar, editar, desactivar o eliminar un término cambia la marca.
+    """
+    marca = tuple(Termino.objects.filter(activo=True).aggregate(n=Count('pk'), ultimo=Max('actualizado')).values())
+    if _cache['marca'] != marca:
+        terminos = Termino.objects.filter(activo=True).values_list('pk', 'descripcion')
+        automata = Automata(terminos.iterator())
+        _cache['marca'], _cache['automata'] = marca, (automata if len(automata) > 1 else None)
+    return _cache['automata']
+
+
+def guardar_conteos_terminos(reporte, conteos):
+    """Reemplaza los conteos de términos del reporte ({id de Termino: cantidad})."""
+    with transaction.atomic():
+        ConteoTermino.objects.filter(reporte=reporte).delete()
+        ConteoTermino.objects.bulk_create([
+            ConteoTermino(reporte=reporte, termino_id=termino_id, cantidad=cantidad)
+            for termino_id, cantidad in conteos.items()
+        ], batch_size=500)
@@ -1,3 +1,1324 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import io
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import cargas
+from .models import BandaLSH, CargaZip, ConteoAnual, ConteoTotal, Empresa, Ingesta, Palabras, Provincia, Reporte
+from .paginacion import codificar_cursor, filas_estimadas, siguientes
+from .similitud import MinHash, buscar_similares, indexar_firma, similitud
+from .terminos import Automata
+from .utils import actualizar_resumen, descontar_conteos_anuales, guardar_conteo_en_bd, marcar_casi_duplicado
+
+# Tamaño del fixture: suficiente para que un N+1 o un recorrido completo de tabla se note
+N_EMPRESAS = 200
+N_REPORTES = 2000
+N_PALABRAS = 3000
+PALABRAS_POR_REPORTE = 20
+ANIOS = range(2018, 2024)
+
+
+def crear_fixture():
+    """Provincias, empresas, reportes, palabras y conteos creados con bulk_create."""
+    aleatorio = random.Random(0)
+    provincias = Provincia.objects.bulk_create([Provincia(nombre=f'Provincia {i}') for i in range(24)])
+    Empresa.objects.create(nombre='Desconocido', ruc='0000000000000', provincia=provincias[0])
+    empresas = Empresa.objects.bulk_create([
+        Empresa(nombre=f'Empresa {i} S.A.', ruc=f'{i:010d}001', provincia=aleatorio.choice(provincias))
+        for i in range(1, N_EMPRESAS + 1)
+    ])
+    reportes = Reporte.objects.bulk_create([
+        Reporte(nombre=f'informe {i}.pdf', empresa=aleatorio.choice(empresas), anio=aleatorio.choice(ANIOS),
+                hash_contenido=f'{i:064x}')
+        for i in range(N_REPORTES)
+    ])
+    palabras = Palabras.objects.bulk_create([Palabras(descripcion=f'palabra{i}') for i in range(N_PALABRAS)])
+    ConteoTotal.objects.bulk_create([
+        ConteoTotal(reporte=reporte, palabra=palabra, cantidad=aleatorio.randint(1, 500))
+        for reporte in reportes
+        for palabra in aleatorio.sample(palabras, PALABRAS_POR_REPORTE)
+    ], batch_size=5000)
+    actualizar_resumen([reporte.pk for reporte in reportes])
+    return reportes
+
+
+class PresupuestoConsultasMixin:
+    def assertConsultasMaximo(self, maximo, funcion, *args, **kwargs):
+        """Ejecuta funcion y falla si hace más de `maximo` consultas (las muestra)."""
+        with CaptureQueriesContext(connection) as contexto:
+            resultado = funcion(*args, **kwargs)
+        consultas = len(contexto.captured_queries)
+        if consultas > maximo:
+            detalle = '\n'.join(q['sql'] for q in contexto.captured_queries)
+            self.fail(f"{consultas} consultas (presupuesto {maximo}):\n{detalle}")
+        return resultado
+
+
+class AdminConsultasTests(PresupuestoConsultasMixin, TestCase):
+    """Presupuesto de consultas de las páginas del admin, independiente del tamaño de los datos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reportes = crear_fixture()
+        cls.usuario = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def get(self, maximo, url):
+        respuesta = self.assertConsultasMaximo(maximo, self.client.get, url)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta
+
+    def test_lista_reportes(self):
+        self.get(5, reverse('admin:Palabras_reporte_changelist'))
+
+    def test_formulario_reporte(self):
+        # Incluye una consulta para la tabla de términos contables
+        self.get(6, reverse('admin:Palabras_reporte_change', args=[self.reportes[0].pk]))
+
+    def test_chart_data(self):
+        respuesta = self.get(3, reverse('admin:reporte_chart_data', args=[self.reportes[0].pk]))
+        self.assertEqual(len(respuesta.json()['labels']), 10)
+
+    def test_lista_conteos(self):
+        self.get(6, reverse('admin:Palabras_conteototal_changelist'))
+
+    def test_lista_conteos_por_anio(self):
+        self.get(6, reverse('admin:Palabras_conteototal_changelist') + '?anio=2020')
+
+    def test_lista_empresas(self):
+        self.get(6, reverse('admin:Palabras_empresa_changelist'))
+
+    def test_formulario_empresa(self):
+        self.get(9, reverse('admin:Palabras_empresa_change', args=[self.reportes[0].empresa_id]))
+
+    def test_pagina_profunda_conteos(self):
+        # Paginación por clave: una página profunda cuesta lo mismo que la primera
+        url = reverse('admin:Palabras_conteototal_changelist')
+        ordenados = list(ConteoTotal.objects.order_by('-cantidad', '-pk').values_list('cantidad', 'pk'))
+        respuesta = self.get(6, url + '?despues=' + codificar_cursor(list(ordenados[29999])))
+        cl = respuesta.context['cl']
+        self.assertEqual([conteo.pk for conteo in cl.result_list], [pk for _, pk in ordenados[30000:30100]])
+        self.assertEqual(cl.precision_total, 'estimado')
+        anterior = self.get(6, url + cl.url_anterior).context['cl']
+        self.assertEqual([conteo.pk for conteo in anterior.result_list], [pk for _, pk in ordenados[29900:30000]])
+
+    def test_filas_estimadas_postgresql(self):
+        # regclass distingue mayúsculas solo si el nombre va entre comillas
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value.fetchone.return_value = (1234.0,)
+        with mock.patch.object(connection, 'vendor', 'postgresql'), \
+                mock.patch.object(connection, 'cursor', return_value=cursor):
+            self.assertEqual(filas_estimadas(ConteoTotal), 1234)
+        sql, params = cursor.__enter__.return_value.execute.call_args.args
+        self.assertIn('::regclass', sql)
+        self.assertEqual(params, ['"Palabras_conteototal"'])
+
+    def test_lista_cacheada(self):
+        url = reverse('admin:Palabras_conteototal_changelist')
+        self.get(6, url)
+        # Los años del filtro ya están en caché
+        self.get(5, url)
+
+
+class GuardarConteoTests(PresupuestoConsultasMixin, TestCase):
+    """guardar_conteo_en_bd trabaja por lotes: las consultas no crecen con las palabras."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reportes = crear_fixture()
+
+    def nuevo_reporte(self, anio=2020):
+        return Reporte.objects.create(nombre='nuevo.pdf', empresa=self.reportes[0].empresa, anio=anio)
+
+    def test_presupuesto(self):
+        # 3000 palabras, mitad existentes y mitad nuevas: unas pocas consultas por lote de 500
+        # (conteos del reporte y sumas al total del año)
+        conteos = {f'palabra{i}': 3 for i in range(0, N_PALABRAS, 2)}
+        conteos.update({f'nueva{i}': 2 for i in range(1500)})
+        self.assertConsultasMaximo(55, guardar_conteo_en_bd, self.nuevo_reporte(), conteos)
+
+    def test_suma_al_total_del_anio(self):
+        existente = ConteoTotal.objects.filter(reporte__anio=2021).order_by('pk').first()
+        anterior = existente.cantidad
+        palabra = existente.palabra.descripcion
+        primero, segundo = self.nuevo_reporte(anio=2021), self.nuevo_reporte(anio=2021)
+
+        guardar_conteo_en_bd(primero, {palabra: 7, 'inedita': 4})
+        guardar_conteo_en_bd(segundo, {palabra: 5})
+
+        # Cada reporte guarda sus propios conteos; los de otros reportes no cambian
+        existente.refresh_from_db()
+        self.assertEqual(existente.cantidad, anterior)
+        self.assertEqual(
+            dict(ConteoTotal.objects.filter(reporte=primero).values_list('palabra__descripcion', 'cantidad')),
+            {palabra: 7, 'inedita': 4},
+        )
+        primero.refresh_from_db()
+        self.assertEqual(primero.resumen_top, [[palabra, 7], ['inedita', 4]])
+        self.assertEqual(primero.total_palabras, 11)
+
+        anual = lambda descripcion: ConteoAnual.objects.get(anio=2021, palabra__descripcion=descripcion).cantidad
+        self.assertEqual((anual(palabra), anual('inedita')), (12, 4))
+
+        # Volver a contar reemplaza; eliminar el reporte resta sus conteos del año
+        guardar_conteo_en_bd(primero, {palabra: 2})
+        self.assertEqual(anual(palabra), 7)
+        # La fila queda en 0 (no se borra mientras otro proceso podría sumarle) y no se lista
+        self.assertEqual(anual('inedita'), 0)
+        with override_settings(CONTPAL_API_PUBLICA=True):
+            respuesta = self.client.get(reverse('palabras:palabras_anio', args=[2021]), {'limite': 1000})
+        self.assertNotIn('inedita', [fila['palabra'] for fila in respuesta.json()['resultados']])
+        segundo.delete()
+        self.assertEqual(anual(palabra), 2)
+
+    def test_resumen_igual_a_los_conteos(self):
+        reporte = self.reportes[5]
+        esperado = [
+            [palabra, cantidad] for palabra, cantidad in
+            ConteoTotal.objects.filter(reporte=reporte).order_by('-cantidad', 'pk')
+            .values_list('palabra__descripcion', 'cantidad')[:10]
+        ]
+        reporte.refresh_from_db()
+        self.assertEqual(reporte.resumen_top, esperado)
+        self.assertEqual(reporte.palabras_distintas, PALABRAS_POR_REPORTE)
+
+
+class SimilitudTests(PresupuestoConsultasMixin, TestCase):
+    """Los casi duplicados se encuentran por el índice LSH, con una sola consulta."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reportes = crear_fixture()
+
+    def firma(self, palabras):
+        minhash = MinHash()
+        minhash.actualizar(palabras)
+        return minhash.firma()
+
+    def test_casi_duplicado(self):
+        aleatorio = random.Random(1)
+        texto = [f'palabra{aleatorio.randrange(N_PALABRAS)}' for _ in range(3000)]
+        revisado = texto[:]
+        for i in range(0, len(revisado), 200):
+            revisado[i] = 'revisado'
+        indexar_firma(self.reportes[0].pk, self.firma(texto))
+        otra = self.firma([f'otra{i}' for i in range(3000)])
+        for reporte in self.reportes[1:500]:
+            indexar_firma(reporte.pk, otra)
+
+        firma = self.firma(revisado)
+        self.assertGreater(similitud(firma, self.firma(texto)), 0.85)
+        similares = self.assertConsultasMaximo(1, buscar_similares, firma, umbral=0.5)
+        self.assertEqual([reporte.pk for reporte, _ in similares], [self.reportes[0].pk])
+
+
+class TerminosTests(SimpleTestCase):
+    """Términos de varias palabras, superpuestos y partidos entre bloques, en una sola pasada."""
+
+    def contar(self, terminos, bloques):
+        busqueda = Automata(enumerate(terminos)).busqueda()
+        for bloque in bloques:
+            busqueda.actualizar(bloque)
+        return {terminos[i]: n for i, n in busqueda.conteos.items()}
+
+    def test_superpuestos(self):
+        terminos = ['estado de resultados', 'resultados integrales', 'estado de resultados integrales', 'depreciación']
+        conteos = self.contar(terminos, ['el estado de', ' resultados integrales y la depreciacion', ' del estado de resultados'])
+        self.assertEqual(conteos, {
+            'estado de resultados': 2, 'resultados integrales': 1, 'estado de resultados integrales': 1, 'depreciación': 1,
+        })
+
+    def test_muchos_terminos(self):
+        terminos = [f'cuenta {i} por cobrar' for i in range(5000)] + ['cuenta por cobrar']
+        conteos = self.contar(terminos, ['la cuenta por cobrar y la cuenta 42 por cobrar ' * 3])
+        self.assertEqual(conteos, {'cuenta por cobrar': 3, 'cuenta 42 por cobrar': 3})
+
+
+def ocupar_memoria(mb, segundos):
+    datos = b'x' * (mb * 1024 * 1024)  # Páginas escritas: cuentan en la memoria residente
+    time.sleep(segundos)
+    return len(datos)
+
+
+def reservar_memoria(mb):
+    import mmap
+    with mmap.mmap(-1, mb * 1024 * 1024) as reserva:  # Espacio virtual sin tocar
+        return len(reserva)
+
+
+@unittest.skipUnless(os.path.exists('/proc/self/statm'), "La memoria se mide en /proc")
+class PresupuestoTests(SimpleTestCase):
+    """Etapas en un proceso hijo con límite de tiempo y de memoria residente (Palabras/presupuesto.py)."""
+
+    def fallo(self, *args, **kwargs):
+        from .presupuesto import DocumentoFallido, ejecutar_con_presupuesto
+        with self.assertRaises(DocumentoFallido) as contexto:
+            ejecutar_con_presupuesto('conteo', *args, **kwargs)
+        return contexto.exception.motivo
+
+    def test_tiempo_excedido(self):
+        inicio = time.monotonic()
+        self.assertEqual(self.fallo(time.sleep, 10, segundos=0.3, memoria_mb=None), 'Tiempo excedido (0.3 s)')
+        self.assertLess(time.monotonic() - inicio, 5)
+
+    def test_memoria_excedida(self):
+        self.assertEqual(self.fallo(ocupar_memoria, 200, 5, segundos=20, memoria_mb=50), 'Memoria excedida (50 MB)')
+
+    def test_espacio_virtual_no_cuenta(self):
+        from .presupuesto import ejecutar_con_presupuesto
+        # Con RLIMIT_AS esta reserva (mayor que el límite) fallaría aunque no se use
+        mb = ejecutar_con_presupuesto('conteo', reservar_memoria, 1024, segundos=20, memoria_mb=50)
+        self.assertEqual(mb, 1024 * 1024 * 1024)
+        self.assertEqual(ejecutar_con_presupuesto('conteo', ocupar_memoria, 10, 0, segundos=20, memoria_mb=50),
+                         10 * 1024 * 1024)
+
+    def test_error_de_la_funcion(self):
+        self.assertEqual(self.fallo(int, 'abc', segundos=20, memoria_mb=50),
+                         "ValueError: invalid literal for int() with base 10: 'abc'")
+
+
+@override_settings(CONTPAL_PRESUPUESTO_SEGUNDOS=None, CONTPAL_PRESUPUESTO_MEMORIA_MB=None,
+                   CONTPAL_UMBRAL_CASI_DUPLICADO=None)
+class CuarentenaTests(TestCase):
+    """Documentos que fallan: pasan a Cuarentena sin detener el ZIP y se pueden reintentar."""
+
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        ajustes = override_settings(MEDIA_ROOT=directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def test_cuarentena_y_reintento(self):
+        import zipfile
+        from . import utils
+        from .models import Cuarentena
+        contenido = io.BytesIO()
+        with zipfile.ZipFile(contenido, 'w') as zip_ref:
+            zip_ref.writestr('lote/malo.txt', 'Balance 2020 activo pasivo')
+            zip_ref.writestr('lote/bueno.txt', 'Balance 2021 activo')
+
+        detectar = utils.detectar_metadatos
+
+        def fallar_malo(path, *args):
+            with open(path, encoding='utf-8') as f:
+                malo = 'pasivo' in f.read()
+            if malo:
+                raise RuntimeError('documento ilegible')
+            return detectar(path, *args)
+
+        with mock.patch('Palabras.utils.detectar_metadatos', side_effect=fallar_malo):
+            utils.procesar_zip_reportes(contenido)
+            self.assertEqual(list(Reporte.objects.values_list('nombre', flat=True)), ['bueno.txt'])
+            cuarentena = Cuarentena.objects.get()
+            self.assertEqual((cuarentena.nombre, cuarentena.etapa, cuarentena.motivo, cuarentena.intentos),
+                             ('malo.txt', 'deteccion', 'RuntimeError: documento ilegible', 1))
+            with cuarentena.archivo.open('rb') as f:
+                self.assertEqual(f.read(), b'Balance 2020 activo pasivo')
+
+            self.assertFalse(utils.reintentar_cuarentena(cuarentena))
+            self.assertEqual(Cuarentena.objects.get().intentos, 2)
+
+        self.assertTrue(utils.reintentar_cuarentena(cuarentena))
+        self.assertFalse(Cuarentena.objects.exists())
+        reporte = Reporte.objects.get(nombre='malo.txt')
+        self.assertEqual((reporte.anio, reporte.total_palabras), (2020, 3))
+
+
+class DiagnosticoTests(TestCase):
+    """Consultas lentas y perfilador de peticiones (Palabras/middleware.py y perfilado.py)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        reporte = Reporte.objects.create(nombre='a.txt', anio=2020)
+        palabra = Palabras.objects.create(descripcion='balance')
+        ConteoTotal.objects.create(reporte=reporte, palabra=palabra, cantidad=3)
+        cls.personal = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        cls.usuario = User.objects.create_user('usuario', 'usuario@example.com', 'usuario')
+
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        ajustes = override_settings(CONTPAL_PERFILES_DIR=directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.perfiles = directorio
+
+    @override_settings(CONTPAL_CONSULTA_LENTA_MS=0)
+    def test_consultas_lentas_del_streaming(self):
+        self.client.force_login(self.personal)
+        with self.assertLogs('Palabras.consultas', 'WARNING') as registro:
+            respuesta = self.client.get(reverse('admin:conteo_exportar_csv'))
+            antes = len(registro.output)
+            cuerpo = b''.join(respuesta.streaming_content)
+        self.assertIn(b'balance', cuerpo)
+        # La consulta de las filas se hace al consumir el cuerpo, fuera de la vista
+        consultas = registro.output[antes:]
+        self.assertTrue(any('Palabras/exportar.py' in linea and 'Consulta lenta' in linea for linea in consultas))
+
+    @override_settings(CONTPAL_CONSULTA_LENTA_MS=None)
+    def test_consultas_lentas_desactivadas(self):
+        self.client.force_login(self.personal)
+        with self.assertNoLogs('Palabras.consultas', 'WARNING'):
+            b''.join(self.client.get(reverse('admin:conteo_exportar_csv')).streaming_content)
+
+    def test_perfilador_solo_personal(self):
+        url = reverse('admin:Palabras_reporte_changelist') + '?_perfil=texto'
+        self.assertEqual(self.client.get(url).status_code, 302)  # Anónimo: al login
+        self.client.force_login(self.usuario)
+        self.assertNotIn('X-Perfil', self.client.get(url))
+        self.assertEqual(os.listdir(self.perfiles), [])
+
+        self.client.force_login(self.personal)
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertIn('Consultas: ', respuesta.content.decode())
+        respuesta = self.client.get(reverse('admin:Palabras_reporte_changelist') + '?_perfil=1')
+        self.assertEqual(respuesta.status_code, 200)  # El parámetro no se toma como filtro
+        archivos = os.listdir(self.perfiles)
+        self.assertEqual(len(archivos), 4)  # Perfil e informe de cada petición perfilada
+        self.assertIn(f"{respuesta['X-Perfil']}.prof", archivos)
+        self.assertIn(f"{respuesta['X-Perfil']}.txt", archivos)
+
+
+class VistaPreviaTests(SimpleTestCase):
+    """Estimación de conteos por muestreo de páginas (Palabras/vista_previa.py)."""
+
+    def estimar(self, fijas, muestra, paginas_resto):
+        from collections import Counter
+        from .vista_previa import estimar_conteos
+        resultado = estimar_conteos([Counter(c) for c in fijas], [Counter(c) for c in muestra], paginas_resto, 10)
+        return {fila['palabra']: (fila['estimado'], fila['minimo'], fila['maximo']) for fila in resultado}
+
+    def test_exacto_si_se_lee_todo(self):
+        conteos = self.estimar([{'activo': 2}], [{'activo': 1, 'pasivo': 1}, {'pasivo': 2}], 2)
+        self.assertEqual(conteos, {'activo': (3, 3, 3), 'pasivo': (3, 3, 3)})
+
+    def test_una_pagina_sin_maximo(self):
+        conteos = self.estimar([{'activo': 2}], [{'activo': 1}], 4)
+        self.assertEqual(conteos, {'activo': (6, 3, None)})
+
+    def test_correccion_poblacion_finita(self):
+        # Media 2 y varianza 2 por página; el error se reduce con la fracción muestreada
+        conteos = self.estimar([], [{'activo': 1}, {'activo': 3}], 4)
+        error = 1.96 * 4 * math.sqrt((1 - 2 / 4) * 2 / 2)
+        self.assertEqual(conteos, {'activo': (8, max(4, round(8 - error)), round(8 + error))})
+
+    def crear_pdf(self, paginas):
+        import fitz
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        path = os.path.join(directorio, 'reporte.pdf')
+        with fitz.open() as pdf:
+            for texto in paginas:
+                pagina = pdf.new_page()
+                if texto:
+                    pagina.insert_text((72, 72), texto)
+            pdf.save(path)
+        return path
+
+    @override_settings(CONTPAL_PAGINAS_METADATOS=2, CONTPAL_VISTA_PREVIA_PAGINAS=6)
+    def test_paginas_sin_texto_del_pdf(self):
+        from .vista_previa import muestrear_documento, textos_pdf
+        # Una página escaneada (sin texto) de cada dos, también entre las fijas
+        path = self.crear_pdf(['activo pasivo' if n % 2 == 0 else '' for n in range(12)])
+        total, resto, fijas, muestra, ocr = textos_pdf(path, semilla=1)
+        self.assertFalse(ocr)
+        self.assertEqual(len(fijas), 1)
+        # Las 10 páginas del resto, en la proporción con texto de las 4 muestreadas
+        self.assertIn(len(muestra), (1, 2, 3))
+        self.assertEqual(resto, 10 * len(muestra) / 4)
+        self.assertEqual(total, 1 + resto)
+
+        with override_settings(CONTPAL_VISTA_PREVIA_PAGINAS=12):
+            resultado = muestrear_documento(path)
+        self.assertEqual(resultado['paginas'], 6)
+        self.assertEqual(resultado['palabras'], [
+            {'palabra': 'activo', 'estimado': 6, 'minimo': 6, 'maximo': 6},
+            {'palabra': 'pasivo', 'estimado': 6, 'minimo': 6, 'maximo': 6},
+        ])
+
+
+class OcrTests(SimpleTestCase):
+    """Salida TSV de tesseract (texto_tsv): orden de líneas y páginas, y confianza."""
+
+    def test_texto_tsv(self):
+        from .ocr import texto_tsv
+        columnas = 'level page_num block_num par_num line_num word_num left top width height conf text'
+        filas = [
+            # nivel, página, bloque, párrafo, línea, palabra, confianza, texto (fuera de orden a propósito)
+            (5, 2, 1, 1, 1, 1, 90, 'segunda'),
+            (5, 1, 1, 1, 2, 1, 80, 'línea'),
+            (5, 1, 1, 1, 1, 1, 96, 'Estado'),
+            (5, 1, 1, 1, 1, 2, 94, 'financiero'),
+            (5, 1, 2, 1, 1, 1, -1, 'Notas'),  # Sin confianza: se lee pero no se promedia
+            (5, 1, 2, 1, 1, 2, 10, ' '),  # Palabra vacía: se descarta
+            (4, 1, 1, 1, 1, 0, -1, ''),  # Nivel de línea: no es una palabra
+        ]
+        tsv = '\n'.join([columnas.replace(' ', '\t')] + [
+            '\t'.join(map(str, (nivel, pagina, bloque, parrafo, linea, palabra, 0, 0, 0, 0, conf, texto)))
+            for nivel, pagina, bloque, parrafo, linea, palabra, conf, texto in filas
+        ])
+        paginas = texto_tsv(tsv)
+        self.assertEqual(sorted(paginas), [1, 2])
+        self.assertEqual(paginas[1][0], 'Estado financiero\nlínea\n\nNotas')
+        self.assertAlmostEqual(paginas[1][1], (96 + 94 + 80) / 3)
+        self.assertEqual(paginas[2], ('segunda', 90.0))
+        self.assertEqual(texto_tsv(columnas), {})
+
+
+class ImportacionTests(SimpleTestCase):
+    """Arranque liviano: stop words incluidas con la app y librerías pesadas importadas al usarlas."""
+
+    def test_stop_words_sin_nltk(self):
+        from .utils import spanish_stop_words
+        spanish_stop_words.cache_clear()
+        self.addCleanup(spanish_stop_words.cache_clear)
+        # Sin nltk ni sus datos descargados: un import de nltk fallaría
+        with mock.patch.dict(sys.modules, {'nltk': None}):
+            stop_words = spanish_stop_words()
+        self.assertTrue({'de', 'la', 'que', 'estábamos'} <= stop_words)
+        self.assertNotIn('balance', stop_words)
+
+    def test_utils_no_importa_librerias_pesadas(self):
+        codigo = (
+            'import sys, django; django.setup(); import Palabras.utils; '
+            'print(",".join(m for m in ("fitz", "pandas", "docx") if m in sys.modules))'
+        )
+        resultado = subprocess.run(
+            [sys.executable, '-c', codigo], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'Contpal.settings'},
+        )
+        self.assertEqual(resultado.stdout.strip(), '')
+
+
+class LecturaTextoTests(SimpleTestCase):
+    """Lectura de .txt por bloques (leer_bloques_texto): nada se corta ni se cuenta dos veces."""
+
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        self.path = os.path.join(directorio, 'reporte.txt')
+
+    def bloques(self, texto, tamano):
+        from .utils import leer_bloques_texto
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(texto)
+        bloques = list(leer_bloques_texto(self.path, tamano=tamano))
+        self.assertEqual(''.join(bloques), texto)
+        return bloques
+
+    def test_palabra_partida_entre_bloques(self):
+        from collections import Counter
+        from .utils import contar_palabras
+        texto = 'depreciación acumulada\tdel\nactivo  corriente ' * 50
+        for tamano in (5, 7, 64):
+            bloques = self.bloques(texto, tamano)
+            self.assertTrue(all(bloque[-1].isspace() for bloque in bloques))
+            conteos = contar_palabras(bloques, Counter())
+            self.assertEqual(conteos, {'depreciación': 50, 'acumulada': 50, 'activo': 50, 'corriente': 50})
+
+    def test_caracter_multibyte_partido(self):
+        from collections import Counter
+        from .utils import contar_palabras
+        # La ñ (2 bytes) queda entre dos lecturas de 8192 bytes del archivo
+        texto = 'a ' * 4095 + 'x' + 'ñandú ' * 10
+        self.assertEqual(texto.encode()[8190:8192], b'x\xc3')
+        conteos = contar_palabras(self.bloques(texto, 8191), Counter())
+        self.assertEqual(conteos, {'xñandú': 1, 'ñandú': 9})
+
+    def test_sin_espacios(self):
+        # Una "palabra" más larga que varios bloques se acumula hasta 4 bloques y luego se corta
+        self.assertEqual([len(bloque) for bloque in self.bloques('x' * 50, 5)], [20, 20, 10])
+
+
+def crear_docx(path, cuerpo, partes=None, propiedades=None):
+    """Un .docx mínimo: word/document.xml con el cuerpo dado, otras partes y docProps/core.xml."""
+    import zipfile
+    espacios = ('xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+                'xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006"')
+    with zipfile.ZipFile(path, 'w') as zip_ref:
+        zip_ref.writestr('word/document.xml', f'<w:document {espacios}><w:body>{cuerpo}</w:body></w:document>')
+        for nombre, (raiz, contenido) in (partes or {}).items():
+            zip_ref.writestr(nombre, f'<w:{raiz} {espacios}>{contenido}</w:{raiz}>')
+        if propiedades is not None:
+            zip_ref.writestr('docProps/core.xml', (
+                '<cp:coreProperties xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+                'xmlns:dc="http://purl.org/dc/elements/1.1/">'
+                f'<dc:title>{propiedades[0]}</dc:title><dc:subject>{propiedades[1]}</dc:subject>'
+                f'<cp:keywords>{propiedades[2]}</cp:keywords></cp:coreProperties>'
+            ))
+
+
+def parrafo(*textos):
+    return '<w:p>' + ''.join(f'<w:r><w:t>{texto}</w:t></w:r>' for texto in textos) + '</w:p>'
+
+
+class DocxTests(SimpleTestCase):
+    """Lectura de .docx desde el XML (parrafos_docx), sin python-docx."""
+
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        self.path = os.path.join(directorio, 'reporte.docx')
+
+    def parrafos(self, cuerpo, partes=None):
+        from .utils import parrafos_docx
+        crear_docx(self.path, cuerpo, partes)
+        return list(parrafos_docx(self.path))
+
+    def test_tablas(self):
+        tabla = '<w:tbl><w:tr><w:tc>{}</w:tc><w:tc>{}</w:tc></w:tr></w:tbl>'.format(parrafo('activo'), parrafo('100'))
+        self.assertEqual(self.parrafos(parrafo('Balance') + tabla + parrafo('Fin')), ['Balance', 'activo', '100', 'Fin'])
+
+    def test_encabezados_y_pies(self):
+        partes = {
+            'word/header1.xml': ('hdr', parrafo('Encabezado')),
+            'word/footer1.xml': ('ftr', parrafo('Pie')),
+            'word/footnotes.xml': ('footnotes', '<w:footnote>' + parrafo('Nota') + '</w:footnote>'),
+            'word/media/image1.xml': ('hdr', parrafo('No es texto')),
+        }
+        self.assertEqual(self.parrafos(parrafo('Cuerpo'), partes), ['Encabezado', 'Cuerpo', 'Pie', 'Nota'])
+
+    def test_contenido_alternativo_una_vez(self):
+        # El cuadro de texto aparece en mc:Choice y se repite en mc:Fallback
+        caja = '<w:txbxContent>' + parrafo('caja') + '</w:txbxContent>'
+        alternativo = f'<mc:AlternateContent><mc:Choice>{caja}</mc:Choice><mc:Fallback>{caja}</mc:Fallback></mc:AlternateContent>'
+        parrafos = self.parrafos(f'<w:p><w:r>{alternativo}</w:r></w:p>' + parrafo('fin'))
+        self.assertEqual(' '.join(parrafos).split(), ['caja', 'fin'])
+
+    def test_cuadro_de_texto_aparte(self):
+        # El párrafo del cuadro de texto está dentro de otro: cada uno conserva solo su texto
+        caja = '<w:txbxContent>' + parrafo('caja', ' anidada') + '</w:txbxContent>'
+        alternativo = f'<mc:AlternateContent><mc:Choice>{caja}</mc:Choice><mc:Fallback>{caja}</mc:Fallback></mc:AlternateContent>'
+        cuerpo = f'<w:p><w:r><w:t>Balance </w:t></w:r><w:r>{alternativo}</w:r><w:r><w:t>general</w:t></w:r></w:p>' + parrafo('Fin')
+        self.assertEqual(self.parrafos(cuerpo), ['caja anidada', 'Balance general', 'Fin'])
+
+    def test_tabulaciones_y_saltos(self):
+        cuerpo = '<w:p><w:r><w:t>uno</w:t><w:tab/><w:t>dos</w:t><w:br/><w:t>tres</w:t><w:noBreakHyphen/><w:t>4</w:t></w:r></w:p>'
+        self.assertEqual(self.parrafos(cuerpo), ['uno\tdos\ntres-4'])
+
+    def test_metadatos(self):
+        from .utils import metadatos_docx
+        crear_docx(self.path, parrafo('x'), propiedades=('Informe 2021', 'Estados financieros', 'balance'))
+        self.assertEqual(metadatos_docx(self.path), ['Informe 2021', 'Estados financieros', 'balance'])
+        crear_docx(self.path, parrafo('x'))
+        self.assertEqual(metadatos_docx(self.path), [])
+
+    def test_texto_inicial_no_lee_el_resto(self):
+        from .utils import PARRAFOS_POR_PAGINA, extraer_texto_inicial
+        # Tras las primeras páginas, mucho relleno y un XML roto que no se llega a leer
+        cuerpo = ''.join(parrafo(f'p{i}') for i in range(2000)) + '<w:p><roto'
+        crear_docx(self.path, cuerpo, propiedades=('Titulo', '', ''))
+        texto = extraer_texto_inicial(self.path, paginas=1)
+        self.assertEqual(texto.split(), ['Titulo'] + [f'p{i}' for i in range(PARRAFOS_POR_PAGINA)])
+
+
+class PlanConsultasTests(TestCase):
+    """Las consultas frecuentes usan índices (EXPLAIN QUERY PLAN de SQLite)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reportes = crear_fixture()
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("EXPLAIN QUERY PLAN es específico de SQLite")
+
+    def plan(self, queryset):
+        return self.plan_sql(*queryset.query.sql_with_params())
+
+    def plan_sql(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [fila[-1] for fila in cursor.fetchall()]
+
+    def assertUsaIndices(self, queryset, ordenado=False):
+        plan = queryset if isinstance(queryset, list) else self.plan(queryset)
+        for paso in plan:
+            # "SCAN tabla" sin índice es un recorrido completo de la tabla
+            if paso.startswith('SCAN ') and 'INDEX' not in paso:
+                self.fail(f"Recorrido completo: {paso}\n" + '\n'.join(plan))
+        if ordenado:
+            self.assertFalse([paso for paso in plan if 'TEMP B-TREE' in paso], '\n'.join(plan))
+
+    def test_conteos_de_un_reporte(self):
+        self.assertUsaIndices(ConteoTotal.objects.filter(reporte_id=self.reportes[0].pk).order_by('-cantidad'))
+
+    def test_conteos_ordenados_por_cantidad(self):
+        self.assertUsaIndices(ConteoTotal.objects.order_by('-cantidad')[:100], ordenado=True)
+
+    def test_conteos_por_anio(self):
+        self.assertUsaIndices(ConteoTotal.objects.filter(reporte__anio=2020).order_by('-cantidad')[:100])
+
+    def test_conteos_pagina_siguiente(self):
+        columnas = [(ConteoTotal._meta.get_field('cantidad'), True), (ConteoTotal._meta.pk, True)]
+        queryset = ConteoTotal.objects.order_by('-cantidad', '-pk').filter(siguientes(columnas, [250, 20000]))
+        self.assertUsaIndices(queryset[:101], ordenado=True)
+
+    def test_sumar_conteos_anuales(self):
+        from .utils import sumar_conteos_anuales
+        palabras = list(Palabras.objects.values_list('pk', flat=True)[:500])
+        self.assertUsaIndices(ConteoAnual.objects.filter(anio=2020, palabra_id__in=palabras))
+        # Los UPDATE ... SET cantidad = cantidad + n que ejecuta al guardar cada reporte
+        with CaptureQueriesContext(connection) as consultas:
+            sumar_conteos_anuales(2020, {palabra_id: 1 for palabra_id in palabras})
+        actualizaciones = [c['sql'] for c in consultas.captured_queries if c['sql'].startswith('UPDATE')]
+        self.assertTrue(actualizaciones)
+        for sql in actualizaciones:
+            self.assertUsaIndices(self.plan_sql(sql))
+
+    def test_anios_de_reportes(self):
+        self.assertUsaIndices(Reporte.objects.order_by().values_list('anio', flat=True).distinct())
+
+    def test_reporte_por_hash(self):
+        self.assertUsaIndices(Reporte.objects.filter(hash_contenido='0' * 64, duplicado_de__isnull=True))
+
+    def test_palabras_por_descripcion(self):
+        self.assertUsaIndices(Palabras.objects.filter(descripcion__in=['palabra1', 'palabra2']))
+
+    def test_empresa_por_ruc(self):
+        self.assertUsaIndices(Empresa.objects.filter(ruc='0000000001001'))
+
+    def test_busqueda_admin(self):
+        from django.contrib import admin
+        empresas = admin.site._registry[Empresa]
+        for termino in ('presa 12', 'EMPRESA 7', '0000000001', 'em'):
+            queryset, _ = empresas.get_search_results(None, Empresa.objects.all(), termino)
+            self.assertUsaIndices(queryset)
+            filtro = Q()
+            partes = termino.split()
+            for parte in partes:
+                campo = 'istartswith' if max(len(p) for p in partes) < 3 else 'icontains'
+                filtro &= Q(**{f'nombre__{campo}': parte}) | Q(**{f'ruc__{campo}': parte})
+            self.assertEqual(set(queryset), set(Empresa.objects.filter(filtro)), termino)
+
+        palabras = admin.site._registry[Palabras]
+        queryset, _ = palabras.get_search_results(None, Palabras.objects.all(), 'bra29')
+        self.assertUsaIndices(queryset)
+        self.assertEqual(queryset.count(), Palabras.objects.filter(descripcion__contains='bra29').count())
+
+    def test_bandas_lsh(self):
+        self.assertUsaIndices(BandaLSH.objects.filter(Q(banda=0, valor=1) | Q(banda=1, valor=2)))
+
+
+class CargasTests(TestCase):
+    """Carga de ZIP por partes (Palabras/cargas.py)."""
+
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        ajustes = override_settings(CONTPAL_CARGAS_DIR=directorio, CONTPAL_CARGA_TAMANO_PARTE=10,
+                                    CONTPAL_CARGAS_MAX_BYTES=1000)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.datos = bytes(range(25))
+
+    def parte(self, carga, posicion, datos=None, sha256=None):
+        datos = self.datos[posicion:posicion + 10] if datos is None else datos
+        if sha256 is None:
+            sha256 = hashlib.sha256(datos).hexdigest()
+        return cargas.escribir_parte(carga, posicion, io.BytesIO(datos), len(datos), sha256)
+
+    def test_tamano_maximo(self):
+        with self.assertRaises(cargas.CargaInvalida):
+            cargas.crear_carga('grande.zip', 1001)
+        self.assertFalse(CargaZip.objects.exists())
+
+    def test_partes_fuera_de_rango(self):
+        carga = cargas.crear_carga('a.zip', len(self.datos))
+        with self.assertRaises(cargas.CargaInvalida):
+            self.parte(carga, 10)  # Salta bytes no recibidos
+        with self.assertRaises(cargas.CargaInvalida):
+            self.parte(carga, 0, self.datos[:11])  # Mayor que CONTPAL_CARGA_TAMANO_PARTE
+        with self.assertRaises(cargas.CargaInvalida):
+            self.parte(carga, 0, sha256='0' * 64)
+        carga = self.parte(self.parte(carga, 0), 10)
+        with self.assertRaises(cargas.CargaInvalida):
+            self.parte(carga, 20, self.datos[20:] + b'extra')  # Pasa del final
+        self.assertEqual(carga.recibido, 20)
+
+    def test_partes_superpuestas(self):
+        carga = self.parte(cargas.crear_carga('a.zip', len(self.datos)), 0)
+        # Repetir lo ya recibido (reintento) es válido y avanza solo lo nuevo
+        carga = self.parte(carga, 5)
+        self.assertEqual(carga.recibido, 15)
+        # Una parte que contradice lo ya recibido se rechaza sin tocarlo
+        with self.assertRaises(cargas.CargaInvalida):
+            self.parte(carga, 5, b'x' * 10)
+        carga.refresh_from_db()
+        self.assertEqual(carga.recibido, 15)
+        with open(cargas.ruta_carga(carga), 'rb') as f:
+            self.assertEqual(f.read(15), self.datos[:15])
+
+    def test_reanudar_y_completar(self):
+        sha256 = hashlib.sha256(self.datos).hexdigest()
+        carga = self.parte(cargas.crear_carga('a.zip', len(self.datos), sha256), 0)
+        # Otra sesión retoma la carga desde lo recibido; sin checksum por parte (HTTP sin crypto.subtle)
+        carga = CargaZip.objects.get(pk=carga.pk)
+        while carga.recibido < carga.tamano:
+            carga = self.parte(carga, carga.recibido, sha256='')
+        ruta = cargas.completar_carga(carga)
+        self.assertEqual(carga.estado, CargaZip.ESTADO_COMPLETA)
+        with open(ruta, 'rb') as f:
+            self.assertEqual(f.read(), self.datos)
+
+    def test_completar_incompleta(self):
+        carga = self.parte(cargas.crear_carga('a.zip', len(self.datos)), 0)
+        with self.assertRaises(cargas.CargaInvalida):
+            cargas.completar_carga(carga)
+        self.assertEqual(carga.estado, CargaZip.ESTADO_PENDIENTE)
+
+    def test_checksum_del_archivo(self):
+        carga = cargas.crear_carga('a.zip', len(self.datos), '0' * 64)
+        for posicion in (0, 10, 20):
+            carga = self.parte(carga, posicion)
+        with self.assertRaises(cargas.CargaInvalida):
+            cargas.completar_carga(carga)
+        carga.refresh_from_db()
+        self.assertEqual(carga.estado, CargaZip.ESTADO_ERROR)
+
+    def test_completar_no_procesa_en_la_peticion(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        carga = cargas.crear_carga('a.zip', len(self.datos))
+        for posicion in (0, 10, 20):
+            carga = self.parte(carga, posicion)
+        respuesta = self.client.post(reverse('admin:reporte_carga_completar', args=[carga.pk]))
+        self.assertEqual(respuesta.json()['estado'], CargaZip.ESTADO_COMPLETA)
+
+    def test_pagina_de_la_carga_no_previsualiza(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        carga = cargas.crear_carga('a.zip', len(self.datos))
+        CargaZip.objects.filter(pk=carga.pk).update(estado=CargaZip.ESTADO_COMPLETA)
+        enlace = reverse('admin:reporte_carga_vista_previa', args=[carga.pk])
+        with mock.patch('Palabras.vista_previa.previsualizar_zip', side_effect=AssertionError("no en la página")):
+            respuesta = self.client.get(reverse('admin:Palabras_cargazip_change', args=[carga.pk]))
+        self.assertContains(respuesta, f'href="{enlace}"')
+
+
+class MetricasTests(TestCase):
+    def test_histograma_inf_es_el_total(self):
+        from .metricas import ETAPA_SEGUNDOS
+        ETAPA_SEGUNDOS.observar(0.001, etapa='prueba')
+        ETAPA_SEGUNDOS.observar(10 ** 4, etapa='prueba')  # Mayor que el último bucket
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        texto = self.client.get(reverse('metricas')).content.decode()
+
+        buckets, totales = {}, {}
+        for linea in texto.splitlines():
+            if linea.startswith('#'):
+                continue
+            serie, valor = linea.rsplit(' ', 1)
+            nombre, _, etiquetas = serie.partition('{')
+            if nombre.endswith('_bucket'):
+                etiquetas = ','.join(e for e in etiquetas.rstrip('}').split(',') if not e.startswith('le='))
+                buckets.setdefault((nombre[:-len('_bucket')], etiquetas), []).append(float(valor))
+            elif nombre.endswith('_count'):
+                totales[(nombre[:-len('_count')], etiquetas.rstrip('}'))] = float(valor)
+
+        self.assertEqual(buckets[('contpal_etapa_segundos', 'etapa="prueba"')][-1], 2)
+        for clave, valores in buckets.items():
+            self.assertEqual(valores, sorted(valores), clave)
+            self.assertEqual(valores[-1], totales[clave], clave)
+
+
+class DuplicadosTests(TestCase):
+    """Reportes con el mismo contenido (Palabras/storage.py y duplicado_de)."""
+
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        ajustes = override_settings(MEDIA_ROOT=directorio, CONTPAL_UMBRAL_CASI_DUPLICADO=None)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def subir(self, nombre, texto, empresa=None):
+        reporte = Reporte(anio=2020, empresa=empresa)
+        reporte.archivo.save(nombre, ContentFile(texto.encode()))
+        reporte.refresh_from_db()
+        return reporte
+
+    def conteos(self, reporte):
+        return dict(ConteoTotal.objects.filter(reporte=reporte).values_list('palabra__descripcion', 'cantidad'))
+
+    def totales_anio(self):
+        return dict(ConteoAnual.objects.filter(anio=2020, cantidad__gt=0).values_list('palabra__descripcion', 'cantidad'))
+
+    def test_mismo_contenido_se_reutiliza(self):
+        original = self.subir('a.txt', 'balance activo balance pasivo')
+        copia = self.subir('b.txt', 'balance activo balance pasivo')
+        self.assertEqual(copia.archivo.name, original.archivo.name)  # Se guarda una sola vez
+        self.assertEqual(copia.duplicado_de, original)
+        self.assertEqual(self.conteos(copia), {})
+        self.assertEqual(copia.resumen_top, original.resumen_top)
+        self.assertEqual(self.totales_anio(), {'balance': 2, 'activo': 1, 'pasivo': 1})
+
+    def test_eliminar_original_promueve_duplicado(self):
+        original = self.subir('a.txt', 'balance activo balance pasivo')
+        conteos = self.conteos(original)
+        copias = [self.subir(f'{i}.txt', 'balance activo balance pasivo') for i in range(2)]
+        original.delete()
+
+        nuevo, otra = [Reporte.objects.get(pk=copia.pk) for copia in copias]
+        self.assertIsNone(nuevo.duplicado_de)
+        self.assertEqual(otra.duplicado_de, nuevo)
+        self.assertEqual(self.conteos(nuevo), conteos)
+        self.assertEqual(nuevo.total_palabras, 4)
+        self.assertEqual(otra.resumen_top, nuevo.resumen_top)
+        # El contenido sigue una vez en los totales del año
+        self.assertEqual(self.totales_anio(), conteos)
+        # Una nueva subida del mismo contenido se enlaza al promovido
+        self.assertEqual(self.subir('c.txt', 'balance activo balance pasivo').duplicado_de, nuevo)
+
+    def test_eliminar_original_recuenta_casi_duplicado(self):
+        original = self.subir('a.txt', 'balance activo balance pasivo')
+        parecido = self.subir('b.txt', 'balance activo pasivo patrimonio')
+        # Como si la ingesta lo hubiera marcado casi duplicado en vez de contarlo
+        descontar_conteos_anuales(parecido)
+        ConteoTotal.objects.filter(reporte=parecido).delete()
+        marcar_casi_duplicado(parecido, original, 0.9)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            original.delete()
+        parecido.refresh_from_db()
+        self.assertIsNone(parecido.duplicado_de)
+        self.assertEqual(self.conteos(parecido), {'balance': 1, 'activo': 1, 'pasivo': 1, 'patrimonio': 1})
+        self.assertEqual(self.totales_anio(), self.conteos(parecido))
+
+    @override_settings(CONTPAL_UMBRAL_CASI_DUPLICADO=0.8)
+    def test_casi_duplicado_solo_de_la_misma_empresa(self):
+        provincia = Provincia.objects.create(nombre='Pichincha')
+        rival, andina = Empresa.objects.bulk_create([
+            Empresa(ruc='1790000000001', nombre='Plasticos Rival', provincia=provincia),
+            Empresa(ruc='1790000000002', nombre='Textiles Andina', provincia=provincia),
+        ])
+        opinion = ' '.join(f'termino{chr(97 + i // 26)}{chr(97 + i % 26)}' for i in range(60))
+        original = self.subir('a.txt', opinion + ' rival', empresa=rival)
+        # La misma opinión estándar en el informe de otra empresa: se cuenta
+        otra = self.subir('b.txt', opinion + ' andina', empresa=andina)
+        self.assertIsNone(otra.duplicado_de)
+        self.assertEqual(len(self.conteos(otra)), 61)
+        # Una revisión del informe de la misma empresa: casi duplicado
+        revision = self.subir('c.txt', opinion + ' revisado', empresa=rival)
+        self.assertEqual(revision.duplicado_de, original)
+        self.assertEqual(self.conteos(revision), {})
+        self.assertEqual(self.totales_anio()['terminoaa'], 2)
+
+    def test_recontar_reportes(self):
+        from django.core.management import call_command
+        original = self.subir('a.txt', 'balance activo balance pasivo')
+        copia = self.subir('b.txt', 'balance activo balance pasivo')
+        # Como si se hubiera contado con otra tokenización
+        guardar_conteo_en_bd(original, {'balance': 1, 'activo-balance': 1})
+        self.assertEqual(self.totales_anio(), {'balance': 1, 'activo-balance': 1})
+
+        salida = io.StringIO()
+        call_command('recontar_reportes', stdout=salida)
+        self.assertIn('1 reporte(s) recontados', salida.getvalue())
+        self.assertEqual(self.conteos(original), {'balance': 2, 'activo': 1, 'pasivo': 1})
+        self.assertEqual(self.totales_anio(), {'balance': 2, 'activo': 1, 'pasivo': 1})
+        copia.refresh_from_db()
+        self.assertEqual(copia.total_palabras, 4)
+
+
+class EmpresasTests(TestCase):
+    """Resolución de la empresa (ResolutorEmpresas): RUC, carpeta y similitud."""
+
+    @classmethod
+    def setUpTestData(cls):
+        provincia = Provincia.objects.create(nombre='Pichincha')
+        cls.rival, cls.andina, _ = Empresa.objects.bulk_create([
+            Empresa(ruc='1790000000001', nombre='Plasticos Rival', provincia=provincia),
+            Empresa(ruc='1790000000002', nombre='Textiles Andina', provincia=provincia),
+            Empresa(ruc='9999999999999', nombre='Desconocido', provincia=provincia),
+        ])
+
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        # Con presupuesto, la detección corre en un proceso hijo (fork)
+        ajustes = override_settings(MEDIA_ROOT=directorio, CONTPAL_PRESUPUESTO_SEGUNDOS=60,
+                                    CONTPAL_UMBRAL_CASI_DUPLICADO=None)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def test_ruc_antes_que_similitud(self):
+        from .utils import ResolutorEmpresas
+        resolutor = ResolutorEmpresas()
+        texto = 'Informe de Plasticos Rival para el accionista RUC 1790000000002'
+        self.assertEqual(resolutor.identificar(texto), (self.andina, 'ruc'))
+        self.assertEqual(resolutor.identificar('Informe de Plasticos Rival'), (self.rival, 'similitud'))
+        self.assertEqual(resolutor.identificar('Informe', 'EMPRESA 12 TEXTILES ANDINA/2020'), (self.andina, 'carpeta'))
+
+    def procesar(self, archivos):
+        import zipfile
+        from .utils import procesar_zip_reportes
+        contenido = io.BytesIO()
+        with zipfile.ZipFile(contenido, 'w') as zip_ref:
+            for nombre, texto in archivos:
+                zip_ref.writestr(nombre, texto)
+        procesar_zip_reportes(contenido)
+        return {reporte.nombre: reporte.empresa for reporte in Reporte.objects.select_related('empresa')}
+
+    def test_carpeta_hereda_empresa_por_ruc(self):
+        empresas = self.procesar([
+            ('lote/a.txt', 'Balance 2020 RUC 1790000000001'),
+            ('lote/b.txt', 'Notas a los estados financieros 2020'),
+        ])
+        self.assertEqual(empresas, {'a.txt': self.rival, 'b.txt': self.rival})
+
+    def test_carpeta_no_hereda_similitud(self):
+        empresas = self.procesar([
+            ('lote/a.txt', 'Balance 2020 de Plasticos Rival'),
+            ('lote/b.txt', 'Notas a los estados financieros 2020'),
+        ])
+        self.assertEqual(empresas['a.txt'], self.rival)
+        self.assertEqual(empresas['b.txt'].nombre, 'Desconocido')
+
+
+@override_settings(CONTPAL_PRESUPUESTO_SEGUNDOS=None, CONTPAL_PRESUPUESTO_MEMORIA_MB=None,
+                   CONTPAL_UMBRAL_CASI_DUPLICADO=None, CONTPAL_PAGINAS_METADATOS=1)
+class DeteccionTests(TestCase):
+    """Detección de año y empresa (detectar_metadatos): primeras páginas y, si faltan, el resto."""
+
+    @classmethod
+    def setUpTestData(cls):
+        provincia = Provincia.objects.create(nombre='Pichincha')
+        cls.rival = Empresa.objects.create(ruc='1790000000001', nombre='Plasticos Rival', provincia=provincia)
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio)
+        ajustes = override_settings(MEDIA_ROOT=self.directorio, CONTPAL_DOCX_DIR=os.path.join(self.directorio, 'Docxs'))
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def detectar(self, nombre, texto):
+        from .utils import ResolutorEmpresas, detectar_metadatos
+        path = os.path.join(self.directorio, nombre)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(texto)
+        return detectar_metadatos(path, self.directorio, ResolutorEmpresas())
+
+    def test_bastan_las_primeras_paginas(self):
+        with mock.patch('Palabras.utils.bloques_texto_completo', side_effect=AssertionError("no debe leer el resto")):
+            self.assertEqual(self.detectar('a.txt', 'Informe 2021 RUC 1790000000001'), (2021, self.rival, 'ruc'))
+
+    def test_resto_del_documento(self):
+        from .utils import CARACTERES_POR_PAGINA
+        texto = 'Informe de gestión ' + 'notas ' * CARACTERES_POR_PAGINA + 'ejercicio 2021 RUC 1790000000001'
+        self.assertEqual(self.detectar('a.txt', texto), (2021, self.rival, 'ruc'))
+        self.assertEqual(self.detectar('b.txt', 'notas ' * CARACTERES_POR_PAGINA), (0, None, None))
+
+    def crear_pdf(self, paginas):
+        import fitz
+        path = os.path.join(self.directorio, 'informe.pdf')
+        with fitz.open() as pdf:
+            for texto in paginas:
+                pdf.new_page().insert_text((72, 72), texto)
+            pdf.save(path)
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_pdf_se_convierte_una_sola_vez(self):
+        import zipfile
+        from . import utils
+        casos = {
+            'primeras páginas': ['Informe 2021 RUC 1790000000001', 'balance activo', 'notas'],
+            'resto': ['Informe de gestión', 'balance activo', 'ejercicio 2021 RUC 1790000000001'],
+        }
+        for caso, paginas in casos.items():
+            with self.subTest(caso):
+                Reporte.objects.all().delete()
+                contenido = io.BytesIO()
+                with zipfile.ZipFile(contenido, 'w') as zip_ref:
+                    zip_ref.writestr('informe.pdf', self.crear_pdf(paginas))
+                with mock.patch('Palabras.utils.pdf_to_docx', wraps=utils.pdf_to_docx) as convertir:
+                    utils.procesar_zip_reportes(contenido)
+                # La detección (si lee el resto) y el conteo comparten la conversión
+                self.assertEqual(convertir.call_count, 1)
+                reporte = Reporte.objects.get()
+                self.assertEqual((reporte.anio, reporte.empresa), (2021, self.rival))
+                self.assertIn(['activo', 1], reporte.resumen_top)
+                shutil.rmtree(os.path.join(self.directorio, 'Docxs'))
+
+
+@override_settings(CONTPAL_API_TOKENS=['secreto'], CONTPAL_API_PUBLICA=False)
+class ApiRankingTests(TestCase):
+    """API de rankings (Palabras/views.py): autorización, validadores HTTP y cursor."""
+
+    @classmethod
+    def setUpTestData(cls):
+        reporte = Reporte.objects.create(nombre='a.txt', anio=2020)
+        palabras = Palabras.objects.bulk_create([Palabras(descripcion=f'palabra{i}') for i in range(25)])
+        # Cantidades con empates, para que el cursor tenga que desempatar por palabra
+        guardar_conteo_en_bd(reporte, {palabra.descripcion: 10 + i // 3 for i, palabra in enumerate(palabras)})
+        cls.url = reverse('palabras:palabras_anio', args=[2020])
+        cls.ranking = list(
+            ConteoAnual.objects.filter(anio=2020).order_by('-cantidad', 'palabra_id')
+            .values_list('palabra__descripcion', 'cantidad')
+        )
+
+    def get(self, url, **extra):
+        return self.client.get(url, HTTP_AUTHORIZATION='Bearer secreto', **extra)
+
+    def test_requiere_autorizacion(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION='Bearer otro').status_code, 401)
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 401)
+        self.client.force_login(User.objects.create_user('lector', password='x'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+        respuesta = self.get(self.url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('private', respuesta['Cache-Control'])
+        self.assertIn('Authorization', respuesta['Vary'])
+        self.assertEqual(self.get(reverse('metricas')).status_code, 200)
+
+    @override_settings(CONTPAL_API_PUBLICA=True)
+    def test_api_publica(self):
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('public', respuesta['Cache-Control'])
+
+    def test_validadores(self):
+        respuesta = self.get(self.url)
+        self.assertEqual(self.get(self.url, HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 304)
+        self.assertEqual(self.get(self.url, HTTP_IF_MODIFIED_SINCE=respuesta['Last-Modified']).status_code, 304)
+        # Una nueva ingesta cambia el ETag
+        Ingesta.objects.filter(pk=1).update(actualizado=Ingesta.ultima() + datetime.timedelta(seconds=1))
+        self.assertEqual(self.get(self.url, HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 200)
+
+    def test_cursor(self):
+        resultados, url = [], self.url + '?limite=7'
+        while url:
+            datos = self.get(url).json()
+            resultados += [(fila['palabra'], fila['cantidad']) for fila in datos['resultados']]
+            url = datos['siguiente']
+        self.assertEqual(resultados, self.ranking)
+
+        datos = self.get(self.url + '?limite=7&top=10').json()
+        segunda = self.get(datos['siguiente']).json()
+        self.assertEqual(len(datos['resultados']) + len(segunda['resultados']), 10)
+        self.assertIsNone(segunda['siguiente'])
+
+    def test_parametros_invalidos(self):
+        for parametros in ('limite=abc', 'limite=0', 'top=-1', 'cursor=abc', 'cursor=' + codificar_cursor([1])):
+            self.assertEqual(self.get(f'{self.url}?{parametros}').status_code, 400, parametros)
+
+
+class ExportarTests(TestCase):
+    """Exportación de conteos desde el admin (Palabras/exportar.py), en streaming."""
+
+    @classmethod
+    def setUpTestData(cls):
+        provincia = Provincia.objects.create(nombre='Pichincha')
+        empresa = Empresa.objects.create(nombre='Empresa', ruc='0000000001001', provincia=provincia)
+        palabras = Palabras.objects.bulk_create([Palabras(descripcion=f'palabra{i}') for i in range(30)])
+        for anio in (2020, 2021):
+            reporte = Reporte.objects.create(nombre=f'{anio}.txt', anio=anio, empresa=empresa)
+            ConteoTotal.objects.bulk_create([ConteoTotal(reporte=reporte, palabra=p, cantidad=3) for p in palabras])
+        cls.usuario = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def test_csv(self):
+        respuesta = self.client.get(reverse('admin:conteo_exportar_csv') + '?anio=2020')
+        self.assertTrue(respuesta.streaming)
+        lineas = b''.join(respuesta.streaming_content).decode().splitlines()
+        self.assertEqual(lineas[0], 'palabra,cantidad,reporte,anio,empresa,ruc,provincia')
+        self.assertEqual(len(lineas), 31)
+
+    def test_parquet_por_grupos_de_filas(self):
+        import pyarrow.parquet as pq
+        from .exportar import bloques_parquet, consulta_exportacion
+
+        partes = list(bloques_parquet(consulta_exportacion(provincia='pichincha'), tamano_lote=20))
+        self.assertGreater(len(partes), 2)  # Se envía mientras se escribe, no al final
+        tabla = pq.read_table(io.BytesIO(b''.join(partes)))
+        self.assertEqual(tabla.num_rows, 60)
+
+        respuesta = self.client.get(reverse('admin:conteo_exportar_parquet') + '?anio=2021')
+        self.assertTrue(respuesta.streaming)
+        tabla = pq.read_table(io.BytesIO(b''.join(respuesta.streaming_content)))
+        self.assertEqual(set(tabla.column('anio').to_pylist()), {2021})
+
+    def test_parametros_invalidos(self):
+        for nombre in ('admin:conteo_exportar_csv', 'admin:conteo_exportar_parquet'):
+            self.assertEqual(self.client.get(reverse(nombre) + '?anio=abc').status_code, 400)
+
+
+class MatrizTests(TestCase):
+    """Snapshot de la matriz documento-término (Palabras/matriz.py) y su uso en la analítica."""
+
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        self.directorio = os.path.join(directorio, 'matriz')
+        ajustes = override_settings(CONTPAL_MATRIZ_DIR=self.directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        provincia = Provincia.objects.create(nombre='Pichincha')
+        empresa = Empresa.objects.create(nombre='Empresa', ruc='0000000001001', provincia=provincia)
+        self.reportes = [
+            Reporte.objects.create(nombre=f'{i}.txt', anio=2020 + i % 2, empresa=empresa if i % 3 else None)
+            for i in range(6)
+        ]
+        for i, reporte in enumerate(self.reportes):
+            guardar_conteo_en_bd(reporte, {f'palabra{j}': i + j for j in range(i, i + 8)})
+
+    def assertMismaMatriz(self, a, b):
+        for nombre in ('indptr', 'indices', 'data', 'reportes', 'vocabulario'):
+            self.assertEqual(getattr(a, nombre).tolist(), getattr(b, nombre).tolist(), nombre)
+
+    def test_actualizacion_igual_a_regenerar(self):
+        from .matriz import actualizar_snapshot, escribir_snapshot
+        escribir_snapshot(self.directorio)
+        guardar_conteo_en_bd(self.reportes[1], {'palabra1': 50, 'nueva': 3})  # Recontado, palabra nueva
+        self.reportes[2].delete()
+        nuevo = Reporte.objects.create(nombre='nuevo.txt', anio=2021)
+        guardar_conteo_en_bd(nuevo, {'palabra0': 1, 'otra': 2})
+
+        actualizada = actualizar_snapshot(self.directorio)
+        self.assertMismaMatriz(actualizada, escribir_snapshot(self.directorio + '_completo'))
+
+    def test_analitica_lee_el_snapshot(self):
+        import pandas as pd
+        from . import analitica
+        from .matriz import escribir_snapshot
+        escribir_snapshot(self.directorio)
+
+        def ordenado(df):
+            return df.sort_values(['reporte', 'palabra']).reset_index(drop=True)
+
+        desde_bd = analitica.conteos_bd()
+        with mock.patch.object(analitica, 'conteos_bd', side_effect=AssertionError("no debe consultar ConteoTotal")):
+            desde_snapshot = analitica.cargar_conteos(forzar=True)
+        pd.testing.assert_frame_equal(ordenado(desde_snapshot), ordenado(desde_bd), check_dtype=False)
+
+        # Una ingesta posterior: el snapshot quedó atrás y se lee la base de datos, sin reescribirlo
+        with self.captureOnCommitCallbacks(execute=True):
+            guardar_conteo_en_bd(self.reportes[0], {'palabra0': 99})
+        with mock.patch('Palabras.matriz._actualizar_snapshot', side_effect=AssertionError("no debe reescribirlo")):
+            df = analitica.cargar_conteos()
+        self.assertEqual(df[df['reporte'] == self.reportes[0].pk]['cantidad'].tolist(), [99])
+
+    def test_actualizador_en_segundo_plano(self):
+        from .matriz import cargar_snapshot, escribir_snapshot, refrescar, snapshot_vigente
+        escribir_snapshot(self.directorio)
+        guardar_conteo_en_bd(self.reportes[0], {'palabra0': 99})
+        self.assertIsNone(snapshot_vigente(self.directorio))
+        refrescar(self.directorio, cada=0, veces=1)
+        palabras, cantidades = cargar_snapshot(self.directorio).fila(self.reportes[0].pk)
+        self.assertEqual(cantidades.tolist(), [99])
+        self.assertIsNotNone(snapshot_vigente(self.directorio))
+        # Sin restos de escrituras: solo el snapshot y su lock
+        self.assertEqual(sorted(os.listdir(os.path.dirname(self.directorio))), ['matriz', 'matriz.lock'])
+
+    @unittest.skipUnless(hasattr(os, 'fork'), "El otro escritor es un proceso hijo")
+    def test_escritores_se_esperan(self):
+        import multiprocessing
+        from .matriz import bloqueo
+        receptor, emisor = multiprocessing.Pipe(duplex=False)
+
+        def otro_escritor():
+            with bloqueo(self.directorio):
+                emisor.send('bloqueado')
+                time.sleep(0.5)
+
+        proceso = multiprocessing.get_context('fork').Process(target=otro_escritor)
+        proceso.start()
+        self.addCleanup(proceso.join)
+        self.assertEqual(receptor.recv(), 'bloqueado')
+        inicio = time.monotonic()
+        with bloqueo(self.directorio):
+            self.assertGreater(time.monotonic() - inicio, 0.3)
+
+
+class AnaliticaTests(TestCase):
+    """Tendencia y TF-IDF (Palabras/analitica.py) sobre un DataFrame armado a mano."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.a, cls.b, cls.c = Palabras.objects.bulk_create([Palabras(descripcion=d) for d in ('alfa', 'beta', '<gama>')])
+
+    def conteos(self):
+        import pandas as pd
+        filas = [
+            # reporte, palabra, cantidad, anio, empresa, provincia
+            (1, self.a.pk, 1, 2020, 1, 1), (1, self.b.pk, 10, 2020, 1, 1),
+            (2, self.a.pk, 5, 2021, 1, 1), (2, self.c.pk, 3, 2021, 1, 1),
+            (3, self.a.pk, 4, 2022, 1, 1), (3, self.b.pk, 2, 2022, 1, 1),
+            (4, self.a.pk, 7, 2022, 2, 2),
+        ]
+        return pd.DataFrame(filas, columns=['reporte', 'palabra', 'cantidad', 'anio', 'empresa', 'provincia'])
+
+    def test_tendencia(self):
+        from .analitica import tendencia
+        resultado = tendencia(2020, 2022, empresa=1, top=2, df=self.conteos())
+        self.assertEqual(list(resultado.index), ['alfa', '<gama>'])
+        self.assertEqual(resultado.loc['alfa', [2020, 2021, 2022]].tolist(), [1, 5, 4])
+        self.assertEqual(resultado.loc['alfa', 'interanual'], 4)
+        self.assertEqual(resultado.loc['alfa', 'variacion'], 3)
+        self.assertEqual(resultado.loc['<gama>', 'interanual'], 3)
+        # Sin filtro de empresa se suma la otra empresa
+        self.assertEqual(tendencia(2020, 2022, df=self.conteos()).loc['alfa', 2022], 11)
+
+    def test_tfidf(self):
+        import math
+        from .analitica import distintivas, tfidf
+        tabla = tfidf('provincia', df=self.conteos()).set_index(['grupo', 'palabra'])
+        # alfa aparece en ambas provincias: no distingue a ninguna
+        self.assertEqual(tabla.loc[(1, self.a.pk), 'tfidf'], 0)
+        self.assertAlmostEqual(tabla.loc[(1, self.b.pk), 'tf'], 12 / 25)
+        self.assertAlmostEqual(tabla.loc[(1, self.b.pk), 'tfidf'], 12 / 25 * math.log(2))
+        self.assertEqual(list(distintivas(1, df=self.conteos()).index), ['beta', '<gama>'])
+
+    def test_crecimiento_de_la_empresa_sin_cargar_el_corpus(self):
+        from . import analitica
+        provincia = Provincia.objects.create(nombre='Pichincha')
+        empresa, otra = Empresa.objects.bulk_create([
+            Empresa(ruc='1790000000001', nombre='Plasticos Rival', provincia=provincia),
+            Empresa(ruc='1790000000002', nombre='Textiles Andina', provincia=provincia),
+        ])
+        for anio, cantidad in ((2020, 1), (2022, 7)):
+            guardar_conteo_en_bd(Reporte.objects.create(nombre=f'{anio}.txt', anio=anio, empresa=empresa),
+                                 {'activo': cantidad})
+        guardar_conteo_en_bd(Reporte.objects.create(nombre='otra.txt', anio=2022, empresa=otra), {'pasivo': 50})
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        with mock.patch.object(analitica, 'cargar_conteos', side_effect=AssertionError("carga todo el corpus")):
+            respuesta = self.client.get(reverse('admin:Palabras_empresa_change', args=[empresa.pk]))
+        self.assertContains(respuesta, '<strong>activo</strong>')
+        self.assertContains(respuesta, '+6')
+        self.assertNotContains(respuesta, '<strong>pasivo</strong>')
+
+    def test_tabla_escapa_palabras(self):
+        from .admin import tabla_analitica
+        from .analitica import tendencia
+        html = tabla_analitica(tendencia(2020, 2022, df=self.conteos()), [('Variación', 'variacion', '{:+}')])
+        self.assertIn('&lt;gama&gt;', html)
+        self.assertNotIn('<gama>', html)
@@ -0,0 +1,11 @@
+from django.urls import path
+from . import views
+
+app_name = 'palabras'
+
+urlpatterns = [
+    path('reportes/<int:pk>/palabras/', views.palabras_reporte, name='palabras_reporte'),
+    path('anios/<int:anio>/palabras/', views.palabras_anio, name='palabras_anio'),
+    path('empresas/<int:pk>/palabras/', views.palabras_empresa, name='palabras_empresa'),
+    path('provincias/<int:pk>/palabras/', views.palabras_provincia, name='palabras_provincia'),
+]
@@ -1,16 +1,181 @@
-import re, docx, nltk, pandas as pd, zipfile, os, io, difflib, fitz, pytesseract
+import re, zipfile, os, io, difflib, time, unicodedata
+from functools import lru_cache
+from itertools import islice
 from tempfile import TemporaryDirectory
-from pdf2image import convert_from_path
 from django.core.files.base import ContentFile
-from docx import Document
-from nltk.corpus import stopwords
 from collections import Counter
+from django.conf import settings
 from django.db import transaction
-from .models import Palabras, ConteoTotal, Provincia, Empresa, Reporte
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from .models import Palabras, ConteoTotal, ConteoAnual, Provincia, Empresa, Reporte, Ingesta, Cuarentena
+from .storage import hash_contenido, ruta_local
+from .presupuesto import DocumentoFallido, Plazo, ejecutar_con_presupuesto
+from .cache import calentar, invalidar_reportes
+from .terminos import automata_activo, guardar_conteos_terminos
+from .metricas import DOCUMENTOS, ETAPA_SEGUNDOS, FALLOS, OCR_CONFIANZA, OCR_SEGUNDOS, PAGINAS_OCR, medir
 
-nltk.download('stopwords')
+# Las librerías pesadas (python-docx, PyMuPDF, Pillow, numpy, pandas) se importan
+# dentro de las funciones que las usan, para no cargarlas al arrancar Django.
 
-def count_frequent_words(doc_paths):
+RUTA_STOPWORDS = os.path.join(os.path.dirname(__file__), 'stopwords_es.txt')
+
+
+@lru_cache(maxsize=None)
+def spanish_stop_words():
+    """Stop words en español (la lista de NLTK/Snowball, incluida con la app)."""
+    with open(RUTA_STOPWORDS, encoding='utf-8') as f:
+        return frozenset(linea.strip() for linea in f if linea.strip())
+
+
+# Caracteres por bloque al leer archivos de texto grandes
+TAMANO_BLOQUE_TEXTO = 1024 * 1024
+
+PATRON_PUNTUACION = re.compile(r'[^\w\s]')
+# Último espacio del bloque: lo que sigue es una palabra posiblemente incompleta
+PATRON_ULTIMO_ESPACIO = re.compile(r'\s(?=\S*\Z)')
+
+
+def tamano_bloque_texto():
+    return getattr(settings, 'CONTPAL_TAMANO_BLOQUE_TEXTO', TAMANO_BLOQUE_TEXTO)
+
+
+def leer_bloques_texto(path, tamano=None, errors='strict'):
+    """
+    Lee un .txt por bloques sin cargarlo entero. El modo texto decodifica el UTF-8 de
+    forma incremental (no corta caracteres multibyte) y cada bloque termina en un
+    espacio: la palabra incompleta del final pasa al bloque siguiente.
+    """
+    tamano = tamano or tamano_bloque_texto()
+    resto = ''
+    with open(path, 'r', encoding='utf-8', errors=errors) as f:
+        while True:
+            leido = f.read(tamano)
+            if not leido:
+                break
+            bloque = resto + leido
+            espacio = PATRON_ULTIMO_ESPACIO.search(bloque)
+            if not espacio and len(bloque) < 4 * tamano:
+                # Todavía no hay ningún espacio: seguir acumulando
+                resto = bloque
+                continue
+            corte = espacio.end() if espacio else len(bloque)
+            resto = bloque[corte:]
+            yield bloque[:corte]
+    if resto:
+        yield resto
+
+
+# Lectura de .docx directamente del XML (WordprocessingML), sin python-docx
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+TEXTO_DOCX = {W + 'tab': '\t', W + 'br': '\n', W + 'cr': '\n', W + 'noBreakHyphen': '-'}
+FALLBACK = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+PATRON_PARTES_DOCX = re.compile(r'word/(header|footer|footnotes|endnotes)\d*\.xml$')
+
+
+def partes_docx(zip_ref):
+    """Partes con texto, en orden de lectura: encabezados, cuerpo, pies de página y notas."""
+    otras = sorted(nombre for nombre in zip_ref.namelist() if PATRON_PARTES_DOCX.match(nombre))
+    encabezados = [nombre for nombre in otras if nombre.startswith('word/header')]
+    return encabezados + ['word/document.xml'] + [nombre for nombre in otras if nombre not in encabezados]
+
+
+def parrafos_docx(path):
+    """
+    Texto de cada párrafo de un .docx, incluidas las celdas de las tablas, los
+    encabezados, los pies de página y las notas. El XML se lee del ZIP con un parser
+    incremental: cada elemento del cuerpo (párrafo, tabla, sección) se desprende del
+    árbol al terminarlo, así que solo se mantiene en memoria el que se está leyendo
+    (python-docx construye el árbol completo y solo lee el cuerpo).
+    Los reportes contados antes con python-docx se recuentan con `manage.py recontar_reportes`.
+    """
+    from xml.etree.ElementTree import iterparse
+
+    with zipfile.ZipFile(path) as zip_ref:
+        for parte in partes_docx(zip_ref):
+            with zip_ref.open(parte) as xml:
+                # Texto de cada párrafo abierto: uno de un cuadro de texto (w:txbxContent)
+                # está dentro de otro y se entrega aparte, sin mezclarse con el de afuera
+                textos = []
+                abiertos = []  # Elementos abiertos, de la raíz al actual
+                alternativo = 0  # Dentro de mc:Fallback (copia del contenido de mc:Choice)
+                for evento, elemento in iterparse(xml, events=('start', 'end')):
+                    etiqueta = elemento.tag
+                    if evento == 'start':
+                        abiertos.append(elemento)
+                        alternativo += etiqueta == FALLBACK
+                        if etiqueta == W + 'p':
+                            textos.append([])
+                        continue
+                    abiertos.pop()
+                    if etiqueta == W + 'p':
+                        texto = textos.pop()
+                        if not alternativo:
+                            yield ''.join(texto)
+                    elif etiqueta == FALLBACK:
+                        alternativo -= 1
+                    elif alternativo or not textos:
+                        pass
+                    elif etiqueta == W + 't':
+                        textos[-1].append(elemento.text or '')
+                    elif etiqueta in TEXTO_DOCX:
+                        textos[-1].append(TEXTO_DOCX[etiqueta])
+                    if etiqueta in (W + 'p', W + 'tbl'):
+                        elemento.clear()
+                    # Hijos del cuerpo (w:body, w:hdr, cada nota): ya leídos, se desprenden de la raíz
+                    if 0 < len(abiertos) <= 2:
+                        abiertos[-1].remove(elemento)
+
+
+def metadatos_docx(path):
+    """Título, asunto y palabras clave de las propiedades del .docx (docProps/core.xml)."""
+    from xml.etree.ElementTree import fromstring
+
+    with zipfile.ZipFile(path) as zip_ref:
+        if 'docProps/core.xml' not in zip_ref.namelist():
+            return []
+        raiz = fromstring(zip_ref.read('docProps/core.xml'))
+    claves = ('{http://purl.org/dc/elements/1.1/}title', '{http://purl.org/dc/elements/1.1/}subject',
+              '{http://schemas.openxmlformats.org/package/2006/metadata/core-properties}keywords')
+    return [raiz.findtext(clave) or '' for clave in claves]
+
+
+def leer_bloques_docx(path, tamano=None):
+    """Texto de los párrafos de un .docx agrupado en bloques de tamaño acotado."""
+    tamano = tamano or tamano_bloque_texto()
+    partes, longitud = [], 0
+    for parrafo in parrafos_docx(path):
+        partes.append(parrafo)
+        longitud += len(parrafo) + 1
+        if longitud >= tamano:
+            yield ' '.join(partes) + ' '
+            partes, longitud = [], 0
+    if partes:
+        yield ' '.join(partes) + ' '
+
+
+def contar_palabras(bloques, contador, minhash=None, busqueda=None):
+    """
+    Tokeniza cada bloque (minúsculas, sin signos, sin números ni stop words) y
+    suma las palabras al contador. La memoria depende del bloque, no del archivo.
+    Si se pasa un MinHash, las mismas palabras se añaden a su firma; si se pasa una
+    búsqueda de términos (Palabras/terminos.py), recorre el bloque con stop words incluidas.
+    """
+    stop_words = spanish_stop_words()
+    for bloque in bloques:
+        bloque = PATRON_PUNTUACION.sub('', bloque.lower())
+        palabras = [word for word in bloque.split() if word not in stop_words and word.isalpha()]
+        contador.update(palabras)
+        if minhash is not None:
+            minhash.actualizar(palabras)
+        if busqueda is not None:
+            busqueda.actualizar(bloque)
+    return contador
+
+
+@medir(ETAPA_SEGUNDOS, etapa='conteo')
+def count_frequent_words(doc_paths, minhash=None, busqueda=None):
     # Inicializar contador global
     total_word_counts = Counter()
 
@@ -18,77 +183,153 @@ def count_frequent_words(doc_paths):
     for doc_path in doc_paths:
         # Verificar extensión del archivo
         if doc_path.lower().endswith('.docx'):
-            # Leer documento Word
-            doc = docx.Document(doc_path)
-
-            # Extraer texto del documento
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + " "
-
+            bloques = leer_bloques_docx(doc_path)
         elif doc_path.lower().endswith('.txt'):
-            # Leer archivo de texto
-            with open(doc_path, 'r', encoding='utf-8') as file:
-                text = file.read()
+            # Archivo de texto leído por bloques (puede pesar cientos de MB)
+            bloques = leer_bloques_texto(doc_path)
         else:
             raise ValueError(f"Formato de archivo no soportado para {doc_path}. Use .docx o .txt")
 
-        # Convertir a minúsculas y eliminar caracteres especiales (excepto letras)
-        text = text.lower()
-        text = re.sub(r'[^\w\s]', '', text)
+        # Actualizar el contador global con las palabras del documento actual
+        contar_palabras(bloques, total_word_counts, minhash, busqueda)
 
-        # Filtrar las palabras que contengan solo letras (eliminar números)
-        text = re.sub(r'\b\d+\b', '', text)
+    # Convertir a diccionario con las palabras más comunes
+    most_common_dict = dict(total_word_counts.most_common())
 
-        # Obtener lista de stop words en español
-        spanish_stop_words = set(stopwords.words('spanish'))
+    return most_common_dict
 
-        # Dividir el texto en palabras
-        words = text.split()
 
-        # Filtrar stop words y palabras vacías
-        meaningful_words = [word for word in words if word not in spanish_stop_words and word.isalpha()]
+def contar_y_firmar(doc_paths, automata=None):
+    """
+    Conteo de palabras, firma MinHash y, si se pasa el autómata de términos, conteo de
+    los términos ({id de Termino: cantidad}), todo en una sola lectura.
+    """
+    from .similitud import MinHash  # NumPy solo al contar
+    minhash = MinHash()
+    busqueda = automata.busqueda() if automata is not None else None
+    word_counts = count_frequent_words(doc_paths, minhash, busqueda)
+    return word_counts, minhash.firma(), dict(busqueda.conteos) if busqueda is not None else {}
 
-        # Actualizar el contador global con las palabras del documento actual
-        total_word_counts.update(meaningful_words)
 
-    # Convertir a diccionario con las palabras más comunes
-    most_common_dict = dict(total_word_counts.most_common())
+# Tamaño de los lotes de las consultas con IN (...) y de las inserciones masivas
+TAMANO_LOTE_BD = 500
 
-    return most_common_dict
 
+def en_lotes(elementos, tamano=TAMANO_LOTE_BD):
+    elementos = list(elementos)
+    for i in range(0, len(elementos), tamano):
+        yield elementos[i:i + tamano]
 
+
+def ids_palabras(descripciones):
+    """Diccionario descripción -> id, creando las palabras que no existen (por lotes)."""
+    ids = {}
+    for lote in en_lotes(descripciones):
+        ids.update(Palabras.objects.filter(descripcion__in=lote).values_list('descripcion', 'pk'))
+    nuevas = [descripcion for descripcion in descripciones if descripcion not in ids]
+    if nuevas:
+        Palabras.objects.bulk_create(
+            [Palabras(descripcion=descripcion) for descripcion in nuevas],
+            batch_size=TAMANO_LOTE_BD, ignore_conflicts=True,
+        )
+        for lote in en_lotes(nuevas):
+            ids.update(Palabras.objects.filter(descripcion__in=lote).values_list('descripcion', 'pk'))
+    return ids
+
+
+def sumar_conteos_anuales(anio, diferencias):
+    """
+    Suma a los totales del año las diferencias ({id de palabra: cantidad}, pueden ser
+    negativas) con UPDATE ... SET cantidad = cantidad + n: la suma la hace la base de
+    datos sobre la fila bloqueada, así que varios procesos pueden ingerir reportes del
+    mismo año a la vez sin perder actualizaciones. Las filas que quedan en 0 no se borran
+    (otro proceso podría estar sumándoles): quien lee los totales filtra cantidad > 0.
+    """
+    diferencias = {palabra_id: n for palabra_id, n in diferencias.items() if n}
+    # Las filas que faltan se crean en 0; si otro proceso la crea a la vez, se ignora el conflicto
+    ConteoAnual.objects.bulk_create(
+        [ConteoAnual(anio=anio, palabra_id=palabra_id, cantidad=0) for palabra_id in diferencias if diferencias[palabra_id] > 0],
+        batch_size=TAMANO_LOTE_BD, ignore_conflicts=True,
+    )
+    # Siempre en el mismo orden, para que dos procesos no se bloqueen mutuamente
+    for lote in en_lotes(sorted(diferencias)):
+        ConteoAnual.objects.filter(anio=anio, palabra_id__in=lote).update(cantidad=F('cantidad') + Case(
+            *[When(palabra_id=palabra_id, then=Value(diferencias[palabra_id])) for palabra_id in lote],
+            default=Value(0), output_field=IntegerField(),
+        ))
+
+
+@medir(ETAPA_SEGUNDOS, etapa='persistencia')
 def guardar_conteo_en_bd(reporte, word_counts):
     """
-    Guarda el conteo de palabras en la base de datos, acumulando
-    para palabras del mismo año (sin importar la empresa).
+    Guarda los conteos propios del reporte (reemplazando los que tuviera) y suma la
+    diferencia a los totales de su año (ConteoAnual) sin leerlos antes.
+    Las consultas se hacen por lotes, no por palabra.
     """
     with transaction.atomic():
-        for palabra, cantidad in word_counts.items():
-            palabra_obj, _ = Palabras.objects.get_or_create(descripcion=palabra)
-
-            # Buscar si ya existe conteo para esta palabra en este año
-            conteos_previos = ConteoTotal.objects.filter(
-                reporte__anio=reporte.anio,
-                palabra=palabra_obj
-            )
-
-            if conteos_previos.exists():
-                # Sumamos al primer conteo encontrado
-                conteo = conteos_previos.first()
-                conteo.cantidad += cantidad
-                conteo.save()
-            else:
-                # Si no existe, creamos uno nuevo vinculado al reporte actual
-                ConteoTotal.objects.create(
-                    reporte=reporte,
-                    palabra=palabra_obj,
-                    cantidad=cantidad
-                )
+        ids = ids_palabras(list(word_counts))
+        nuevos = {ids[palabra]: cantidad for palabra, cantidad in word_counts.items()}
+
+        # Un reporte que se vuelve a contar (p. ej. al reintentar desde la cuarentena)
+        anteriores = dict(ConteoTotal.objects.filter(reporte=reporte).values_list('palabra_id', 'cantidad'))
+        if anteriores:
+            ConteoTotal.objects.filter(reporte=reporte).delete()
+        ConteoTotal.objects.bulk_create(
+            [ConteoTotal(reporte=reporte, palabra_id=palabra_id, cantidad=cantidad) for palabra_id, cantidad in nuevos.items()],
+            batch_size=TAMANO_LOTE_BD,
+        )
+        sumar_conteos_anuales(reporte.anio, {
+            palabra_id: nuevos.get(palabra_id, 0) - anteriores.get(palabra_id, 0)
+            for palabra_id in nuevos.keys() | anteriores.keys()
+        })
+
+        Reporte.objects.filter(pk=reporte.pk).update(conteos_actualizados=timezone.now())
+        actualizar_resumen([reporte.pk])
+        invalidar_reportes([reporte.pk])
+        Ingesta.marcar()
+
+
+def descontar_conteos_anuales(reporte):
+    """Resta de los totales de su año los conteos de un reporte (antes de eliminarlo)."""
+    conteos = ConteoTotal.objects.filter(reporte=reporte).values_list('palabra_id', 'cantidad')
+    sumar_conteos_anuales(reporte.anio, {palabra_id: -cantidad for palabra_id, cantidad in conteos})
+
+
+def actualizar_resumen(reporte_ids):
+    """
+    Recalcula el resumen guardado en cada Reporte (top palabras, total y distintas)
+    y lo copia a sus duplicados. Se llama dentro de la transacción de los conteos.
+    Son unas pocas consultas por lote de reportes, no por reporte.
+    """
+    top = getattr(settings, 'CONTPAL_RESUMEN_TOP', 10)
+    for lote in en_lotes(reporte_ids):
+        conteos = ConteoTotal.objects.filter(reporte_id__in=lote)
+        totales = {
+            fila['reporte_id']: fila for fila in
+            conteos.order_by().values('reporte_id').annotate(total=Sum('cantidad'), distintas=Count('id'))
+        }
+        resumenes = {reporte_id: [] for reporte_id in lote}
+        posicion = Window(RowNumber(), partition_by=F('reporte_id'), order_by=[F('cantidad').desc(), F('pk').asc()])
+        primeras = (
+            conteos.annotate(posicion=posicion).filter(posicion__lte=top)
+            .order_by('reporte_id', 'posicion').values_list('reporte_id', 'palabra__descripcion', 'cantidad')
+        )
+        for reporte_id, palabra, cantidad in primeras:
+            resumenes[reporte_id].append([palabra, cantidad])
+
+        reportes = list(Reporte.objects.filter(Q(pk__in=lote) | Q(duplicado_de_id__in=lote)).only('pk', 'duplicado_de_id'))
+        for reporte in reportes:
+            origen = reporte.duplicado_de_id if reporte.duplicado_de_id in resumenes else reporte.pk
+            reporte.resumen_top = resumenes[origen]
+            reporte.total_palabras = totales.get(origen, {}).get('total') or 0
+            reporte.palabras_distintas = totales.get(origen, {}).get('distintas') or 0
+        Reporte.objects.bulk_update(reportes, ['resumen_top', 'total_palabras', 'palabras_distintas'],
+                                    batch_size=TAMANO_LOTE_BD)
 
 
 def insertar_provincias(archivo_excel):
     # Leer el archivo Excel
+    import pandas as pd
     df = pd.read_excel(archivo_excel)
 
     # Insertar las provincias en la base de datos
@@ -103,6 +344,7 @@ def insertar_provincias(archivo_excel):
 
 def insertar_empresas(archivo_excel):
     # Leer el archivo Excel
+    import pandas as pd
     df = pd.read_excel(archivo_excel)
 
     for _, row in df.iterrows():
@@ -126,10 +368,318 @@ def insertar_empresas(archivo_excel):
     print("Empresas importadas correctamente.")
 
 
+# Patrón de año usado para clasificar los reportes
+PATRON_ANIO = re.compile(r'\b(20\d{2}|19\d{2})\b')
+
+# Aproximaciones para leer "las primeras páginas" de formatos sin paginación
+PARRAFOS_POR_PAGINA = 40
+CARACTERES_POR_PAGINA = 3000
+
+
+def detectar_anio(texto):
+    """Devuelve el primer año encontrado en el texto, o 0 si no hay ninguno."""
+    match_anio = PATRON_ANIO.search(texto)
+    return int(match_anio.group()) if match_anio else 0
+
+
+def cargar_empresas_conocidas():
+    """Empresas candidatas para la detección (todas menos 'Desconocido')."""
+    return list(Empresa.objects.exclude(nombre__iexact='Desconocido'))
+
+
+def detectar_empresa(texto, empresas=None, umbral_similitud=0.8):
+    """
+    Busca en el texto el nombre de alguna empresa por similitud aproximada.
+    Devuelve la empresa encontrada o None.
+    """
+    if empresas is None:
+        empresas = cargar_empresas_conocidas()
+
+    palabras_texto = texto.lower().split()
+    for empresa in empresas:
+        nombre_empresa = empresa.nombre.lower()
+        for palabra in palabras_texto:
+            similitud = difflib.SequenceMatcher(None, nombre_empresa, palabra).ratio()
+            if similitud >= umbral_similitud:
+                return empresa
+
+        n = len(nombre_empresa.split())
+        for i in range(len(palabras_texto) - n + 1):
+            fragmento = " ".join(palabras_texto[i:i + n])
+            similitud = difflib.SequenceMatcher(None, nombre_empresa, fragmento).ratio()
+            if similitud >= umbral_similitud:
+                return empresa
+    return None
+
+
+# RUC ecuatoriano: 13 dígitos seguidos
+PATRON_RUC = re.compile(r'(?<!\d)\d{13}(?!\d)')
+# Prefijo de numeración de las carpetas del archivo, p. ej. "EMPRESA 258 PLASTICOS RIVAL CIA LTDA"
+PATRON_PREFIJO_CARPETA = re.compile(r'^(EMPRESA\s+)?\d+\s+')
+
+
+def normalizar_nombre(nombre):
+    """Mayúsculas, sin tildes ni puntuación y con los espacios colapsados ("Cía. Ltda." -> "CIA LTDA")."""
+    nombre = unicodedata.normalize('NFKD', nombre)
+    nombre = ''.join(c for c in nombre if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[^0-9A-Za-z]+', ' ', nombre).upper().split())
+
+
+class ResolutorEmpresas:
+    """
+    Resuelve la empresa de un documento por etapas, de la más barata a la más cara:
+
+    1. RUC que aparezca en el texto (búsqueda exacta por hash).
+    2. Nombre de la carpeta del ZIP (memorizado por carpeta, para que los archivos
+       hermanos se resuelvan sin leer nada más).
+    3. Similitud aproximada del texto con todos los nombres (detectar_empresa).
+
+    La empresa encontrada para un archivo por RUC o por carpeta se recuerda para su
+    carpeta con recordar(); una coincidencia aproximada no, porque podría ser falsa.
+    """
+    RECORDABLES = ('ruc', 'carpeta')
+
+    def __init__(self, empresas=None):
+        self.empresas = cargar_empresas_conocidas() if empresas is None else empresas
+        self.por_ruc = {empresa.ruc: empresa for empresa in self.empresas}
+        self.por_nombre = {normalizar_nombre(empresa.nombre): empresa for empresa in self.empresas}
+        self.carpetas = {}
+
+    def por_texto_ruc(self, texto):
+        for ruc in PATRON_RUC.findall(texto):
+            if ruc in self.por_ruc:
+                return self.por_ruc[ruc]
+        return None
+
+    def por_carpeta(self, carpeta):
+        """Empresa según el nombre de la carpeta (o de alguna carpeta superior), o None."""
+        if not carpeta:
+            return None
+        if carpeta not in self.carpetas:
+            self.carpetas[carpeta] = self._resolver_carpeta(carpeta)
+        return self.carpetas[carpeta]
+
+    def _resolver_carpeta(self, carpeta):
+        for parte in reversed(carpeta.replace('\\', '/').split('/')):
+            empresa = self.por_texto_ruc(parte)
+            if empresa:
+                return empresa
+            nombre = PATRON_PREFIJO_CARPETA.sub('', normalizar_nombre(parte))
+            if nombre in self.por_nombre:
+                return self.por_nombre[nombre]
+            parecidos = difflib.get_close_matches(nombre, self.por_nombre, n=1, cutoff=0.9)
+            if parecidos:
+                return self.por_nombre[parecidos[0]]
+        return None
+
+    def identificar(self, texto, carpeta=None):
+        """(empresa, origen) del documento: origen es 'ruc', 'carpeta' o 'similitud' (None si no hay empresa)."""
+        empresa = self.por_texto_ruc(texto)
+        if empresa:
+            return empresa, 'ruc'
+        empresa = self.por_carpeta(carpeta)
+        if empresa:
+            return empresa, 'carpeta'
+        empresa = detectar_empresa(texto, self.empresas)
+        return empresa, 'similitud' if empresa else None
+
+    def resolver(self, texto, carpeta=None):
+        """Empresa del documento (por RUC, carpeta o similitud, en ese orden), o None."""
+        return self.identificar(texto, carpeta)[0]
+
+    def recordar(self, carpeta, empresa, origen):
+        """Asigna a la carpeta la empresa hallada por RUC o carpeta en uno de sus archivos (si aún no tenía)."""
+        if carpeta and empresa and origen in self.RECORDABLES and not self.carpetas.get(carpeta):
+            self.carpetas[carpeta] = empresa
+
+
+def reconocer_paginas(imagenes, etapa):
+    """OCR de varias imágenes de página con el grupo de trabajadores (ver Palabras/ocr.py)."""
+    from .ocr import grupo_ocr
+
+    inicio = time.perf_counter()
+    resultado = grupo_ocr().reconocer(imagenes)
+    por_pagina = (time.perf_counter() - inicio) / max(len(imagenes), 1)
+    for _, confianza in resultado:
+        OCR_SEGUNDOS.observar(por_pagina)
+        OCR_CONFIANZA.observar(confianza)
+    PAGINAS_OCR.inc(len(imagenes), etapa=etapa)
+    return resultado
+
+
+def ocr_pagina(page):
+    """Aplica OCR a una página de PyMuPDF renderizándola en memoria."""
+    from .ocr import imagen_pagina
+
+    [(texto, _)] = reconocer_paginas([imagen_pagina(page)], 'deteccion')
+    return texto
+
+
+def extraer_texto_inicial(path, paginas=None, ocr=True):
+    """
+    Lee solo los metadatos y las primeras páginas de un documento (.pdf, .docx o .txt).
+    Las páginas del PDF se cargan una a una con PyMuPDF, sin recorrer el resto del archivo;
+    si una de ellas no tiene capa de texto y ocr=True, se le aplica OCR solo a esa página.
+    """
+    if paginas is None:
+        paginas = getattr(settings, 'CONTPAL_PAGINAS_METADATOS', 3)
+
+    partes = []
+    ruta = path.lower()
+    if ruta.endswith('.pdf'):
+        import fitz
+        with fitz.open(path) as pdf:
+            metadatos = pdf.metadata or {}
+            partes.extend(metadatos.get(clave) or '' for clave in ('title', 'subject', 'keywords'))
+            for page_num in range(min(paginas, pdf.page_count)):
+                page = pdf.load_page(page_num)
+                text = page.get_text().strip()
+                if not text and ocr:
+                    text = ocr_pagina(page)
+                partes.append(text)
+    elif ruta.endswith('.docx'):
+        # Solo se lee el XML hasta el último párrafo necesario
+        partes.extend(metadatos_docx(path))
+        partes.extend(islice(parrafos_docx(path), paginas * PARRAFOS_POR_PAGINA))
+    elif ruta.endswith('.txt'):
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            partes.append(f.read(paginas * CARACTERES_POR_PAGINA))
+    return '\n'.join(partes)
+
+
+def bloques_texto_completo(path, directorio_conversion):
+    """
+    Todo el texto del documento por bloques; los PDF pasan por pdf_to_docx (con OCR) y
+    el .docx queda en directorio_conversion (o se reutiliza si ya estaba).
+    """
+    if path.lower().endswith('.pdf'):
+        convertido = docx_convertido(path, directorio_conversion)
+        path = convertido if os.path.exists(convertido) else pdf_to_docx(path, directorio_conversion)
+
+    if path.lower().endswith('.docx'):
+        return leer_bloques_docx(path)
+    elif path.lower().endswith('.txt'):
+        return leer_bloques_texto(path, errors='ignore')
+    return []
+
+
+@medir(ETAPA_SEGUNDOS, etapa='deteccion')
+def detectar_metadatos(path, directorio_conversion, resolutor=None, carpeta=None, paginas=None):
+    """
+    Determina (anio, empresa, origen) leyendo primero los metadatos y las primeras
+    páginas; origen indica cómo se resolvió la empresa (ResolutorEmpresas.identificar).
+    Solo si falta alguno de los dos se recurre a la extracción completa del documento
+    (la conversión de un PDF queda en directorio_conversion, ver bloques_texto_completo).
+    """
+    if resolutor is None:
+        resolutor = ResolutorEmpresas()
+
+    texto = extraer_texto_inicial(path, paginas)
+    anio = detectar_anio(texto)
+    empresa, origen = resolutor.identificar(texto, carpeta)
+    if anio and empresa:
+        return anio, empresa, origen
+
+    # Recorrer el resto por bloques, arrastrando las últimas palabras de cada uno
+    # para no perder un nombre de empresa partido entre dos bloques
+    cola = ''
+    for bloque in bloques_texto_completo(path, directorio_conversion):
+        ventana = cola + ' ' + bloque
+        anio = anio or detectar_anio(ventana)
+        if not empresa:
+            empresa, origen = resolutor.identificar(ventana)
+        if anio and empresa:
+            break
+        cola = ' '.join(ventana[-2000:].split()[-20:])
+    return anio, empresa, origen
+
+
+def clasificar_zip(zip_file, paginas=None, ocr=False):
+    """
+    Clasifica los documentos de un ZIP usando solo metadatos y primeras páginas,
+    sin extracción completa (ni OCR, salvo que se pida con ocr=True). Devuelve una lista de diccionarios con
+    'archivo', 'anio' y 'empresa' (None si no se detectó).
+    """
+    resolutor = ResolutorEmpresas()
+    resultados = []
+    with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+        with TemporaryDirectory() as temp_dir:
+            for filename in zip_ref.namelist():
+                if not filename.endswith(('.pdf', '.docx', '.txt')):
+                    continue
+
+                temp_path = os.path.join(temp_dir, os.path.basename(filename))
+                with open(temp_path, 'wb') as f:
+                    f.write(zip_ref.read(filename))
+
+                try:
+                    texto = extraer_texto_inicial(temp_path, paginas, ocr=ocr)
+                except Exception as e:
+                    print(f"Error al leer {filename}: {e}")
+                    texto = ''
+
+                carpeta = os.path.dirname(filename)
+                empresa, origen = resolutor.identificar(texto, carpeta)
+                resolutor.recordar(carpeta, empresa, origen)
+                resultados.append({
+                    'archivo': filename,
+                    'anio': detectar_anio(texto),
+                    'empresa': empresa,
+                })
+    return resultados
+
+
+def registrar_reporte(filename, file_data, temp_dir, resolutor, empresa_desconocida):
+    """
+    Detecta año y empresa de un archivo (con presupuesto de tiempo y memoria) y crea
+    su Reporte. filename es la ruta dentro del ZIP: su carpeta se usa para resolver
+    la empresa. Lanza DocumentoFallido si la detección falla o excede el presupuesto.
+    """
+    carpeta = os.path.dirname(filename)
+    contenido = ContentFile(file_data)
+    digest = hash_contenido(contenido)
+    # Guardar temporalmente el archivo para procesarlo si es necesario. Con el hash como
+    # nombre, un PDF convertido durante la detección queda en directorio_docx() con el
+    # mismo nombre que usa el conteo (el del archivo guardado), que lo reutiliza
+    temp_path = os.path.join(temp_dir, digest + os.path.splitext(filename)[1].lower())
+    with open(temp_path, 'wb') as f:
+        f.write(file_data)
+    original = Reporte.objects.filter(hash_contenido=digest, duplicado_de__isnull=True).first()
+
+    if original:
+        # Contenido ya conocido: se reutilizan año y empresa sin volver a extraer
+        anio, empresa_asignada = original.anio, original.empresa
+    else:
+        # Detectar año y empresa (primeras páginas, y texto completo solo si hace falta).
+        # La detección corre en un proceso aparte, cuya memoria no vuelve a este: la carpeta
+        # se resuelve aquí antes (el hijo hereda el resultado) y la empresa se recuerda al volver
+        resolutor.por_carpeta(carpeta)
+        anio, empresa_asignada, origen = ejecutar_con_presupuesto(
+            Cuarentena.ETAPA_DETECCION, detectar_metadatos, temp_path, directorio_docx(), resolutor, carpeta
+        )
+        resolutor.recordar(carpeta, empresa_asignada, origen)
+
+    # Guardar reporte en la base de datos
+    reporte = Reporte(
+        nombre=os.path.basename(filename),
+        empresa=empresa_asignada or empresa_desconocida,
+        anio=anio,
+        hash_contenido=digest,
+        duplicado_de=original,
+    )
+    reporte.archivo.save(os.path.basename(filename), contenido)
+    return reporte
+
+
 def procesar_zip_reportes(zip_file):
     """
     Procesa un archivo ZIP que contiene .pdf, .docx o .txt, crea instancias de Reporte y las guarda.
+    Los archivos que fallan o exceden el presupuesto pasan a Cuarentena sin detener el resto.
     """
+    empresa_desconocida = Empresa.objects.filter(nombre__iexact='Desconocido').first()
+    resolutor = ResolutorEmpresas()
+    reportes_creados = []
+
     with zipfile.ZipFile(zip_file, 'r') as zip_ref:
         with TemporaryDirectory() as temp_dir:
             for filename in zip_ref.namelist():
@@ -137,90 +687,223 @@ def procesar_zip_reportes(zip_file):
                     continue
 
                 file_data = zip_ref.read(filename)
+                try:
+                    reporte = registrar_reporte(filename, file_data, temp_dir, resolutor, empresa_desconocida)
+                except DocumentoFallido as e:
+                    print(f"Error al procesar {filename}: {e}")
+                    poner_en_cuarentena(os.path.basename(filename), e, file_data=file_data)
+                    continue  # Saltar archivo: queda en cuarentena para reintentarlo
+                reportes_creados.append(reporte.pk)
 
-                # Guardar temporalmente el archivo para procesarlo si es necesario
-                temp_path = os.path.join(temp_dir, os.path.basename(filename))
-                with open(temp_path, 'wb') as f:
-                    f.write(file_data)
-
-                # Si es PDF, convertirlo a .docx
-                if filename.endswith('.pdf'):
-                    try:
-                        temp_path = pdf_to_docx(temp_path, temp_dir)
-                    except Exception as e:
-                        print(f"Error al convertir PDF {filename} a DOCX: {e}")
-                        continue  # Saltar archivo si falla la conversión
-
-                # Leer texto
-                texto = ''
-                if temp_path.endswith('.docx'):
-                    try:
-                        doc = Document(temp_path)
-                        texto = '\n'.join([p.text for p in doc.paragraphs])
-                    except Exception as e:
-                        print(f"Error al leer DOCX {filename}: {e}")
-                        continue
-                elif temp_path.endswith('.txt'):
-                    with open(temp_path, 'r', encoding='utf-8', errors='ignore') as f:
-                        texto = f.read()
-
-                # Detectar año
-                match_anio = re.search(r'\b(20\d{2}|19\d{2})\b', texto)
-                anio = int(match_anio.group()) if match_anio else 0
-
-                # Detectar empresa
-                empresa_asignada = Empresa.objects.filter(nombre__iexact='Desconocido').first()
-                umbral_similitud = 0.8
-                for empresa in Empresa.objects.exclude(nombre__iexact='Desconocido'):
-                    nombre_empresa = empresa.nombre.lower()
-                    texto_busqueda = texto.lower()
-                    for palabra in texto_busqueda.split():
-                        similitud = difflib.SequenceMatcher(None, nombre_empresa, palabra).ratio()
-                        if similitud >= umbral_similitud:
-                            empresa_asignada = empresa
-                            break
-                    else:
-                        for i in range(len(texto_busqueda.split()) - len(nombre_empresa.split()) + 1):
-                            fragmento = " ".join(texto_busqueda.split()[i:i + len(nombre_empresa.split())])
-                            similitud = difflib.SequenceMatcher(None, nombre_empresa, fragmento).ratio()
-                            if similitud >= umbral_similitud:
-                                empresa_asignada = empresa
-                                break
-                    if empresa_asignada and empresa_asignada.nombre != 'Desconocido':
-                        break
-
-                # Guardar reporte en la base de datos
-                reporte = Reporte(empresa=empresa_asignada, anio=anio)
-                reporte.archivo.save(os.path.basename(filename), ContentFile(file_data))
-                reporte.save()
+    if getattr(settings, 'CONTPAL_CACHE_CALENTAR', False):
+        calentar(reportes_creados)
+
+
+def directorio_docx():
+    """Directorio donde se guardan los .docx generados a partir de los PDF."""
+    directorio = str(getattr(settings, 'CONTPAL_DOCX_DIR', os.path.join(settings.MEDIA_ROOT, 'Docxs')))
+    os.makedirs(directorio, exist_ok=True)
+    return directorio
 
 
+def extraer_conteos(reporte):
+    """
+    Convierte (si es PDF) y cuenta las palabras del archivo de un reporte, cada etapa
+    con el presupuesto restante del documento. Devuelve (conteos, firma MinHash,
+    conteos de términos). Lanza DocumentoFallido si alguna etapa falla o excede el presupuesto.
+    """
+    plazo = Plazo()
+    # Se compila (o se toma de la caché) aquí: el proceso hijo lo hereda y no usa la BD
+    automata = automata_activo()
+    with ruta_local(reporte.archivo) as path:
+        if path.lower().endswith('.pdf'):
+            # Si la detección ya lo convirtió (mismo contenido, mismo nombre), se reutiliza
+            convertido = docx_convertido(path, directorio_docx())
+            path = convertido if os.path.exists(convertido) else ejecutar_con_presupuesto(
+                Cuarentena.ETAPA_CONVERSION, pdf_to_docx, path, directorio_docx(),
+                segundos=plazo.restante(Cuarentena.ETAPA_CONVERSION),
+            )
+        return ejecutar_con_presupuesto(
+            Cuarentena.ETAPA_CONTEO, contar_y_firmar, [path], automata,
+            segundos=plazo.restante(Cuarentena.ETAPA_CONTEO),
+        )
+
 
+def contar_reporte(reporte):
+    """
+    Cuenta las palabras de un reporte y guarda los conteos, salvo que sea casi
+    duplicado de un reporte ya contado de la misma empresa y año: entonces se marca
+    como su duplicado y se reutilizan los conteos de aquel. Un informe parecido de otra
+    empresa (p. ej. una opinión de auditoría estándar) se cuenta siempre.
+    Lanza DocumentoFallido si alguna etapa falla o excede el presupuesto.
+    """
+    from .similitud import buscar_similares, indexar_firma, umbral_casi_duplicado
+
+    word_counts, firma, terminos = extraer_conteos(reporte)
+
+    indexar_firma(reporte.pk, firma)
+    umbral = umbral_casi_duplicado()
+    if firma and umbral:
+        similares = buscar_similares(
+            firma, excluir=reporte.pk, limite=1, umbral=umbral,
+            anio=reporte.anio, empresa_id=reporte.empresa_id,
+            duplicado_de__isnull=True, conteos_actualizados__isnull=False,
+        )
+        if similares:
+            marcar_casi_duplicado(reporte, *similares[0])
+            DOCUMENTOS.inc(resultado='casi_duplicado')
+            return
+
+    # Guardar en base de datos
+    guardar_conteo_en_bd(reporte, word_counts)
+    guardar_conteos_terminos(reporte, terminos)
+    DOCUMENTOS.inc(resultado='contado')
+
+
+def marcar_casi_duplicado(reporte, original, similitud):
+    """Marca el reporte como duplicado de original y copia su resumen."""
+    reporte.duplicado_de = original
+    reporte.similitud_duplicado = similitud
+    reporte.resumen_top = original.resumen_top
+    reporte.total_palabras = original.total_palabras
+    reporte.palabras_distintas = original.palabras_distintas
+    reporte.save(update_fields=['duplicado_de', 'similitud_duplicado', 'resumen_top',
+                                'total_palabras', 'palabras_distintas'])
+
+
+def promover_duplicado(reporte):
+    """
+    Antes de eliminar un reporte original: uno de sus duplicados (primero los exactos)
+    pasa a ser el original de los demás. Un duplicado exacto recibe una copia de los
+    conteos, términos y firma (mismo contenido); uno casi duplicado se vuelve a contar
+    cuando se confirma la eliminación.
+    """
+    from .similitud import indexar_firma
+
+    duplicados = list(reporte.duplicados.order_by(F('similitud_duplicado').asc(nulls_first=True), 'pk'))
+    if not duplicados:
+        return None
+    nuevo = duplicados[0]
+    exacto = nuevo.similitud_duplicado is None
+    Reporte.objects.filter(pk__in=[d.pk for d in duplicados[1:]]).update(duplicado_de=nuevo)
+    Reporte.objects.filter(pk=nuevo.pk).update(duplicado_de=None, similitud_duplicado=None)
+    nuevo.duplicado_de = None
+    nuevo.similitud_duplicado = None
+
+    if exacto:
+        guardar_conteo_en_bd(nuevo, dict(
+            ConteoTotal.objects.filter(reporte=reporte).values_list('palabra__descripcion', 'cantidad')
+        ))
+        guardar_conteos_terminos(nuevo, dict(reporte.conteos_terminos.values_list('termino_id', 'cantidad')))
+        indexar_firma(nuevo.pk, reporte.firma_minhash)
+    else:
+        # Contar puede tardar (OCR): fuera de la transacción de la eliminación
+        transaction.on_commit(lambda: recontar_promovido(nuevo.pk))
+    invalidar_reportes([d.pk for d in duplicados])
+    return nuevo
+
+
+def recontar_promovido(reporte_id):
+    """Cuenta un casi duplicado promovido a original; si resulta casi duplicado de otro, sus duplicados lo siguen."""
+    reporte = Reporte.objects.filter(pk=reporte_id).first()
+    if reporte is None:
+        return
+    try:
+        contar_reporte(reporte)
+    except DocumentoFallido as e:
+        poner_en_cuarentena(reporte.nombre, e, reporte=reporte)
+        return
+    if reporte.duplicado_de_id:
+        Reporte.objects.filter(duplicado_de=reporte).update(duplicado_de=reporte.duplicado_de_id)
+        actualizar_resumen([reporte.duplicado_de_id])
+
+
+def poner_en_cuarentena(nombre, error, file_data=None, reporte=None, cuarentena=None):
+    """Registra (o actualiza, si se reintentaba) un documento que no se pudo procesar."""
+    if cuarentena is None:
+        cuarentena = Cuarentena(nombre=nombre, reporte=reporte, intentos=0)
+        if file_data is not None:
+            cuarentena.archivo.save(nombre, ContentFile(file_data), save=False)
+    cuarentena.etapa = error.etapa
+    cuarentena.motivo = error.motivo
+    cuarentena.intentos += 1
+    cuarentena.save()
+    FALLOS.inc(etapa=error.etapa)
+    return cuarentena
+
+
+def reintentar_cuarentena(cuarentena):
+    """
+    Vuelve a procesar un documento en cuarentena, de forma aislada.
+    Devuelve True si esta vez se procesó (y se elimina de la cuarentena).
+    """
+    try:
+        if cuarentena.reporte_id:
+            contar_reporte(cuarentena.reporte)
+        else:
+            with TemporaryDirectory() as temp_dir:
+                with cuarentena.archivo.open('rb') as f:
+                    file_data = f.read()
+                registrar_reporte(
+                    cuarentena.nombre, file_data, temp_dir, ResolutorEmpresas(),
+                    Empresa.objects.filter(nombre__iexact='Desconocido').first(),
+                )
+    except DocumentoFallido as e:
+        poner_en_cuarentena(cuarentena.nombre, e, cuarentena=cuarentena)
+        return False
+    cuarentena.delete()
+    return True
+
+
+def docx_convertido(pdf_path, output_dir):
+    """Ruta del .docx que pdf_to_docx genera para un PDF: su mismo nombre en output_dir."""
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(pdf_path))[0] + '.docx')
+
+
+@medir(ETAPA_SEGUNDOS, etapa='conversion')
 def pdf_to_docx(pdf_path, output_dir):
-    # Extraer el nombre del archivo sin la extensión .pdf
-    pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
-    
-    # Crear la ruta de salida del archivo .docx
-    output_docx_path = os.path.join(output_dir, f"{pdf_name}.docx")
+    import fitz
+    from docx import Document
+    from .ocr import grupo_ocr, imagen_pagina
+
+    # Ruta de salida del archivo .docx (mismo nombre que el PDF)
+    output_docx_path = docx_convertido(pdf_path, output_dir)
     
     doc = Document()
 
+    # Texto de cada página, en orden; las escaneadas se acumulan (como imágenes en memoria)
+    # y se reconocen juntas, un lote por trabajador de OCR
+    paginas = []
+    pendientes = []
+    grupo = grupo_ocr()
+
+    def reconocer_pendientes():
+        for (indice, _), (ocr_text, _) in zip(pendientes, reconocer_paginas([imagen for _, imagen in pendientes], 'conversion')):
+            paginas[indice][1] = ocr_text.strip()
+        pendientes.clear()
+
     with fitz.open(pdf_path) as pdf:
         for page_num, page in enumerate(pdf):
             text = page.get_text().strip()
             if text:
-                doc.add_paragraph(f"[Página {page_num + 1}]")
-                doc.add_paragraph(text)
+                paginas.append([f"[Página {page_num + 1}]", text])
             else:
-                with TemporaryDirectory() as tmpdir:
-                    images = convert_from_path(pdf_path, first_page=page_num+1, last_page=page_num+1, output_folder=tmpdir)
-                    for image in images:
-                        ocr_text = pytesseract.image_to_string(image, lang='spa')
-                        doc.add_paragraph(f"[Página {page_num + 1} - OCR]")
-                        doc.add_paragraph(ocr_text.strip())
-
-    # Guardar el archivo .docx generado
-    doc.save(output_docx_path)
+                paginas.append([f"[Página {page_num + 1} - OCR]", ''])
+                pendientes.append((len(paginas) - 1, imagen_pagina(page)))
+                if len(pendientes) >= grupo.trabajadores * grupo.lote:
+                    reconocer_pendientes()
+        if pendientes:
+            reconocer_pendientes()
+
+    for titulo, text in paginas:
+        doc.add_paragraph(titulo)
+        doc.add_paragraph(text)
+
+    # Guardar el archivo .docx generado; con un nombre temporal hasta terminar, para que
+    # una conversión interrumpida (presupuesto excedido) no se reutilice a medias
+    temporal = f"{output_docx_path}.{os.getpid()}.tmp"
+    doc.save(temporal)
+    os.replace(temporal, output_docx_path)
     return output_docx_path
 
 
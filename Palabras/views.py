@@ -1,3 +1,179 @@
-from django.shortcuts import render
+import base64
+import hashlib
+import hmac
+import json
+from functools import wraps
 
-# Create your views here.
+from django.conf import settings
+from django.db.models import Q, Sum
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition, require_GET
+
+from .models import ConteoAnual, ConteoTotal, Empresa, Ingesta, Provincia, Reporte
+
+LIMITE_POR_DEFECTO = 100
+LIMITE_MAXIMO = 1000
+
+
+def api_publica():
+    return getattr(settings, 'CONTPAL_API_PUBLICA', False)
+
+
+def token_valido(request):
+    """El encabezado Authorization: Bearer <token> lleva uno de CONTPAL_API_TOKENS."""
+    tipo, _, token = request.headers.get('Authorization', '').partition(' ')
+    if tipo.lower() != 'bearer' or not token:
+        return False
+    return any(hmac.compare_digest(token.encode(), valido.encode())
+               for valido in getattr(settings, 'CONTPAL_API_TOKENS', []))
+
+
+def autorizado(request):
+    """Personal del admin o token de la API."""
+    return request.user.is_staff or token_valido(request)
+
+
+def no_autorizado(request):
+    if request.user.is_authenticated:
+        return HttpResponseForbidden()
+    respuesta = HttpResponse("Se requiere un token de la API o iniciar sesión en el admin", status=401)
+    respuesta['WWW-Authenticate'] = 'Bearer'
+    return respuesta
+
+
+def requiere_autorizacion(vista):
+    """Los datos son del admin: solo personal o token, salvo que CONTPAL_API_PUBLICA lo permita."""
+    @wraps(vista)
+    def protegida(request, *args, **kwargs):
+        if not api_publica() and not autorizado(request):
+            return no_autorizado(request)
+        return vista(request, *args, **kwargs)
+    return protegida
+
+
+# Validadores HTTP: todas las respuestas cambian solo cuando cambia la última ingesta
+def ultima_ingesta(request, *args, **kwargs):
+    return Ingesta.ultima()
+
+
+def etag_ingesta(request, *args, **kwargs):
+    ultima = Ingesta.ultima()
+    if ultima is None:
+        return None
+    clave = f"{ultima.isoformat()}|{request.get_full_path()}"
+    return hashlib.sha1(clave.encode()).hexdigest()
+
+
+def codificar_cursor(datos):
+    return base64.urlsafe_b64encode(json.dumps(datos).encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(datos['c']), int(datos['p']), int(datos['n'])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Cursor inválido")
+
+
+def entero_positivo(valor, por_defecto):
+    if valor in (None, ''):
+        return por_defecto
+    valor = int(valor)
+    if valor < 1:
+        raise ValueError
+    return valor
+
+
+def ranking(request, conteos):
+    """
+    Ranking de palabras (cantidad descendente) paginado por cursor.
+    Parámetros GET: limite (tamaño de página), top (máximo total) y cursor.
+    """
+    try:
+        limite = min(entero_positivo(request.GET.get('limite'), LIMITE_POR_DEFECTO), LIMITE_MAXIMO)
+        top = entero_positivo(request.GET.get('top'), None)
+        cantidad, palabra_id, servidos = decodificar_cursor(request.GET['cursor']) \
+            if request.GET.get('cursor') else (None, None, 0)
+    except ValueError:
+        return HttpResponseBadRequest("Parámetros inválidos")
+
+    if top is not None:
+        limite = min(limite, top - servidos)
+
+    qs = (
+        conteos.order_by()
+        .values('palabra_id', 'palabra__descripcion')
+        .annotate(total=Sum('cantidad'))
+    )
+    if cantidad is not None:
+        # Paginación por clave (total, palabra_id): no usa OFFSET
+        qs = qs.filter(Q(total__lt=cantidad) | Q(total=cantidad, palabra_id__gt=palabra_id))
+    filas = list(qs.order_by('-total', 'palabra_id')[:limite + 1]) if limite > 0 else []
+
+    siguiente = None
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    if hay_mas and (top is None or servidos + limite < top):
+        ultima = filas[-1]
+        params = request.GET.copy()
+        params['cursor'] = codificar_cursor({
+            'c': ultima['total'], 'p': ultima['palabra_id'], 'n': servidos + len(filas),
+        })
+        siguiente = request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+
+    response = JsonResponse({
+        'resultados': [{'palabra': f['palabra__descripcion'], 'cantidad': f['total']} for f in filas],
+        'siguiente': siguiente,
+    })
+    # Solo una API pública se puede guardar en cachés compartidas (proxies)
+    max_age = getattr(settings, 'CONTPAL_API_MAX_AGE', 60)
+    if api_publica():
+        patch_cache_control(response, public=True, max_age=max_age)
+    else:
+        patch_cache_control(response, private=True, max_age=max_age)
+        patch_vary_headers(response, ['Authorization', 'Cookie'])
+    return response
+
+
+def api_ranking(vista):
+    return require_GET(requiere_autorizacion(
+        condition(etag_func=etag_ingesta, last_modified_func=ultima_ingesta)(vista)
+    ))
+
+
+@api_ranking
+def palabras_reporte(request, pk):
+    reporte = get_object_or_404(Reporte, pk=pk)
+    return ranking(request, ConteoTotal.objects.filter(reporte=reporte.reporte_conteos))
+
+
+@api_ranking
+def palabras_anio(request, anio):
+    # Totales ya acumulados por año: no hace falta sumar los conteos de cada reporte
+    return ranking(request, ConteoAnual.objects.filter(anio=anio, cantidad__gt=0))
+
+
+@api_ranking
+def palabras_empresa(request, pk):
+    empresa = get_object_or_404(Empresa, pk=pk)
+    return ranking(request, ConteoTotal.objects.filter(reporte__empresa=empresa))
+
+
+@api_ranking
+def palabras_provincia(request, pk):
+    provincia = get_object_or_404(Provincia, pk=pk)
+    return ranking(request, ConteoTotal.objects.filter(reporte__empresa__provincia=provincia))
+
+
+@require_GET
+def metricas(request):
+    """Métricas de este proceso en formato de texto de Prometheus (ver Palabras/metricas.py)."""
+    # Detrás de un proxy REMOTE_ADDR es el del proxy: para Prometheus mejor un token
+    permitidas = getattr(settings, 'CONTPAL_METRICAS_IPS', [])
+    if request.META.get('REMOTE_ADDR') not in permitidas and not autorizado(request):
+        return no_autorizado(request)
+    from .metricas import REGISTRO
+    return HttpResponse(REGISTRO.exposicion(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,197 @@
+# Palabras/vista_previa.py
+"""
+Vista previa de un ZIP antes de ingerirlo: año, empresa y palabras más frecuentes
+estimadas de cada documento leyendo solo una muestra de sus páginas.
+
+Las primeras páginas (las que usa la detección) se leen siempre; del resto se toma una
+muestra aleatoria de páginas (en .docx, grupos de PARRAFOS_POR_PAGINA párrafos; en .txt,
+tramos de CARACTERES_POR_PAGINA caracteres). El conteo de cada palabra se estima como
+muestreo por conglomerados: lo contado en las primeras páginas más el promedio por página
+de la muestra multiplicado por las páginas no leídas, con un intervalo de confianza del 95 %.
+Las páginas sin capa de texto se omiten de la muestra; solo si ninguna página
+muestreada tiene texto (documento escaneado) se les aplica OCR.
+"""
+import math
+import os
+import random
+import zipfile
+import zlib
+from collections import Counter
+from tempfile import TemporaryDirectory
+
+from django.conf import settings
+
+from .presupuesto import DocumentoFallido, ejecutar_con_presupuesto
+from .utils import (
+    CARACTERES_POR_PAGINA, PARRAFOS_POR_PAGINA, ResolutorEmpresas, contar_palabras, detectar_anio,
+    extraer_texto_inicial, parrafos_docx, reconocer_paginas,
+)
+
+Z_95 = 1.96
+
+
+def paginas_muestra():
+    return getattr(settings, 'CONTPAL_VISTA_PREVIA_PAGINAS', 12)
+
+
+def paginas_fijas():
+    return getattr(settings, 'CONTPAL_PAGINAS_METADATOS', 3)
+
+
+def elegir_paginas(total, semilla):
+    """(páginas fijas, páginas muestreadas del resto), en orden."""
+    fijas = list(range(min(paginas_fijas(), total)))
+    resto = range(len(fijas), total)
+    cantidad = max(paginas_muestra() - len(fijas), 0)
+    muestra = sorted(random.Random(semilla).sample(resto, min(cantidad, len(resto))))
+    return fijas, muestra
+
+
+def textos_pdf(path, semilla):
+    import fitz
+    from .ocr import imagen_pagina
+
+    with fitz.open(path) as pdf:
+        total = pdf.page_count
+        fijas, muestra = elegir_paginas(total, semilla)
+        textos = {n: pdf.load_page(n).get_text().strip() for n in fijas + muestra}
+        ocr = not any(textos.values())
+        if ocr:
+            numeros = fijas + muestra
+            imagenes = [imagen_pagina(pdf.load_page(n)) for n in numeros]
+            for n, (texto, _) in zip(numeros, reconocer_paginas(imagenes, 'vista_previa')):
+                textos[n] = texto.strip()
+    # Páginas sin texto (escaneadas en un PDF mixto): fuera de la muestra y de las páginas a
+    # extrapolar. Las del resto que no se leyeron se estiman en la proporción de la muestra
+    con_texto = [textos[n] for n in muestra if textos[n]]
+    resto = (total - len(fijas)) * len(con_texto) / len(muestra) if muestra else total - len(fijas)
+    fijas = [textos[n] for n in fijas if textos[n]]
+    return len(fijas) + resto, resto, fijas, con_texto, ocr
+
+
+def textos_docx(path, semilla):
+    parrafos = list(parrafos_docx(path))
+    total = math.ceil(len(parrafos) / PARRAFOS_POR_PAGINA)
+    fijas, muestra = elegir_paginas(total, semilla)
+    pagina = lambda n: '\n'.join(parrafos[n * PARRAFOS_POR_PAGINA:(n + 1) * PARRAFOS_POR_PAGINA])
+    return total, total - len(fijas), [pagina(n) for n in fijas], [pagina(n) for n in muestra], False
+
+
+def textos_txt(path, semilla):
+    total = math.ceil(os.path.getsize(path) / CARACTERES_POR_PAGINA)
+    fijas, muestra = elegir_paginas(total, semilla)
+
+    def pagina(f, n):
+        # Tramo de bytes: se descartan las palabras cortadas en los bordes
+        f.seek(max(n * CARACTERES_POR_PAGINA - 1, 0))
+        anterior = f.read(1) if n else b' '
+        datos = f.read(CARACTERES_POR_PAGINA)
+        siguiente = f.read(1)
+        palabras = datos.decode('utf-8', errors='ignore').split()
+        if palabras and not datos[:1].isspace() and not anterior.isspace():
+            palabras = palabras[1:]
+        if palabras and siguiente and not siguiente.isspace() and not datos[-1:].isspace():
+            palabras = palabras[:-1]
+        return ' '.join(palabras)
+
+    with open(path, 'rb') as f:
+        return total, total - len(fijas), [pagina(f, n) for n in fijas], [pagina(f, n) for n in muestra], False
+
+
+# Cada lector devuelve (páginas con texto, páginas a extrapolar fuera de las fijas,
+# textos de las páginas fijas, textos de la muestra, si se usó OCR)
+LECTORES = {'.pdf': textos_pdf, '.docx': textos_docx, '.txt': textos_txt}
+
+
+def estimar_conteos(fijas, muestra, paginas_resto, top):
+    """
+    Estimación de los conteos del documento a partir de los contadores por página:
+    [{'palabra', 'estimado', 'minimo', 'maximo'}] de las top palabras. Con una sola
+    página muestreada no hay varianza que estimar y 'maximo' es None.
+    """
+    fijo = sum(fijas, Counter())
+    n = len(muestra)
+    suma = sum(muestra, Counter())
+    factor = paginas_resto / n if n else 0
+    estimados = {palabra: fijo[palabra] + suma[palabra] * factor for palabra in fijo.keys() | suma.keys()}
+
+    resultado = []
+    for palabra, estimado in sorted(estimados.items(), key=lambda par: (-par[1], par[0]))[:top]:
+        observado = fijo[palabra] + suma[palabra]
+        if n >= paginas_resto:
+            minimo = maximo = observado  # Se leyó todo
+        elif n < 2:
+            minimo, maximo = observado, None
+        else:
+            media = suma[palabra] / n
+            varianza = sum((c[palabra] - media) ** 2 for c in muestra) / (n - 1)
+            error = Z_95 * paginas_resto * math.sqrt((1 - n / paginas_resto) * varianza / n)
+            minimo, maximo = max(observado, round(estimado - error)), round(estimado + error)
+        resultado.append({'palabra': palabra, 'estimado': round(estimado), 'minimo': minimo, 'maximo': maximo})
+    return resultado
+
+
+def muestrear_documento(path, semilla=0, top=10):
+    """
+    Lee la muestra de páginas de un documento y estima sus conteos (sin usar la BD, para
+    poder ejecutarse con presupuesto). Devuelve un diccionario con el texto de las primeras
+    páginas (para la detección), el texto muestreado, páginas, tamaño de la muestra y palabras.
+    """
+    lector = LECTORES[os.path.splitext(path)[1].lower()]
+    total, resto, fijas, muestra, ocr = lector(path, semilla)
+    contar = lambda texto: contar_palabras([texto], Counter())
+    return {
+        'texto': '' if ocr else extraer_texto_inicial(path, ocr=False),
+        'texto_muestra': '\n'.join(fijas + muestra),
+        'paginas': round(total),
+        'muestra': len(fijas) + len(muestra),
+        'ocr': ocr,
+        'palabras': estimar_conteos(
+            [contar(t) for t in fijas], [contar(t) for t in muestra], resto, top,
+        ),
+    }
+
+
+def previsualizar_zip(zip_file, top=10):
+    """
+    Vista previa de cada documento de un ZIP (mismos archivos que procesar_zip_reportes):
+    lista de diccionarios con 'archivo', 'anio', 'empresa', 'paginas', 'muestra', 'ocr',
+    'palabras' (ver estimar_conteos) y 'error'. No crea reportes ni guarda nada.
+    """
+    segundos = getattr(settings, 'CONTPAL_VISTA_PREVIA_SEGUNDOS', 30)
+    resolutor = ResolutorEmpresas()
+    resultados = []
+    with zipfile.ZipFile(zip_file, 'r') as zip_ref, TemporaryDirectory() as temp_dir:
+        for filename in zip_ref.namelist():
+            if not filename.endswith(('.pdf', '.docx', '.txt')):
+                continue
+            temp_path = os.path.join(temp_dir, os.path.basename(filename))
+            with open(temp_path, 'wb') as f:
+                f.write(zip_ref.read(filename))
+
+            resultado = {'archivo': filename, 'anio': None, 'empresa': None, 'paginas': None,
+                         'muestra': 0, 'ocr': False, 'palabras': [], 'error': None}
+            try:
+                muestra = ejecutar_con_presupuesto(
+                    'vista_previa', muestrear_documento, temp_path, zlib.crc32(filename.encode()), top,
+                    segundos=segundos,
+                )
+            except DocumentoFallido as e:
+                resultado['error'] = e.motivo
+                resultados.append(resultado)
+                continue
+            finally:
+                os.remove(temp_path)
+
+            # Detección como en la ingesta; si falta algo, también en el texto muestreado
+            carpeta = os.path.dirname(filename)
+            texto = muestra.pop('texto') or muestra['texto_muestra']
+            anio = detectar_anio(texto) or detectar_anio(muestra['texto_muestra'])
+            empresa, origen = resolutor.identificar(texto, carpeta)
+            if not empresa:
+                empresa, origen = resolutor.identificar(muestra['texto_muestra'])
+            resolutor.recordar(carpeta, empresa, origen)
+            del muestra['texto_muestra']
+            resultado.update(muestra, anio=anio, empresa=empresa)
+            resultados.append(resultado)
+    return resultados